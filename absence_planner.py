@@ -0,0 +1,255 @@
+# absence_planner.py
+from collections import deque
+
+from models import ScheduleEntry
+from pairs import get_pair_number_by_lesson
+import occupancy
+import reference_cache
+import schedule_payloads
+import schedule_versions
+import substitutes
+
+
+class MinCostFlow:
+    """Поток минимальной стоимости (последовательные кратчайшие пути, SPFA).
+
+    Графы здесь маленькие (десятки занятий и преподавателей), поэтому
+    простой реализации достаточно.
+    """
+
+    def __init__(self):
+        self.graph = []
+
+    def add_node(self):
+        self.graph.append([])
+        return len(self.graph) - 1
+
+    def add_edge(self, u, v, capacity, cost):
+        # Ребро: [куда, остаточная емкость, стоимость, индекс обратного ребра, прямое ли]
+        self.graph[u].append([v, capacity, cost, len(self.graph[v]), True])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1, False])
+
+    def run(self, source, sink):
+        flow = cost = 0
+        n = len(self.graph)
+        while True:
+            dist = [None] * n
+            in_queue = [False] * n
+            previous = [None] * n
+            dist[source] = 0
+            queue = deque([source])
+            while queue:
+                u = queue.popleft()
+                in_queue[u] = False
+                for i, (v, capacity, edge_cost, _, _) in enumerate(self.graph[u]):
+                    if capacity > 0 and (dist[v] is None or dist[u] + edge_cost < dist[v]):
+                        dist[v] = dist[u] + edge_cost
+                        previous[v] = (u, i)
+                        if not in_queue[v]:
+                            in_queue[v] = True
+                            queue.append(v)
+
+            if dist[sink] is None:
+                return flow, cost
+
+            v = sink
+            while v != source:
+                u, i = previous[v]
+                edge = self.graph[u][i]
+                edge[1] -= 1
+                self.graph[v][edge[3]][1] += 1
+                v = u
+            flow += 1
+            cost += dist[sink]
+
+    def flows(self, u):
+        """(узел, поток) по исходящим ребрам u с ненулевым потоком"""
+        for v, capacity, cost, back, forward in self.graph[u]:
+            if forward and self.graph[v][back][1] > 0:
+                yield v, self.graph[v][back][1]
+
+
+def affected_entries(teacher_id, semester, week_from, week_to):
+    """Занятия преподавателя за диапазон недель одним запросом по индексу"""
+    entries = ScheduleEntry.query.filter(
+        ScheduleEntry.teacher_id == teacher_id,
+        ScheduleEntry.semester == semester,
+        ScheduleEntry.week_number.between(week_from, week_to)
+    ).all()
+    entries.sort(key=lambda e: (e.week_number, schedule_payloads.DAY_INDEX.get(e.day, 0), e.lesson_number))
+    return entries
+
+
+def _describe(entry, names):
+    return {
+        'entry_id': entry.id,
+        'week': entry.week_number,
+        'day': entry.day,
+        'lesson_number': entry.lesson_number,
+        'group': names['groups'].get(entry.group_id),
+        'subject': names['subjects'].get(entry.subject_id),
+        'room': names['rooms'].get(entry.room_id)
+    }
+
+
+def _order(item):
+    return item['week'], schedule_payloads.DAY_INDEX.get(item['day'], 0), item['lesson_number']
+
+
+def pair_units(entries):
+    """Занятия, сгруппированные в пары: уроки одной пары у той же группы
+    и с тем же предметом заменяет один преподаватель"""
+    units = {}
+    for entry in entries:
+        key = (
+            entry.week_number, entry.day, get_pair_number_by_lesson(entry.day, entry.lesson_number),
+            entry.group_id, entry.subject_id
+        )
+        units.setdefault(key, []).append(entry)
+    return list(units.values())
+
+
+def plan(teacher_id, semester, week_from, week_to):
+    """Предварительный план замен на время отсутствия преподавателя.
+
+    Единица замены — пара (один или два урока группы по предмету):
+    кандидат должен быть свободен на всех ее уроках. Пары распределяются
+    между свободными преподавателями, которые могут вести предмет, как
+    паросочетание минимальной стоимости: k-я дополнительная пара
+    преподавателя за неделю стоит (нагрузка + k), поэтому замены
+    расходятся по наименее загруженным.
+    """
+    entries = affected_entries(teacher_id, semester, week_from, week_to)
+    weeks = {
+        week: occupancy.get_week(semester, week)
+        for week in {entry.week_number for entry in entries}
+    }
+    units = pair_units(entries)
+
+    network = MinCostFlow()
+    source, sink = network.add_node(), network.add_node()
+
+    unit_nodes = []
+    slot_nodes = {}     # (teacher, week, day, pair) -> узел: один преподаватель — одна пара в слоте
+    week_nodes = {}     # (teacher, week) -> узел
+    slot_owner = {}
+    per_week = {}       # (teacher, week) -> сколько пар может взять
+
+    for unit in units:
+        first = unit[0]
+        node = network.add_node()
+        unit_nodes.append(node)
+        network.add_edge(source, node, 1, 0)
+
+        candidates = substitutes.free_qualified(
+            first.subject_id, weeks[first.week_number], first.day,
+            [entry.lesson_number for entry in unit], (teacher_id,)
+        )
+        pair = get_pair_number_by_lesson(first.day, first.lesson_number)
+        for candidate in occupancy.bits(candidates):
+            slot_key = (candidate, first.week_number, first.day, pair)
+            slot = slot_nodes.get(slot_key)
+            if slot is None:
+                slot = slot_nodes[slot_key] = network.add_node()
+                slot_owner[slot] = candidate
+                week_key = (candidate, first.week_number)
+                if week_key not in week_nodes:
+                    week_nodes[week_key] = network.add_node()
+                network.add_edge(slot, week_nodes[week_key], 1, 0)
+                per_week[week_key] = per_week.get(week_key, 0) + 1
+            network.add_edge(node, slot, 1, 0)
+
+    for (candidate, week), node in week_nodes.items():
+        load = weeks[week].load(candidate)
+        for k in range(per_week[(candidate, week)]):
+            network.add_edge(node, sink, 1, load + k)
+
+    network.run(source, sink)
+
+    names = reference_cache.get_reference_data().names
+    added = {}
+    assignments = []
+    unassigned = []
+    for unit, node in zip(units, unit_nodes):
+        chosen = None
+        for slot, flow in network.flows(node):
+            chosen = slot_owner[slot]
+        for entry in unit:
+            item = _describe(entry, names)
+            if chosen is None:
+                unassigned.append(item)
+                continue
+
+            week_key = (chosen, entry.week_number)
+            added[week_key] = added.get(week_key, 0) + 1
+            item.update({
+                'teacher_id': chosen,
+                'teacher': names['teachers'].get(chosen),
+                'weekly_load': weeks[entry.week_number].load(chosen) + added[week_key]
+            })
+            assignments.append(item)
+    assignments.sort(key=_order)
+    unassigned.sort(key=_order)
+
+    return {
+        'teacher_id': teacher_id,
+        'teacher': names['teachers'].get(teacher_id),
+        'semester': semester,
+        'week_from': week_from,
+        'week_to': week_to,
+        'total': len(entries),
+        'assignments': assignments,
+        'unassigned': unassigned
+    }
+
+
+def apply(teacher_id, semester, assignments):
+    """Записать замены в текущей транзакции (commit — за вызывающим кодом).
+
+    Каждая замена перепроверяется: занятие все еще у отсутствующего
+    преподавателя, замена ведет этот предмет и свободна. При любой ошибке
+    ничего не меняется и возвращается список ошибок.
+    """
+    wanted = {}
+    errors = []
+    for index, item in enumerate(assignments):
+        try:
+            wanted[int(item['entry_id'])] = int(item['teacher_id'])
+        except (KeyError, TypeError, ValueError):
+            errors.append({'index': index, 'message': 'Нужны entry_id и teacher_id'})
+    if errors:
+        return errors
+
+    entries = {
+        entry.id: entry
+        for entry in ScheduleEntry.query.filter(ScheduleEntry.id.in_(list(wanted))).all()
+    }
+    names = reference_cache.get_reference_data().names['teachers']
+    taken = set()
+
+    for entry_id, substitute_id in wanted.items():
+        entry = entries.get(entry_id)
+        if entry is None or entry.teacher_id != teacher_id or entry.semester != semester:
+            errors.append({'entry_id': entry_id, 'message': 'Занятие не найдено или уже заменено'})
+            continue
+        if substitute_id not in names or substitute_id == teacher_id:
+            errors.append({'entry_id': entry_id, 'message': 'Преподаватель не найден'})
+            continue
+
+        week_occupancy = occupancy.get_week(semester, entry.week_number)
+        slot = (substitute_id, entry.week_number, entry.day, entry.lesson_number)
+        free = substitutes.free_qualified(entry.subject_id, week_occupancy, entry.day, [entry.lesson_number])
+        if not free >> substitute_id & 1 or slot in taken:
+            errors.append({'entry_id': entry_id, 'message': f'{names[substitute_id]} не может провести это занятие'})
+            continue
+        taken.add(slot)
+
+    if errors:
+        return errors
+
+    for entry_id, substitute_id in wanted.items():
+        entry = entries[entry_id]
+        entry.teacher_id = substitute_id
+        entry.is_changed = True
+        schedule_versions.bump_entry(entry)
+    return []
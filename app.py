@@ -6,13 +6,38 @@ import random
 from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, render_template, jsonify, request, session, send_from_directory
+from flask import Flask, Response, render_template, jsonify, request, session, send_from_directory, send_file
 from config import Config
-from models import db, User, Teacher, Subject, Group, Room, TeacherSubject, AppSettings, GroupSubject, ScheduleEntry, MainScheduleEntry, AutoFillLog, GroupPractice
+from models import db, User, Teacher, Subject, Group, Room, TeacherSubject, AppSettings, GroupSubject, ScheduleEntry, MainScheduleEntry, AutoFillLog, GroupPractice, ScheduleStat
 from auth import init_auth, login_manager
+import settings_service
+import reference_cache
+from http_cache import content_etag, bytes_response
+from pairs import get_pair_number_by_lesson, get_available_pairs_for_day, get_lessons_in_pair, get_pair_name, get_pair_time, get_lesson_pair_time
+import schedule_payloads
+import schedule_versions
+import response_cache
+import schedule_stream
+import change_journal
+import schedule_batch
+import timetables
+import occupancy
+import substitutes
+import absence_planner
+import schedule_export
+import curriculum_import
+import main_schedule_import
+import ical_feeds
+import static_publish
+import history_archive
+import schedule_stats
+import semester_progress
+import teacher_workload
+import room_utilization
 from flask_login import login_required, current_user, login_user, logout_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
+import click
 
 
 def create_app():
@@ -22,12 +47,64 @@ def create_app():
     
     db.init_app(app)
     init_auth(app)
+    response_cache.init_response_cache(app)
+    timetables.init_timetables(app)
+    change_journal.init_change_journal(app)
+    ical_feeds.init_ical_feeds(app)
+    static_publish.init_static_publish(app)
+    semester_progress.init_semester_progress(app)
+    teacher_workload.init_teacher_workload(app)
+    room_utilization.init_room_utilization(app)
     
     with app.app_context():
         db.create_all()
         create_admin_user()
         populate_initial_data()
     
+    def compact_journal():
+        return change_journal.compact(
+            app.config.get('JOURNAL_MAX_ROWS', 50000),
+            app.config.get('JOURNAL_RETENTION_DAYS', 14)
+        )
+    
+    @app.cli.command('compact-journal')
+    def compact_journal_command():
+        """Удалить старые записи журнала изменений расписания"""
+        deleted = compact_journal()
+        db.session.commit()
+        print(f'Удалено записей журнала: {deleted}')
+    
+    @app.cli.command('publish-static')
+    @click.option('--full', is_flag=True, help='Перерисовать все файлы')
+    def publish_static_command(full):
+        """Опубликовать статический снимок расписания текущей недели"""
+        state = static_publish.publish(full=full)
+        print(f'Опубликована версия {state["version"]} (семестр {state["semester"]}, неделя {state["week"]})')
+    
+    @app.cli.command('export-archive')
+    @click.option('--format', 'file_format', type=click.Choice(sorted(history_archive.FORMATS)), default=None)
+    @click.option('--full', is_flag=True, help='Выгрузить все недели заново')
+    def export_archive_command(file_format, full):
+        """Дописать в колоночный архив недели, изменившиеся с прошлой выгрузки"""
+        try:
+            report = history_archive.export_archive(
+                app.config.get('ARCHIVE_DIR'),
+                file_format or app.config.get('ARCHIVE_FORMAT', 'parquet'),
+                full
+            )
+        except history_archive.ArchiveError as e:
+            raise click.ClickException(str(e))
+        rows = sum(week['rows'] for week in report['weeks'])
+        print(f'Недель выгружено: {len(report["weeks"])} (занятий: {rows}), '
+              f'основное расписание: {len(report["main"])}, справочники: {"да" if report["dimensions"] else "нет"}')
+    
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        """Пересчитать сводку статистики расписания по всем записям"""
+        rows = schedule_stats.rebuild()
+        db.session.commit()
+        print(f'Строк сводки: {rows}')
+    
     # ========== ОБРАБОТЧИКИ ОШИБОК ==========
     
     @app.errorhandler(500)
@@ -108,6 +185,13 @@ def create_app():
             return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
         return send_from_directory('pages', 'teacher_load.html')
     
+    @app.route('/room_utilization')
+    @login_required
+    def room_utilization_page():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+        return send_from_directory('pages', 'room_utilization.html')
+    
     # ========== API РОУТЫ ==========
     
     @app.route('/api/login', methods=['POST'])
@@ -131,34 +215,29 @@ def create_app():
     
     @app.route('/api/user_info')
     def api_user_info():
-        if current_user.is_authenticated:
-            return jsonify({
-                'authenticated': True,
-                'username': current_user.username,
-                'role': current_user.role
-            })
-        return jsonify({'authenticated': False})
+        return jsonify(get_user_info())
+    
+    # Стартовые данные страницы одним запросом
+    @app.route('/api/bootstrap')
+    def api_bootstrap():
+        return reference_cache.bootstrap_response(get_user_info())
     
     # Основные данные
     @app.route('/api/data/groups')
     def api_get_groups():
-        groups = Group.query.order_by(Group.course, Group.name).all()
-        return jsonify([{'id': g.id, 'name': g.name, 'course': g.course} for g in groups])
+        return reference_cache.reference_response('groups')
     
     @app.route('/api/data/teachers')
     def api_get_teachers():
-        teachers = Teacher.query.order_by(Teacher.name).all()
-        return jsonify([{'id': t.id, 'name': t.name} for t in teachers])
+        return reference_cache.reference_response('teachers')
     
     @app.route('/api/data/subjects')
     def api_get_subjects():
-        subjects = Subject.query.order_by(Subject.name).all()
-        return jsonify([{'id': s.id, 'name': s.name} for s in subjects])
+        return reference_cache.reference_response('subjects')
     
     @app.route('/api/data/rooms')
     def api_get_rooms():
-        rooms = Room.query.order_by(Room.name).all()
-        return jsonify([{'id': r.id, 'name': r.name} for r in rooms])
+        return reference_cache.reference_response('rooms')
     
     # Добавление группы
     @app.route('/api/data/groups', methods=['POST'])
@@ -181,6 +260,7 @@ def create_app():
             
             group = Group(name=name, course=course)
             db.session.add(group)
+            reference_cache.bump_version()
             db.session.commit()
             
             return jsonify({'success': True, 'message': 'Группа добавлена', 'id': group.id})
@@ -206,6 +286,8 @@ def create_app():
                 GroupPractice.query.filter_by(group_id=group.id).delete()
                 
                 db.session.delete(group)
+                reference_cache.bump_version()
+                schedule_versions.bump_all()
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Группа удалена'})
             return jsonify({'success': False, 'message': 'Группа не найдена'})
@@ -216,12 +298,9 @@ def create_app():
     # Настройки
     @app.route('/api/settings/current')
     def api_get_current_settings():
-        week = AppSettings.query.filter_by(key='current_week').first()
-        semester = AppSettings.query.filter_by(key='current_semester').first()
-        
         return jsonify({
-            'week': int(week.value) if week else 1,
-            'semester': int(semester.value) if semester else 1
+            'week': get_current_week(),
+            'semester': get_current_semester()
         })
     
     @app.route('/api/settings/set_week', methods=['POST'])
@@ -233,14 +312,9 @@ def create_app():
         data = request.get_json()
         week = int(data.get('week', 1))
         
-        setting = AppSettings.query.filter_by(key='current_week').first()
-        if setting:
-            setting.value = str(week)
-        else:
-            setting = AppSettings(key='current_week', value=str(week))
-            db.session.add(setting)
-        
+        settings_service.set_setting('current_week', week)
         db.session.commit()
+        static_publish.request_publish(0)
         return jsonify({'success': True, 'message': f'Установлена неделя {week}'})
     
     @app.route('/api/settings/set_semester', methods=['POST'])
@@ -252,16 +326,70 @@ def create_app():
         data = request.get_json()
         semester = int(data.get('semester', 1))
         
-        setting = AppSettings.query.filter_by(key='current_semester').first()
-        if setting:
-            setting.value = str(semester)
-        else:
-            setting = AppSettings(key='current_semester', value=str(semester))
-            db.session.add(setting)
-        
+        settings_service.set_setting('current_semester', semester)
         db.session.commit()
+        static_publish.request_publish(0)
         return jsonify({'success': True, 'message': f'Установлен семестр {semester}'})
     
+    # Дата начала семестра: по ней номера недель переводятся в даты календаря
+    @app.route('/api/settings/set_semester_start', methods=['POST'])
+    @login_required
+    def api_set_semester_start():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        data = request.get_json() or {}
+        semester = int(data.get('semester', get_current_semester()))
+        try:
+            start = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Ожидается дата в формате ГГГГ-ММ-ДД'}), 400
+        
+        settings_service.set_setting(f'semester{semester}_start', start.isoformat())
+        db.session.commit()
+        return jsonify({'success': True, 'message': f'Семестр {semester} начинается {start.strftime("%d.%m.%Y")}'})
+    
+    def parse_schedule_filters():
+        """Фильтры group_id / teacher_id / room_id, набор дней и страница.
+        
+        Возвращает None для запроса в старом формате (один день без фильтров).
+        Дни: days=Пн,Вт... (days=all — вся неделя), либо day_from/day_to,
+        либо day; если ничего не указано, берется вся неделя. Страница:
+        cursor и limit, курсор следующей страницы приходит в заголовке
+        X-Next-Cursor.
+        """
+        args = request.args
+        
+        filters = {}
+        for name in ('group_id', 'teacher_id', 'room_id'):
+            if args.get(name):
+                try:
+                    filters[name] = int(args[name])
+                except ValueError:
+                    raise ValueError(f'Некорректный {name}')
+        
+        paginated = 'cursor' in args or 'limit' in args
+        if not filters and not paginated and not any(name in args for name in ('days', 'day_from', 'day_to')):
+            return None
+        
+        if 'days' in args:
+            days = schedule_payloads.parse_days(args['days'])
+        elif 'day_from' in args or 'day_to' in args:
+            days = schedule_payloads.day_range(args.get('day_from'), args.get('day_to'))
+        elif 'day' in args:
+            days = schedule_payloads.parse_days(args['day'])
+        else:
+            days = schedule_payloads.parse_days(None)
+        
+        after = schedule_payloads.parse_cursor(args['cursor']) if args.get('cursor') else None
+        
+        limit = None
+        if paginated:
+            limit = args.get('limit', type=int, default=app.config.get('SCHEDULE_PAGE_SIZE', 200))
+            limit = max(1, min(limit, app.config.get('SCHEDULE_MAX_PAGE_SIZE', 1000)))
+        
+        return days, filters, after, limit
+    
     # Текущее расписание
     @app.route('/api/schedule/current')
     def api_get_current_schedule():
@@ -269,29 +397,15 @@ def create_app():
         semester = request.args.get('semester', type=int, default=1)
         day = request.args.get('day', 'Понедельник')
         
-        entries = ScheduleEntry.query.filter_by(
-            day=day,
-            week_number=week,
-            semester=semester
-        ).all()
+        try:
+            selection = parse_schedule_filters()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
-        result = []
-        for entry in entries:
-            pair_num = get_pair_number_by_lesson(entry.day, entry.lesson_number)
-            result.append({
-                'id': entry.id,
-                'group': entry.group.name,
-                'subject': entry.subject.name,
-                'teacher': entry.teacher.name,
-                'room': entry.room.name,
-                'day': entry.day,
-                'lesson_number': entry.lesson_number,
-                'pair': pair_num,
-                'time': get_lesson_time(entry.day, entry.lesson_number),
-                'is_changed': entry.is_changed
-            })
+        if selection is not None:
+            return response_cache.filtered_response('current', semester, week, 'both', *selection)
         
-        return jsonify(result)
+        return response_cache.current_day_response(semester, week, day)
     
     @app.route('/api/schedule/main')
     def api_get_main_schedule():
@@ -299,37 +413,311 @@ def create_app():
         day = request.args.get('day', 'Понедельник')
         week_parity = request.args.get('week_parity', 'both')
         
-        query = MainScheduleEntry.query.filter_by(
-            day=day,
-            semester=semester
-        )
+        try:
+            selection = parse_schedule_filters()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
-        if week_parity != 'both':
-            query = query.filter(
-                (MainScheduleEntry.week_parity == week_parity) |
-                (MainScheduleEntry.week_parity == 'both')
-            )
+        if selection is not None:
+            return response_cache.filtered_response('main', semester, None, week_parity, *selection)
         
-        entries = query.all()
+        return response_cache.main_day_response(semester, day, week_parity)
+    
+    # Расписание на неделю (или несколько дней) в колоночном формате
+    @app.route('/api/schedule/week')
+    def api_get_week_schedule():
+        schedule_type = request.args.get('type', 'current')
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        week = request.args.get('week', type=int, default=get_current_week())
         
-        result = []
-        for entry in entries:
-            pair_num = get_pair_number_by_lesson(entry.day, entry.lesson_number)
-            result.append({
-                'id': entry.id,
-                'group': entry.group.name,
-                'subject': entry.subject.name,
-                'teacher': entry.teacher.name,
-                'room': entry.room.name,
-                'day': entry.day,
-                'lesson_number': entry.lesson_number,
-                'pair': pair_num,
-                'time': get_lesson_time(entry.day, entry.lesson_number),
-                'week_parity': entry.week_parity
-            })
+        try:
+            days = schedule_payloads.parse_days(request.args.get('days'))
+            fields = schedule_payloads.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        if schedule_type == 'main':
+            week_parity = request.args.get('week_parity')
+            if week_parity is None:
+                week_parity = schedule_payloads.week_parity_for(week) if 'week' in request.args else 'both'
+        else:
+            schedule_type = 'current'
+            week_parity = 'both'
+        
+        return response_cache.week_response(schedule_type, semester, week, week_parity, days, fields)
+    
+    # Сетка на неделю (день × пара) для одной группы, преподавателя или аудитории
+    @app.route('/api/timetable/<kind>/<int:entity_id>')
+    def api_get_timetable(kind, entity_id):
+        if kind not in timetables.KINDS:
+            return jsonify({'success': False, 'message': 'Неизвестный вид расписания'}), 404
+        
+        names = reference_cache.get_reference_data().names[timetables.KINDS[kind][0]]
+        if entity_id not in names:
+            return jsonify({'success': False, 'message': 'Не найдено'}), 404
+        
+        schedule_type = 'main' if request.args.get('type') == 'main' else 'current'
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        week = request.args.get('week', type=int, default=get_current_week())
+        week_parity = request.args.get('week_parity', 'both')
+        if week_parity not in ('both', 'even', 'odd'):
+            return jsonify({'success': False, 'message': 'Неизвестная четность недели'}), 400
+        
+        return timetables.timetable_response(kind, entity_id, schedule_type, semester, week, week_parity)
+    
+    # Опубликованный статический снимок (JSON дней и страницы групп текущей недели)
+    @app.route('/published/<path:filename>')
+    def published_file(filename):
+        directory = static_publish.current_dir()
+        if directory is None:
+            return jsonify({'success': False, 'message': 'Снимок расписания еще не опубликован'}), 404
+        
+        response = send_from_directory(directory, filename, max_age=0)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    # Календарь .ics для группы, преподавателя или аудитории (подписка из телефона)
+    @app.route('/ical/<kind>/<int:entity_id>.ics')
+    def api_ical_feed(kind, entity_id):
+        if kind not in timetables.KINDS:
+            return jsonify({'success': False, 'message': 'Неизвестный вид расписания'}), 404
+        
+        names = reference_cache.get_reference_data().names[timetables.KINDS[kind][0]]
+        if entity_id not in names:
+            return jsonify({'success': False, 'message': 'Не найдено'}), 404
+        
+        return ical_feeds.feed_response(kind, entity_id)
+    
+    # Свободные аудитории на урок (lesson) или на всю пару (pair)
+    @app.route('/api/rooms/free')
+    def api_free_rooms():
+        day = request.args.get('day')
+        if day not in schedule_payloads.DAY_INDEX:
+            return jsonify({'success': False, 'message': 'Неизвестный день'}), 400
+        
+        lesson = request.args.get('lesson', type=int)
+        pair = request.args.get('pair', type=int)
+        day_pairs = get_available_pairs_for_day(day)
+        if lesson is not None:
+            lessons = [lesson]
+            if not any(lesson in get_lessons_in_pair(day, p) for p in day_pairs):
+                return jsonify({'success': False, 'message': f'Нет урока {lesson} в день {day}'}), 400
+        elif pair is not None:
+            if pair not in day_pairs:
+                return jsonify({'success': False, 'message': f'Нет пары {pair} в день {day}'}), 400
+            lessons = get_lessons_in_pair(day, pair)
+        else:
+            return jsonify({'success': False, 'message': 'Укажите lesson или pair'}), 400
+        
+        category = request.args.get('category') or None
+        if category is not None and category not in occupancy.CATEGORIES:
+            return jsonify({
+                'success': False,
+                'message': f'Неизвестная категория. Доступны: {", ".join(occupancy.CATEGORIES)}'
+            }), 400
+        
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        week = request.args.get('week', type=int, default=get_current_week())
+        
+        rooms = occupancy.free_rooms(semester, week, day, lessons, category)
+        return jsonify({
+            'success': True,
+            'semester': semester,
+            'week': week,
+            'day': day,
+            'lessons': lessons,
+            'count': len(rooms),
+            'rooms': rooms
+        })
+    
+    # Кем заменить преподавателя: по занятию (entry_id) или по предмету и уроку
+    @app.route('/api/substitutes')
+    @login_required
+    def api_find_substitutes():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        entry_id = request.args.get('entry_id', type=int)
+        exclude = []
         
+        if entry_id is not None:
+            entry = ScheduleEntry.query.get(entry_id)
+            if not entry:
+                return jsonify({'success': False, 'message': 'Запись не найдена'}), 404
+            subject_id = entry.subject_id
+            semester, week = entry.semester, entry.week_number
+            day, lessons = entry.day, [entry.lesson_number]
+            exclude.append(entry.teacher_id)
+        else:
+            subject_id = request.args.get('subject_id', type=int)
+            if subject_id is None and request.args.get('subject'):
+                subject_id = reference_cache.resolve_id('subjects', request.args['subject'])
+            if subject_id not in reference_cache.get_reference_data().names['subjects']:
+                return jsonify({'success': False, 'message': 'Предмет не найден'}), 400
+            
+            day = request.args.get('day')
+            if day not in schedule_payloads.DAY_INDEX:
+                return jsonify({'success': False, 'message': 'Неизвестный день'}), 400
+            
+            lesson = request.args.get('lesson', type=int)
+            pair = request.args.get('pair', type=int)
+            if lesson is not None:
+                lessons = [lesson]
+            elif pair is not None:
+                lessons = get_lessons_in_pair(day, pair)
+            else:
+                return jsonify({'success': False, 'message': 'Укажите lesson или pair'}), 400
+            
+            semester = request.args.get('semester', type=int, default=get_current_semester())
+            week = request.args.get('week', type=int, default=get_current_week())
+        
+        teachers = substitutes.find_substitutes(subject_id, semester, week, day, lessons, exclude)
+        return jsonify({
+            'success': True,
+            'subject_id': subject_id,
+            'semester': semester,
+            'week': week,
+            'day': day,
+            'lessons': lessons,
+            'count': len(teachers),
+            'teachers': teachers
+        })
+    
+    def parse_absence_request(data):
+        teacher_id = int(data['teacher_id'])
+        if teacher_id not in reference_cache.get_reference_data().names['teachers']:
+            raise ValueError('Преподаватель не найден')
+        semester = int(data.get('semester', get_current_semester()))
+        week_from = int(data.get('week_from', get_current_week()))
+        week_to = int(data.get('week_to', week_from))
+        if week_to < week_from:
+            raise ValueError('week_to меньше week_from')
+        return teacher_id, semester, week_from, week_to
+    
+    # План замен отсутствующего преподавателя на диапазон недель (без записи)
+    @app.route('/api/absences/preview', methods=['POST'])
+    @login_required
+    def api_absence_preview():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        try:
+            teacher_id, semester, week_from, week_to = parse_absence_request(request.get_json() or {})
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': f'Некорректный запрос: {e}'}), 400
+        
+        result = absence_planner.plan(teacher_id, semester, week_from, week_to)
+        result['success'] = True
         return jsonify(result)
     
+    # Подтверждение плана замен: все замены одной транзакцией
+    @app.route('/api/absences/apply', methods=['POST'])
+    @login_required
+    def api_absence_apply():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        data = request.get_json() or {}
+        try:
+            teacher_id, semester, week_from, week_to = parse_absence_request(data)
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': f'Некорректный запрос: {e}'}), 400
+        
+        assignments = data.get('assignments')
+        if not isinstance(assignments, list) or not assignments:
+            return jsonify({'success': False, 'message': 'Не указаны замены'}), 400
+        
+        try:
+            errors = absence_planner.apply(teacher_id, semester, assignments)
+            if errors:
+                db.session.rollback()
+                return jsonify({'success': False, 'message': 'План устарел, постройте его заново', 'errors': errors})
+            
+            db.session.commit()
+            return jsonify({'success': True, 'message': f'Заменено занятий: {len(assignments)}'})
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)})
+    
+    # Выгрузка расписания в Excel: неделя, диапазон недель или весь семестр
+    @app.route('/api/export/schedule')
+    @login_required
+    def api_export_schedule():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        schedule_type = 'main' if request.args.get('type') == 'main' else 'current'
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        
+        if schedule_type == 'main':
+            week_from = week_to = None
+            filename = f'main_schedule_s{semester}.xlsx'
+        else:
+            if request.args.get('scope') == 'semester':
+                week_from, week_to = 1, schedule_export.last_week(semester)
+            else:
+                week_from = request.args.get('week_from', type=int) or request.args.get('week', type=int) or get_current_week()
+                week_to = request.args.get('week_to', type=int) or week_from
+            # Не дальше последней недели с расписанием и не больше года за раз
+            last = max(schedule_export.last_week(semester), week_from)
+            if week_from < 1 or week_to < week_from or week_to > last or week_to - week_from >= 52:
+                return jsonify({'success': False, 'message': 'Некорректный диапазон недель'}), 400
+            filename = f'schedule_s{semester}_w{week_from}' + (f'-{week_to}' if week_to != week_from else '') + '.xlsx'
+        
+        output = schedule_export.export_file(schedule_type, semester, week_from, week_to)
+        return send_file(
+            output,
+            mimetype=schedule_export.XLSX_MIMETYPE,
+            as_attachment=True,
+            download_name=filename
+        )
+    
+    # Поток изменений расписания (Server-Sent Events)
+    @app.route('/api/schedule/stream')
+    def api_schedule_stream():
+        schedule_type = 'main' if request.args.get('type') == 'main' else 'current'
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        week = request.args.get('week', type=int, default=get_current_week())
+        
+        subscriber = schedule_stream.Subscriber(
+            schedule_type,
+            semester,
+            week=week if schedule_type == 'current' else None,
+            group_id=request.args.get('group_id', type=int),
+            teacher_id=request.args.get('teacher_id', type=int),
+            max_queue=app.config.get('SSE_MAX_QUEUE', 100)
+        )
+        
+        response = Response(
+            schedule_stream.event_stream(subscriber, app.config.get('SSE_HEARTBEAT', 15)),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    # Изменения расписания после seq=since (дельта-синхронизация по журналу)
+    @app.route('/api/schedule/changes')
+    def api_schedule_changes():
+        since = request.args.get('since', type=int)
+        if since is None or since < 0:
+            return jsonify({'success': False, 'message': 'Не указан параметр since'}), 400
+        
+        schedule_type = request.args.get('type')
+        if schedule_type not in (None, schedule_versions.CURRENT, schedule_versions.MAIN):
+            return jsonify({'success': False, 'message': 'Неизвестный тип расписания'}), 400
+        
+        return jsonify(change_journal.changes_since(
+            since,
+            limit=request.args.get('limit', type=int, default=500),
+            schedule_type=schedule_type,
+            semester=request.args.get('semester', type=int),
+            week=request.args.get('week', type=int),
+            group_id=request.args.get('group_id', type=int),
+            teacher_id=request.args.get('teacher_id', type=int)
+        ))
+    
     @app.route('/api/schedule/add', methods=['POST'])
     @login_required
     def api_add_schedule():
@@ -340,45 +728,36 @@ def create_app():
             data = request.get_json()
             is_main = data.get('is_main', False)
             
-            group = Group.query.filter_by(name=data['group']).first()
-            subject = Subject.query.filter_by(name=data['subject']).first()
-            teacher = Teacher.query.filter_by(name=data['teacher']).first()
-            room = Room.query.filter_by(name=data['room']).first()
+            group_id, subject_id, teacher_id, room_id = reference_cache.resolve_ids(
+                group=data['group'],
+                subject=data['subject'],
+                teacher=data['teacher'],
+                room=data['room']
+            )
             
-            if not all([group, subject, teacher, room]):
+            if not all([group_id, subject_id, teacher_id, room_id]):
                 return jsonify({'success': False, 'message': 'Не найдены объекты'})
             
             day = data['day']
             lesson_number = int(data['lesson_number'])
             
-            if day in ["Понедельник", "Четверг"] and lesson_number == 0 and subject.name != "Разговоры о важном":
+            if day in ["Понедельник", "Четверг"] and lesson_number == 0 and data['subject'] != "Разговоры о важном":
                 return jsonify({'success': False, 'message': 'На 0 урок можно поставить только "Разговоры о важном"'})
             
-            if is_main:
-                conflict = MainScheduleEntry.query.filter_by(
-                    group_id=group.id,
-                    day=data['day'],
-                    lesson_number=data['lesson_number'],
-                    semester=int(data.get('semester', 1))
-                ).first()
-            else:
-                conflict = ScheduleEntry.query.filter_by(
-                    group_id=group.id,
-                    day=data['day'],
-                    lesson_number=data['lesson_number'],
-                    week_number=int(data.get('week', 1)),
-                    semester=int(data.get('semester', 1))
-                ).first()
+            conflict = find_slot_conflict(
+                is_main, group_id, day, lesson_number,
+                int(data.get('semester', 1)), int(data.get('week', 1))
+            )
             
             if conflict:
                 return jsonify({'success': False, 'message': 'Конфликт расписания'})
             
             if is_main:
                 entry = MainScheduleEntry(
-                    group_id=group.id,
-                    subject_id=subject.id,
-                    teacher_id=teacher.id,
-                    room_id=room.id,
+                    group_id=group_id,
+                    subject_id=subject_id,
+                    teacher_id=teacher_id,
+                    room_id=room_id,
                     day=data['day'],
                     lesson_number=data['lesson_number'],
                     week_parity=data.get('week_parity', 'both'),
@@ -386,10 +765,10 @@ def create_app():
                 )
             else:
                 entry = ScheduleEntry(
-                    group_id=group.id,
-                    subject_id=subject.id,
-                    teacher_id=teacher.id,
-                    room_id=room.id,
+                    group_id=group_id,
+                    subject_id=subject_id,
+                    teacher_id=teacher_id,
+                    room_id=room_id,
                     day=data['day'],
                     lesson_number=data['lesson_number'],
                     week_number=int(data.get('week', 1)),
@@ -398,6 +777,7 @@ def create_app():
                 )
             
             db.session.add(entry)
+            schedule_versions.bump_entry(entry, 'add')
             db.session.commit()
             
             return jsonify({'success': True, 'message': 'Добавлено', 'id': entry.id})
@@ -415,6 +795,7 @@ def create_app():
         try:
             entry = ScheduleEntry.query.get(id)
             if entry:
+                schedule_versions.bump_entry(entry, 'delete')
                 db.session.delete(entry)
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Удалено'})
@@ -432,6 +813,7 @@ def create_app():
         try:
             entry = MainScheduleEntry.query.get(id)
             if entry:
+                schedule_versions.bump_entry(entry, 'delete')
                 db.session.delete(entry)
                 db.session.commit()
                 return jsonify({'success': True, 'message': 'Удалено'})
@@ -440,6 +822,45 @@ def create_app():
             db.session.rollback()
             return jsonify({'success': False, 'message': str(e)})
     
+    # Импорт основного расписания из Excel (сетка: лист на день, группы x пары)
+    @app.route('/api/schedule/main/import', methods=['POST'])
+    @login_required
+    def api_import_main_schedule():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return jsonify({'success': False, 'message': 'Файл не выбран'}), 400
+        policy = request.form.get('policy', 'abort')
+        if policy not in main_schedule_import.POLICIES:
+            return jsonify({'success': False, 'message': f'Неизвестный режим: {policy}'}), 400
+        semester = request.form.get('semester', type=int, default=get_current_semester())
+        replace = request.form.get('replace') in ('1', 'true')
+        dry_run = request.form.get('dry_run') in ('1', 'true')
+        
+        try:
+            report = main_schedule_import.import_main_schedule(upload, semester, policy, replace, dry_run)
+        except main_schedule_import.ImportFileError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'Не удалось прочитать файл: {e}'}), 400
+        
+        if report['errors']:
+            return jsonify({'success': False, 'message': f'Ошибок в файле: {len(report["errors"])}', **report}), 400
+        if report['conflicts'] and policy == 'abort':
+            return jsonify({'success': False, 'message': f'Конфликтов: {len(report["conflicts"])}, ничего не добавлено', **report})
+        
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)})
+        
+        message = 'Проверено' if dry_run else f'Добавлено: {report["inserted"]}, пропущено: {report["skipped"]}'
+        return jsonify({'success': True, 'message': message, **report})
+    
     @app.route('/api/schedule/update/<int:id>', methods=['PUT'])
     @login_required
     def api_update_schedule(id):
@@ -454,21 +875,110 @@ def create_app():
                 return jsonify({'success': False, 'message': 'Запись не найдена'})
             
             if 'subject' in data:
-                subject = Subject.query.filter_by(name=data['subject']).first()
-                if subject:
-                    entry.subject_id = subject.id
+                subject_id = reference_cache.resolve_id('subjects', data['subject'])
+                if subject_id:
+                    entry.subject_id = subject_id
             
             if 'teacher' in data:
-                teacher = Teacher.query.filter_by(name=data['teacher']).first()
-                if teacher:
-                    entry.teacher_id = teacher.id
+                teacher_id = reference_cache.resolve_id('teachers', data['teacher'])
+                if teacher_id:
+                    entry.teacher_id = teacher_id
             
             if 'room' in data:
-                room = Room.query.filter_by(name=data['room']).first()
-                if room:
-                    entry.room_id = room.id
+                room_id = reference_cache.resolve_id('rooms', data['room'])
+                if room_id:
+                    entry.room_id = room_id
+            
+            entry.is_changed = True
+            schedule_versions.bump_entry(entry)
+            db.session.commit()
+            
+            return jsonify({'success': True, 'message': 'Обновлено'})
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)})
+    
+    # Добавление по id справочников (без поиска по именам)
+    @app.route('/api/v2/schedule/add', methods=['POST'])
+    @login_required
+    def api_add_schedule_v2():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        try:
+            data = request.get_json()
+            is_main = data.get('is_main', False)
+            
+            ids = {field: data.get(field) for field in reference_cache.ID_FIELDS}
+            missing = reference_cache.missing_ids(**ids)
+            if missing:
+                return jsonify({'success': False, 'message': f'Не найдены объекты: {", ".join(missing)}'})
+            
+            day = data['day']
+            lesson_number = int(data['lesson_number'])
+            semester = int(data.get('semester', 1))
+            week = int(data.get('week', 1))
+            
+            if day in ["Понедельник", "Четверг"] and lesson_number == 0:
+                subject_name = reference_cache.get_reference_data().names['subjects'][ids['subject_id']]
+                if subject_name != "Разговоры о важном":
+                    return jsonify({'success': False, 'message': 'На 0 урок можно поставить только "Разговоры о важном"'})
+            
+            if find_slot_conflict(is_main, ids['group_id'], day, lesson_number, semester, week):
+                return jsonify({'success': False, 'message': 'Конфликт расписания'})
+            
+            if is_main:
+                entry = MainScheduleEntry(
+                    day=day,
+                    lesson_number=lesson_number,
+                    week_parity=data.get('week_parity', 'both'),
+                    semester=semester,
+                    **ids
+                )
+            else:
+                entry = ScheduleEntry(
+                    day=day,
+                    lesson_number=lesson_number,
+                    week_number=week,
+                    semester=semester,
+                    is_changed=True,
+                    **ids
+                )
+            
+            db.session.add(entry)
+            schedule_versions.bump_entry(entry, 'add')
+            db.session.commit()
+            
+            return jsonify({'success': True, 'message': 'Добавлено', 'id': entry.id})
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)})
+    
+    @app.route('/api/v2/schedule/update/<int:id>', methods=['PUT'])
+    @login_required
+    def api_update_schedule_v2(id):
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        try:
+            data = request.get_json()
+            
+            ids = {field: data[field] for field in ('subject_id', 'teacher_id', 'room_id') if field in data}
+            missing = reference_cache.missing_ids(**ids)
+            if missing:
+                return jsonify({'success': False, 'message': f'Не найдены объекты: {", ".join(missing)}'})
+            
+            entry = ScheduleEntry.query.get(id)
+            if not entry:
+                return jsonify({'success': False, 'message': 'Запись не найдена'})
+            
+            for field, value in ids.items():
+                setattr(entry, field, value)
             
             entry.is_changed = True
+            schedule_versions.bump_entry(entry)
             db.session.commit()
             
             return jsonify({'success': True, 'message': 'Обновлено'})
@@ -477,6 +987,53 @@ def create_app():
             db.session.rollback()
             return jsonify({'success': False, 'message': str(e)})
     
+    # Пакет операций add/update/delete в одной транзакции (все или ничего)
+    @app.route('/api/schedule/batch', methods=['POST'])
+    @login_required
+    def api_schedule_batch():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'success': False, 'message': 'Не указаны операции'}), 400
+        
+        max_operations = app.config.get('BATCH_MAX_OPERATIONS', 500)
+        if len(operations) > max_operations:
+            return jsonify({'success': False, 'message': f'Не более {max_operations} операций за запрос'}), 400
+        
+        try:
+            batch = schedule_batch.Batch(
+                schedule_type='main' if data.get('type') == 'main' else 'current',
+                semester=int(data.get('semester', get_current_semester())),
+                week=int(data.get('week', get_current_week())),
+                strict=bool(data.get('strict', False))
+            )
+            results = batch.run(operations)
+            failed = sum(1 for result in results if not result['success'])
+            dry_run = bool(data.get('dry_run'))
+            
+            if failed or dry_run:
+                db.session.rollback()
+                # id новых записей после отката недействительны
+                for result in results:
+                    if result['op'] == 'add':
+                        result.pop('id', None)
+            else:
+                db.session.commit()
+            
+            return jsonify({
+                'success': failed == 0,
+                'message': f'Ошибок: {failed}, ничего не применено' if failed else ('Проверено' if dry_run else 'Применено'),
+                'applied': 0 if failed or dry_run else len(results),
+                'results': results
+            })
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)})
+    
     # Управление группами - получение предметов группы
     @app.route('/api/group/<int:group_id>/subjects')
     @login_required
@@ -724,6 +1281,39 @@ def create_app():
             db.session.rollback()
             return jsonify({'success': False, 'message': str(e)})
     
+    # Импорт учебного плана (группа, предмет, преподаватель, часы) из Excel/CSV
+    @app.route('/api/curriculum/import', methods=['POST'])
+    @login_required
+    def api_import_curriculum():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        upload = request.files.get('file')
+        if upload is None or not upload.filename:
+            return jsonify({'success': False, 'message': 'Файл не выбран'}), 400
+        dry_run = request.form.get('dry_run') in ('1', 'true')
+        
+        try:
+            report = curriculum_import.import_curriculum(upload, dry_run=dry_run)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            # Битый xlsx, ошибка разбора CSV и т.п. — как в импорте основного расписания
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'Не удалось прочитать файл: {e}'}), 400
+        
+        if report['errors']:
+            return jsonify({'success': False, 'message': f'Ошибок в файле: {len(report["errors"])}', **report}), 400
+        
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': str(e)})
+        
+        message = 'Проверено' if dry_run else f'Добавлено: {report["inserted"]}, обновлено: {report["updated"]}'
+        return jsonify({'success': True, 'message': message, **report})
+    
     # Практика - получение информации
     @app.route('/api/group/<int:group_id>/practice')
     @login_required
@@ -876,59 +1466,58 @@ def create_app():
             return jsonify({'success': False, 'message': str(e)})
     
     # Статистика
-    @app.route('/api/statistics')
-    @login_required
-    def api_get_statistics():
-        if current_user.role != 'admin':
-            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+    def group_statistics(week, semester, with_subjects=False):
+        """Статистика групп по сводке schedule_stats и учебному плану (без подсчета записей)"""
+        names = reference_cache.get_reference_data().names
+        stats = schedule_stats.week_stats(semester, week)
+        plan = {}
+        for gs in GroupSubject.query.order_by(GroupSubject.id).all():
+            plan.setdefault(gs.group_id, []).append(gs)
         
-        week = request.args.get('week', type=int, default=1)
-        semester = request.args.get('semester', type=int, default=1)
-        
-        groups = Group.query.all()
         group_stats = []
-        
-        for group in groups:
-            entries = ScheduleEntry.query.filter_by(
-                group_id=group.id,
-                week_number=week,
-                semester=semester
-            ).all()
-            
-            changed = sum(1 for e in entries if e.is_changed)
-            main = len(entries) - changed
-            
-            group_subjects = GroupSubject.query.filter_by(group_id=group.id).all()
+        for group in Group.query.all():
+            lessons, changed, completed_hours = stats[schedule_stats.GROUP].get(group.id, (0, 0, 0))
+            group_subjects = plan.get(group.id, [])
             total_hours = sum(gs.hours_per_week for gs in group_subjects)
-            completed_hours = len(entries) * 2
             remaining_hours = max(0, total_hours - completed_hours)
             
-            group_stats.append({
+            item = {
                 'group_name': group.name,
                 'course': group.course,
-                'total_lessons': len(entries),
+                'total_lessons': lessons,
                 'changed_lessons': changed,
-                'main_lessons': main,
+                'main_lessons': lessons - changed,
                 'total_hours': total_hours,
                 'completed_hours': completed_hours,
                 'remaining_hours': remaining_hours,
                 'progress': int((completed_hours / total_hours) * 100) if total_hours > 0 else 0
-            })
+            }
+            if with_subjects:
+                item['subjects'] = [{
+                    'subject_name': names['subjects'].get(gs.subject_id),
+                    'teacher_name': names['teachers'].get(gs.teacher_id) if gs.teacher_id else 'Не назначен',
+                    'hours_per_week': gs.hours_per_week,
+                    'total_hours_semester1': gs.total_hours_semester1 or 0,
+                    'total_hours_semester2': gs.total_hours_semester2 or 0
+                } for gs in group_subjects]
+            group_stats.append(item)
         
-        teachers = Teacher.query.all()
-        teacher_stats = []
+        return group_stats, stats[schedule_stats.TEACHER]
+    
+    @app.route('/api/statistics')
+    @login_required
+    def api_get_statistics():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
         
-        for teacher in teachers:
-            entries = ScheduleEntry.query.filter_by(
-                teacher_id=teacher.id,
-                week_number=week,
-                semester=semester
-            ).all()
-            
-            teacher_stats.append({
-                'teacher_name': teacher.name,
-                'total_lessons': len(entries)
-            })
+        week = request.args.get('week', type=int, default=1)
+        semester = request.args.get('semester', type=int, default=1)
+        
+        group_stats, teacher_lessons = group_statistics(week, semester)
+        teacher_stats = [{
+            'teacher_name': teacher.name,
+            'total_lessons': teacher_lessons.get(teacher.id, (0,))[0]
+        } for teacher in Teacher.query.all()]
         
         total_lessons = sum(g['total_lessons'] for g in group_stats)
         total_completed_hours = sum(g['completed_hours'] for g in group_stats)
@@ -954,73 +1543,24 @@ def create_app():
         week = request.args.get('week', type=int, default=1)
         semester = request.args.get('semester', type=int, default=1)
         
-        groups = Group.query.all()
-        group_stats = []
+        group_stats, teacher_lessons = group_statistics(week, semester, with_subjects=True)
+        names = reference_cache.get_reference_data().names
+        plan = {}
+        for ts in GroupSubject.query.filter(GroupSubject.teacher_id.isnot(None)).order_by(GroupSubject.id).all():
+            plan.setdefault(ts.teacher_id, []).append(ts)
         
-        for group in groups:
-            entries = ScheduleEntry.query.filter_by(
-                group_id=group.id,
-                week_number=week,
-                semester=semester
-            ).all()
-            
-            changed = sum(1 for e in entries if e.is_changed)
-            main = len(entries) - changed
-            
-            group_subjects = GroupSubject.query.filter_by(group_id=group.id).all()
-            total_hours = sum(gs.hours_per_week for gs in group_subjects)
-            completed_hours = len(entries) * 2
-            remaining_hours = max(0, total_hours - completed_hours)
-            
-            subjects_detail = []
-            for gs in group_subjects:
-                subjects_detail.append({
-                    'subject_name': gs.subject.name,
-                    'teacher_name': gs.teacher.name if gs.teacher else 'Не назначен',
-                    'hours_per_week': gs.hours_per_week,
-                    'total_hours_semester1': gs.total_hours_semester1 or 0,
-                    'total_hours_semester2': gs.total_hours_semester2 or 0
-                })
-            
-            group_stats.append({
-                'group_name': group.name,
-                'course': group.course,
-                'total_lessons': len(entries),
-                'changed_lessons': changed,
-                'main_lessons': main,
-                'total_hours': total_hours,
-                'completed_hours': completed_hours,
-                'remaining_hours': remaining_hours,
-                'progress': int((completed_hours / total_hours) * 100) if total_hours > 0 else 0,
-                'subjects': subjects_detail
-            })
-        
-        teachers = Teacher.query.all()
         teacher_stats = []
-        
-        for teacher in teachers:
-            entries = ScheduleEntry.query.filter_by(
-                teacher_id=teacher.id,
-                week_number=week,
-                semester=semester
-            ).all()
-            
-            teacher_subjects = GroupSubject.query.filter_by(teacher_id=teacher.id).all()
-            total_hours = sum(ts.hours_per_week for ts in teacher_subjects)
-            
-            groups_detail = []
-            for ts in teacher_subjects:
-                groups_detail.append({
-                    'group_name': ts.group.name,
-                    'subject_name': ts.subject.name,
-                    'hours_per_week': ts.hours_per_week
-                })
-            
+        for teacher in Teacher.query.all():
+            teacher_subjects = plan.get(teacher.id, [])
             teacher_stats.append({
                 'teacher_name': teacher.name,
-                'total_lessons': len(entries),
-                'total_hours': total_hours,
-                'groups': groups_detail
+                'total_lessons': teacher_lessons.get(teacher.id, (0,))[0],
+                'total_hours': sum(ts.hours_per_week for ts in teacher_subjects),
+                'groups': [{
+                    'group_name': names['groups'].get(ts.group_id),
+                    'subject_name': names['subjects'].get(ts.subject_id),
+                    'hours_per_week': ts.hours_per_week
+                } for ts in teacher_subjects]
             })
         
         total_groups_hours = sum(g['total_hours'] for g in group_stats)
@@ -1040,6 +1580,19 @@ def create_app():
             'teacher_stats': teacher_stats
         })
     
+    # Выполнение учебного плана за семестр
+    @app.route('/api/statistics/progress')
+    @login_required
+    def api_get_semester_progress():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        if semester not in schedule_versions.SEMESTERS:
+            return jsonify({'success': False, 'message': 'Неверный семестр'}), 400
+        
+        return jsonify({'success': True, **semester_progress.semester_progress(semester)})
+    
     # Логи автозаполнения
     @app.route('/api/autofill/logs')
     @login_required
@@ -1087,7 +1640,7 @@ def create_app():
         for lesson_num in lessons:
             result.append({
                 'lesson': lesson_num,
-                'time': get_lesson_time(day, lesson_num)
+                'time': get_lesson_pair_time(day, lesson_num)
             })
         
         return jsonify(result)
@@ -1102,17 +1655,16 @@ def create_app():
             current_week = get_current_week()
             next_week = current_week + 1
             
-            setting = AppSettings.query.filter_by(key='current_week').first()
-            if setting:
-                setting.value = str(next_week)
-            else:
-                setting = AppSettings(key='current_week', value=str(next_week))
-                db.session.add(setting)
+            settings_service.set_setting('current_week', next_week)
             
             current_semester = get_current_semester()
             update_current_schedule_from_main(next_week, current_semester)
+            compact_journal()
             
             db.session.commit()
+            response_cache.warm_week(current_semester, next_week)
+            semester_progress.warm(current_semester)
+            static_publish.request_publish(0)
             
             return jsonify({'success': True, 'message': f'Перешли на неделю {next_week}'})
             
@@ -1134,6 +1686,7 @@ def create_app():
                 week_number=current_week,
                 semester=current_semester
             ).delete()
+            schedule_versions.bump_week(current_semester, current_week)
             
             update_current_schedule_from_main(current_week, current_semester)
             
@@ -1154,23 +1707,18 @@ def create_app():
             current_semester = get_current_semester()
             next_semester = 2 if current_semester == 1 else 1
             
-            setting = AppSettings.query.filter_by(key='current_semester').first()
-            if setting:
-                setting.value = str(next_semester)
-            else:
-                setting = AppSettings(key='current_semester', value=str(next_semester))
-                db.session.add(setting)
-            
-            week_setting = AppSettings.query.filter_by(key='current_week').first()
-            if week_setting:
-                week_setting.value = '1'
-            else:
-                week_setting = AppSettings(key='current_week', value='1')
-                db.session.add(week_setting)
+            settings_service.set_setting('current_semester', next_semester)
+            settings_service.set_setting('current_week', 1)
             
             ScheduleEntry.query.filter_by(semester=next_semester).delete()
+            schedule_versions.bump_semester(next_semester)
+            # Новый проход семестра: архив истории начинает для него новый учебный год
+            settings_service.increment_setting(f'semester{next_semester}_run')
+            compact_journal()
             
             db.session.commit()
+            response_cache.warm_week(next_semester, 1)
+            static_publish.request_publish(0)
             return jsonify({'success': True, 'message': f'Перешли на {next_semester} семестр'})
             
         except Exception as e:
@@ -1218,10 +1766,13 @@ def create_app():
         
         try:
             teacher_load = []
+            counts = dict(db.session.query(
+                ScheduleEntry.teacher_id, db.func.count(ScheduleEntry.id)
+            ).group_by(ScheduleEntry.teacher_id))
             
             teachers = Teacher.query.all()
             for teacher in teachers:
-                total_pairs = ScheduleEntry.query.filter_by(teacher_id=teacher.id).count()
+                total_pairs = counts.get(teacher.id, 0)
                 
                 teacher_load.append({
                     'teacher_id': teacher.id,
@@ -1238,6 +1789,44 @@ def create_app():
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)})
     
+    # Нагрузка преподавателей по неделям и месяцам (для графиков)
+    @app.route('/api/teacher_load/weekly')
+    @login_required
+    def api_get_teacher_load_weekly():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        if semester not in schedule_versions.SEMESTERS:
+            return jsonify({'success': False, 'message': 'Неверный семестр'}), 400
+        
+        limits = teacher_workload.default_limits()
+        for name in limits:
+            value = request.args.get(name, type=int, default=limits[name])
+            if value is None or value <= 0:
+                return jsonify({'success': False, 'message': f'Неверное значение {name}'}), 400
+            limits[name] = value
+        
+        return teacher_workload.workload_response(semester, limits)
+    
+    # Загрузка аудиторий за диапазон недель (тепловая карта)
+    @app.route('/api/rooms/utilization')
+    @login_required
+    def api_get_room_utilization():
+        if current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Доступ запрещен'})
+        
+        semester = request.args.get('semester', type=int, default=get_current_semester())
+        week_from = request.args.get('week_from', type=int, default=get_current_week())
+        week_to = request.args.get('week_to', type=int, default=week_from)
+        if semester not in schedule_versions.SEMESTERS:
+            return jsonify({'success': False, 'message': 'Неверный семестр'}), 400
+        if week_from is None or week_to is None or not 1 <= week_from <= week_to or week_to - week_from >= 52:
+            return jsonify({'success': False, 'message': 'Неверный диапазон недель'}), 400
+        
+        body = reference_cache.dumps(room_utilization.utilization(semester, week_from, week_to))
+        return bytes_response(body, content_etag(body), compress=True, private=True)
+    
     @app.route('/api/schedule/check_conflicts')
     @login_required
     def api_check_conflicts():
@@ -1263,125 +1852,46 @@ def create_app():
 
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
 
-def get_pair_number_by_lesson(day, lesson_number):
-    if lesson_number == 0:
-        return 0
-    elif day == "Суббота":
-        if lesson_number in [1, 2]:
-            return 1
-        elif lesson_number in [3, 4]:
-            return 2
-        elif lesson_number in [5, 6]:
-            return 3
-        elif lesson_number in [7, 8]:
-            return 4
-    else:
-        if lesson_number in [1, 2]:
-            return 1
-        elif lesson_number in [3, 4]:
-            return 2
-        elif lesson_number in [5, 6]:
-            return 3
-        elif lesson_number in [7, 8]:
-            return 4
-        elif lesson_number in [9, 10]:
-            return 5
-        elif lesson_number in [11, 12]:
-            return 6
-    return 0
-
-def get_available_pairs_for_day(day):
-    if day == "Суббота":
-        return [1, 2, 3, 4]
-    elif day in ["Понедельник", "Четверг"]:
-        return [0, 1, 2, 3, 4, 5, 6]
-    else:
-        return [1, 2, 3, 4, 5, 6]
-
-def get_lessons_in_pair(day, pair):
-    if pair == 0:
-        return [0]
-    elif pair == 1:
-        return [1, 2]
-    elif pair == 2:
-        return [3, 4]
-    elif pair == 3:
-        return [5, 6]
-    elif pair == 4:
-        return [7, 8]
-    elif pair == 5:
-        return [9, 10]
-    elif pair == 6:
-        return [11, 12]
-    return []
-
-def get_pair_name(pair):
-    return f"Пара {pair}"
-
-def get_pair_time(day, pair):
-    if pair == 0:
-        return "8:30-9:10"
-    elif pair == 1:
-        if day == "Суббота":
-            return "8:00-9:25"
-        elif day in ["Понедельник", "Четверг"]:
-            return "9:15-10:40"
-        else:
-            return "8:30-9:55"
-    elif pair == 2:
-        if day == "Суббота":
-            return "9:30-10:55"
-        elif day in ["Понедельник", "Четверг"]:
-            return "11:20-12:45"
-        else:
-            return "10:35-12:00"
-    elif pair == 3:
-        if day == "Суббота":
-            return "11:00-12:25"
-        elif day in ["Понедельник", "Четверг"]:
-            return "13:25-14:50"
-        else:
-            return "12:40-14:05"
-    elif pair == 4:
-        if day == "Суббота":
-            return "12:30-13:55"
-        elif day in ["Понедельник", "Четверг"]:
-            return "15:00-16:25"
-        else:
-            return "14:15-15:40"
-    elif pair == 5:
-        if day in ["Понедельник", "Четверг"]:
-            return "16:30-17:55"
-        else:
-            return "15:45-17:10"
-    elif pair == 6:
-        if day in ["Понедельник", "Четверг"]:
-            return "18:00-19:25"
-        else:
-            return "17:15-18:40"
-    return ""
-
-def get_lesson_time(day, lesson_number):
-    pair = get_pair_number_by_lesson(day, lesson_number)
-    return get_pair_time(day, pair)
+def get_user_info():
+    if current_user.is_authenticated:
+        return {
+            'authenticated': True,
+            'username': current_user.username,
+            'role': current_user.role
+        }
+    return {'authenticated': False}
 
 def get_current_week():
-    setting = AppSettings.query.filter_by(key='current_week').first()
-    if setting:
-        return int(setting.value)
-    return 1
+    return settings_service.get_current_week()
+
+def find_slot_conflict(is_main, group_id, day, lesson_number, semester, week=None):
+    """id занятия группы в этом слоте или None (один запрос по индексу слота)"""
+    if is_main:
+        query = db.session.query(MainScheduleEntry.id).filter(
+            MainScheduleEntry.semester == semester,
+            MainScheduleEntry.group_id == group_id,
+            MainScheduleEntry.day == day,
+            MainScheduleEntry.lesson_number == lesson_number
+        )
+    else:
+        query = db.session.query(ScheduleEntry.id).filter(
+            ScheduleEntry.semester == semester,
+            ScheduleEntry.week_number == week,
+            ScheduleEntry.group_id == group_id,
+            ScheduleEntry.day == day,
+            ScheduleEntry.lesson_number == lesson_number
+        )
+    return query.scalar()
 
 def get_current_semester():
-    setting = AppSettings.query.filter_by(key='current_semester').first()
-    if setting:
-        return int(setting.value)
-    return 1
+    return settings_service.get_current_semester()
 
 def update_current_schedule_from_main(week_number, semester):
     ScheduleEntry.query.filter_by(
         week_number=week_number,
         semester=semester
     ).delete()
+    schedule_versions.bump_week(semester, week_number)
     
     week_parity = 'even' if week_number % 2 == 0 else 'odd'
     
@@ -1488,9 +1998,11 @@ def auto_fill_schedule(week, semester, fill_type='both'):
                 week_number=week,
                 semester=semester
             ).delete()
+            schedule_versions.bump_week(semester, week)
         
         if fill_type in ['main', 'both']:
             MainScheduleEntry.query.filter_by(semester=semester).delete()
+            schedule_versions.bump_main(semester)
         
         groups = Group.query.order_by(Group.course, Group.name).all()
         days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
@@ -1798,23 +2310,64 @@ def populate_initial_data():
         print("Создаем таблицу group_practice...")
         GroupPractice.__table__.create(db.engine)
     
+    # Колонки прежних значений в журнале изменений, созданном до их появления
+    change_columns = {col['name'] for col in inspector.get_columns('schedule_change')}
+    with db.engine.connect() as conn:
+        for column in ('old_week_number', 'old_group_id', 'old_teacher_id'):
+            if column not in change_columns:
+                conn.execute(text(f"ALTER TABLE schedule_change ADD COLUMN {column} INTEGER"))
+        conn.commit()
+    
+    # create_all не добавляет индексы в уже существующие таблицы
+    for model in (ScheduleEntry, MainScheduleEntry, TeacherSubject):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    
+    # Сводка статистики для базы, созданной до появления таблицы schedule_stats
+    if not ScheduleStat.query.first() and ScheduleEntry.query.first():
+        schedule_stats.rebuild()
+    
     # Добавляем начальные данные
+    reference_changed = False
+    
     for teacher_name in TEACHER_INITIAL_LOAD.keys():
         if not Teacher.query.filter_by(name=teacher_name).first():
             db.session.add(Teacher(name=teacher_name))
+            reference_changed = True
     
     for subject_name in SUBJECTS:
         if not Subject.query.filter_by(name=subject_name).first():
             db.session.add(Subject(name=subject_name))
+            reference_changed = True
     
     for group_name in GROUPS:
         if not Group.query.filter_by(name=group_name).first():
             course = int(group_name[0]) if group_name[0].isdigit() else 1
             db.session.add(Group(name=group_name, course=course))
+            reference_changed = True
     
     for room_name in ROOMS:
         if not Room.query.filter_by(name=room_name).first():
             db.session.add(Room(name=room_name))
+            reference_changed = True
+    
+    # Квалификации преподавателей из TEACHER_INITIAL_LOAD
+    db.session.flush()
+    teacher_ids = {name: id for id, name in db.session.query(Teacher.id, Teacher.name)}
+    subject_ids = {name: id for id, name in db.session.query(Subject.id, Subject.name)}
+    existing = set(db.session.query(TeacherSubject.teacher_id, TeacherSubject.subject_id))
+    
+    for teacher_name, subject_names in TEACHER_INITIAL_LOAD.items():
+        for subject_name in subject_names:
+            pair = (teacher_ids.get(teacher_name), subject_ids.get(subject_name))
+            if None in pair or pair in existing:
+                continue
+            db.session.add(TeacherSubject(teacher_id=pair[0], subject_id=pair[1]))
+            existing.add(pair)
+            reference_changed = True
+    
+    if reference_changed:
+        reference_cache.bump_version()
     
     if not AppSettings.query.filter_by(key='current_week').first():
         db.session.add(AppSettings(key='current_week', value='1'))
@@ -1822,6 +2375,9 @@ def populate_initial_data():
     if not AppSettings.query.filter_by(key='current_semester').first():
         db.session.add(AppSettings(key='current_semester', value='1'))
     
+    # Даты начала семестров фиксируются в настройках при первом запуске
+    ical_feeds.seed_semester_starts()
+    
     db.session.commit()
 
 app = create_app()
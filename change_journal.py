@@ -0,0 +1,237 @@
+# change_journal.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db, ScheduleChange
+from schedule_payloads import FLAG_CHANGED, PARITY_FLAGS, parity_from_flags
+import schedule_versions
+
+# Сколько событий текущей транзакции уже записано в журнал
+WRITTEN_KEY = 'schedule_events_journaled'
+
+MAX_LIMIT = 5000
+
+# Журнал сжимается при commit, когда он длиннее JOURNAL_MAX_ROWS на эту долю
+# (запас, чтобы не удалять записи при каждом commit)
+COMPACT_SLACK = 0.1
+
+_options = {'max_rows': 50000, 'retention_days': 14}
+
+
+def init_change_journal(app):
+    _options['max_rows'] = app.config.get('JOURNAL_MAX_ROWS', 50000)
+    _options['retention_days'] = app.config.get('JOURNAL_RETENTION_DAYS', 14)
+
+
+def _flags(event):
+    flags = PARITY_FLAGS.get(event.get('week_parity'), 0)
+    if event.get('is_changed'):
+        flags |= FLAG_CHANGED
+    return flags
+
+
+def _row(event):
+    old = event.get('old', {})
+    return ScheduleChange(
+        op=event['op'],
+        scope=event['type'],
+        semester=event['semester'],
+        week_number=event.get('week'),
+        entry_id=event.get('id'),
+        day=event.get('day'),
+        lesson_number=event.get('lesson'),
+        group_id=event.get('group_id'),
+        subject_id=event.get('subject_id'),
+        teacher_id=event.get('teacher_id'),
+        room_id=event.get('room_id'),
+        old_week_number=old.get('week'),
+        old_group_id=old.get('group_id'),
+        old_teacher_id=old.get('teacher_id'),
+        flags=_flags(event)
+    )
+
+
+@event.listens_for(Session, 'before_commit')
+def _journal_pending_events(session):
+    """Дописать события транзакции в журнал перед commit (в той же транзакции)"""
+    events = session.info.get(schedule_versions.EVENTS_KEY)
+    if not events:
+        return
+    written = session.info.get(WRITTEN_KEY, 0)
+    if written == len(events):
+        return
+    for pending in events[written:]:
+        session.add(_row(pending))
+    session.info[WRITTEN_KEY] = len(events)
+
+    # Длинная неделя с большим числом правок: журнал не ждет перехода недели
+    low, high = journal_bounds(session)
+    if low and high - low + 1 > _options['max_rows'] * (1 + COMPACT_SLACK):
+        compact(_options['max_rows'], _options['retention_days'], session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    session.info.pop(WRITTEN_KEY, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(WRITTEN_KEY, None)
+
+
+def to_dict(change):
+    item = {
+        'seq': change.seq,
+        'op': change.op,
+        'type': change.scope,
+        'semester': change.semester,
+        'week': change.week_number
+    }
+    if change.op != 'refresh':
+        item.update({
+            'id': change.entry_id,
+            'day': change.day,
+            'lesson': change.lesson_number,
+            'group_id': change.group_id,
+            'subject_id': change.subject_id,
+            'teacher_id': change.teacher_id,
+            'room_id': change.room_id
+        })
+        old = {
+            key: value for key, value in (
+                ('week', change.old_week_number),
+                ('group_id', change.old_group_id),
+                ('teacher_id', change.old_teacher_id)
+            ) if value is not None
+        }
+        if old:
+            item['old'] = old
+        if change.scope == schedule_versions.MAIN:
+            item['week_parity'] = parity_from_flags(change.flags or 0)
+        else:
+            item['is_changed'] = bool((change.flags or 0) & FLAG_CHANGED)
+    return item
+
+
+def journal_bounds(session=None):
+    """(минимальный, максимальный) seq в журнале; (0, 0) для пустого"""
+    session = session or db.session
+    low, high = session.query(func.min(ScheduleChange.seq), func.max(ScheduleChange.seq)).one()
+    return low or 0, high or 0
+
+
+def changes_since(since, limit=500, schedule_type=None, semester=None, week=None, group_id=None, teacher_id=None):
+    """Изменения с seq > since.
+
+    Если since меньше того, что осталось после сжатия журнала, клиенту
+    возвращается resync_required — нужна полная перезагрузка. Фильтры по
+    неделе, группе и преподавателю учитывают и прежние значения update:
+    перенесенное занятие должно исчезнуть у прежнего владельца.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    low, high = journal_bounds()
+
+    if low and since < low - 1:
+        return {
+            'since': since,
+            'latest': high,
+            'next': high,
+            'resync_required': True,
+            'has_more': False,
+            'changes': []
+        }
+
+    query = ScheduleChange.query.filter(ScheduleChange.seq > since)
+    if schedule_type:
+        query = query.filter(ScheduleChange.scope == schedule_type)
+    if semester is not None:
+        query = query.filter(ScheduleChange.semester == semester)
+    if week is not None:
+        # refresh без недели относится ко всему семестру
+        query = query.filter(
+            (ScheduleChange.week_number == week) | (ScheduleChange.week_number.is_(None))
+            | (ScheduleChange.old_week_number == week)
+        )
+    if group_id is not None:
+        query = query.filter(
+            (ScheduleChange.group_id == group_id) | (ScheduleChange.old_group_id == group_id)
+            | (ScheduleChange.op == 'refresh')
+        )
+    if teacher_id is not None:
+        query = query.filter(
+            (ScheduleChange.teacher_id == teacher_id) | (ScheduleChange.old_teacher_id == teacher_id)
+            | (ScheduleChange.op == 'refresh')
+        )
+
+    rows = query.order_by(ScheduleChange.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        'since': since,
+        # Клиент продолжает с next: при фильтрах это последний просмотренный seq
+        'latest': high,
+        'next': rows[-1].seq if has_more else max(high, since),
+        'resync_required': False,
+        'has_more': has_more,
+        'changes': [to_dict(row) for row in rows]
+    }
+
+
+def entity_changed(since, latest, field, entity_id, entry_ids, semester, schedule_type=None, weeks=None):
+    """Были ли после seq since изменения, касающиеся сущности.
+
+    Сущность задается полем журнала (group_id / teacher_id / room_id) и
+    набором (scope, id) занятий, которые в ней были: запись могла уйти от
+    сущности (смена преподавателя). weeks ограничивает недели текущего
+    расписания; основное расписание проверяется целиком.
+    """
+    low, high = journal_bounds()
+    if low and since < low - 1:
+        return True  # журнал сжат, проверить нельзя
+
+    column = getattr(ScheduleChange, field)
+    query = db.session.query(
+        ScheduleChange.op, ScheduleChange.scope, ScheduleChange.entry_id, column
+    ).filter(
+        ScheduleChange.seq > since,
+        ScheduleChange.seq <= latest,
+        ScheduleChange.semester == semester
+    )
+    if schedule_type:
+        query = query.filter(ScheduleChange.scope == schedule_type)
+    if weeks is not None:
+        query = query.filter(
+            (ScheduleChange.scope == schedule_versions.MAIN) |
+            ScheduleChange.week_number.in_(list(weeks)) |
+            ScheduleChange.week_number.is_(None)
+        )
+
+    for op, scope, entry_id, value in query:
+        if op == 'refresh' or value == entity_id or (scope, entry_id) in entry_ids:
+            return True
+    return False
+
+
+def compact(max_rows=50000, retention_days=14, session=None):
+    """Сжать журнал в текущей транзакции.
+
+    Удаляются записи старше retention_days и все, что не входит в последние
+    max_rows. Последняя запись сохраняется всегда, чтобы seq не начинался
+    заново. Вызывается при переходе недели, командой compact-journal и
+    при commit, если журнал перерос max_rows.
+    """
+    session = session or db.session
+    low, high = journal_bounds(session)
+    if not high:
+        return 0
+
+    cutoff_time = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = session.query(ScheduleChange).filter(
+        ScheduleChange.seq < high,
+        (ScheduleChange.seq <= high - max_rows) | (ScheduleChange.created_at < cutoff_time)
+    ).delete(synchronize_session=False)
+    return deleted
@@ -5,4 +5,57 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{os.path.join(basedir, "schedule.db")}'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Как часто (в секундах) воркер сверяет счетчик изменений настроек с БД
+    SETTINGS_CHECK_INTERVAL = 2
+    
+    # Кэш готовых ответов расписания
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    
+    # Поток изменений расписания (SSE)
+    SSE_HEARTBEAT = 15
+    SSE_MAX_QUEUE = 100
+    
+    # Журнал изменений расписания: сколько записей и дней хранить
+    JOURNAL_MAX_ROWS = 50000
+    JOURNAL_RETENTION_DAYS = 14
+    
+    # Максимум операций в одном запросе /api/schedule/batch
+    BATCH_MAX_OPERATIONS = 500
+    
+    # Постраничный вывод /api/schedule/current и /api/schedule/main
+    SCHEDULE_PAGE_SIZE = 200
+    SCHEDULE_MAX_PAGE_SIZE = 1000
+    
+    # Сколько сеток /api/timetable/... держать в памяти
+    TIMETABLE_CACHE_MAX_ENTRIES = 2048
+    
+    # Календари .ics: сколько лент держать в памяти и какие недели в них попадают
+    ICAL_CACHE_MAX_ENTRIES = 2048
+    ICAL_WEEKS_BACK = 2
+    ICAL_WEEKS_AHEAD = 8
+    # Часовой пояс колледжа (IANA): время занятий в календарях переводится из него в UTC
+    COLLEGE_TIMEZONE = 'Europe/Moscow'
+    
+    # Статический снимок расписания: каталог, задержка публикации после правок (сек.) и сколько версий хранить
+    STATIC_PUBLISH_DIR = os.environ.get('STATIC_PUBLISH_DIR') or os.path.join(basedir, 'published')
+    STATIC_PUBLISH_DEBOUNCE = 5
+    STATIC_PUBLISH_KEEP = 3
+    
+    # Колоночный архив расписания для аналитики (flask export-archive): каталог и формат (parquet / feather)
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(basedir, 'archive')
+    ARCHIVE_FORMAT = 'parquet'
+    
+    # Допустимое отставание / опережение учебного плана (в неделях) до пометки в статистике семестра
+    PROGRESS_TOLERANCE_WEEKS = 1
+    
+    # Нагрузка преподавателей (часов в неделю): предел недели, ставка и окно скользящего среднего в неделях
+    TEACHER_MAX_WEEKLY_HOURS = 36
+    TEACHER_RATE_WEEKLY_HOURS = 18
+    TEACHER_LOAD_ROLLING_WEEKS = 4
+    
+    # Отчет о загрузке аудиторий: доля занятых слотов (%) ниже / от которой аудитория недогружена / перегружена
+    ROOM_UNDERUSED_PERCENT = 10
+    ROOM_OVERBOOKED_PERCENT = 85
\ No newline at end of file
@@ -2,6 +2,8 @@
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required
 from models import db, ScheduleEntry, MainScheduleEntry, Group, Subject, Teacher, Room
+import reference_cache
+import schedule_versions
 from initial_data import AVAILABLE_DAYS, AVAILABLE_PAIRS, get_lesson_time, get_pair_number, get_lessons_in_pair, is_zero_lesson_pair
 
 current_schedule_bp = Blueprint('current_schedule', __name__)
@@ -87,17 +89,19 @@ def add_entry():
             return jsonify({'success': False, 'message': 'На 0 урок можно поставить только "Разговоры о важном"'})
         
         # Находим объекты
-        group = Group.query.filter_by(name=data['group']).first()
-        subject_obj = Subject.query.filter_by(name=subject).first()
-        teacher = Teacher.query.filter_by(name=data['teacher']).first()
-        room = Room.query.filter_by(name=data['room']).first()
+        group_id, subject_id, teacher_id, room_id = reference_cache.resolve_ids(
+            group=data['group'],
+            subject=subject,
+            teacher=data['teacher'],
+            room=data['room']
+        )
         
-        if not all([group, subject_obj, teacher, room]):
+        if not all([group_id, subject_id, teacher_id, room_id]):
             return jsonify({'success': False, 'message': 'Один из объектов не найден'})
         
         # Проверка конфликтов
         conflict = ScheduleEntry.query.filter_by(
-            group_id=group.id,
+            group_id=group_id,
             day=day,
             lesson_number=lesson_number,
             week_number=int(data['week']),
@@ -109,10 +113,10 @@ def add_entry():
         
         # Создаем запись
         entry = ScheduleEntry(
-            group_id=group.id,
-            subject_id=subject_obj.id,
-            teacher_id=teacher.id,
-            room_id=room.id,
+            group_id=group_id,
+            subject_id=subject_id,
+            teacher_id=teacher_id,
+            room_id=room_id,
             day=day,
             lesson_number=lesson_number,
             week_number=int(data['week']),
@@ -121,6 +125,7 @@ def add_entry():
         )
         
         db.session.add(entry)
+        schedule_versions.bump_entry(entry, 'add')
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Запись добавлена', 'id': entry.id})
@@ -136,6 +141,7 @@ def delete_entry(entry_id):
     try:
         entry = ScheduleEntry.query.get(entry_id)
         if entry:
+            schedule_versions.bump_entry(entry, 'delete')
             db.session.delete(entry)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Запись удалена'})
@@ -158,21 +164,22 @@ def update_entry(entry_id):
         
         # Обновляем поля
         if 'subject' in data:
-            subject = Subject.query.filter_by(name=data['subject']).first()
-            if subject:
-                entry.subject_id = subject.id
+            subject_id = reference_cache.resolve_id('subjects', data['subject'])
+            if subject_id:
+                entry.subject_id = subject_id
         
         if 'teacher' in data:
-            teacher = Teacher.query.filter_by(name=data['teacher']).first()
-            if teacher:
-                entry.teacher_id = teacher.id
+            teacher_id = reference_cache.resolve_id('teachers', data['teacher'])
+            if teacher_id:
+                entry.teacher_id = teacher_id
         
         if 'room' in data:
-            room = Room.query.filter_by(name=data['room']).first()
-            if room:
-                entry.room_id = room.id
+            room_id = reference_cache.resolve_id('rooms', data['room'])
+            if room_id:
+                entry.room_id = room_id
         
         entry.is_changed = True
+        schedule_versions.bump_entry(entry)
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Запись обновлена'})
@@ -0,0 +1,180 @@
+# curriculum_import.py
+import os
+
+import pandas as pd
+
+from models import db, GroupSubject, TeacherSubject
+import reference_cache
+
+# Заголовки столбцов в файле (рус. или англ.) -> поле
+COLUMN_ALIASES = {
+    'group': 'group',
+    'группа': 'group',
+    'subject': 'subject',
+    'предмет': 'subject',
+    'дисциплина': 'subject',
+    'teacher': 'teacher',
+    'преподаватель': 'teacher',
+    'hours_per_week': 'hours_per_week',
+    'часов в неделю': 'hours_per_week',
+    'часы в неделю': 'hours_per_week',
+    'total_hours_semester1': 'total_hours_semester1',
+    'часов за 1 семестр': 'total_hours_semester1',
+    '1 семестр': 'total_hours_semester1',
+    'total_hours_semester2': 'total_hours_semester2',
+    'часов за 2 семестр': 'total_hours_semester2',
+    '2 семестр': 'total_hours_semester2'
+}
+
+REQUIRED_COLUMNS = ('group', 'subject')
+HOURS_COLUMNS = ('hours_per_week', 'total_hours_semester1', 'total_hours_semester2')
+
+# Номер первой строки данных в файле (строка 1 — заголовок)
+FIRST_DATA_ROW = 2
+
+
+def read_table(file_storage):
+    """Загруженный файл (.xlsx / .csv) -> DataFrame строк.
+
+    Отсутствующие необязательные столбцы добавляются пустыми: пустая
+    ячейка означает «не менять» для уже существующей строки плана.
+    """
+    extension = os.path.splitext(file_storage.filename or '')[1].lower()
+    if extension == '.xlsx':
+        frame = pd.read_excel(file_storage, dtype=str)
+    elif extension == '.csv':
+        # Разделитель (запятая или точка с запятой) определяется автоматически
+        frame = pd.read_csv(file_storage, dtype=str, sep=None, engine='python', encoding='utf-8-sig')
+    else:
+        raise ValueError('Поддерживаются файлы .xlsx и .csv')
+
+    frame = frame.rename(columns=lambda name: COLUMN_ALIASES.get(str(name).strip().lower(), str(name).strip()))
+    missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f'Нет столбцов: {", ".join(missing)}')
+
+    for column in ('teacher',) + HOURS_COLUMNS:
+        if column not in frame.columns:
+            frame[column] = None
+
+    frame = frame.dropna(how='all', subset=list(REQUIRED_COLUMNS) + ['teacher'])
+    for column in REQUIRED_COLUMNS + ('teacher',):
+        frame[column] = frame[column].fillna('').astype(str).str.strip()
+    return frame
+
+
+def _errors(frame, mask, column, message):
+    """Строки mask -> записи отчета об ошибках"""
+    rows = frame.index[mask] + FIRST_DATA_ROW
+    return [{'row': int(row), 'column': column, 'message': message} for row in rows]
+
+
+def validate(frame):
+    """Проверить все строки сразу (по столбцам, без цикла по строкам).
+
+    Добавляет в frame столбцы с id и числами часов, возвращает
+    (ошибки, предупреждения).
+    """
+    ids = reference_cache.get_reference_data().ids
+    errors = []
+
+    frame['group_id'] = frame['group'].map(ids['groups'])
+    frame['subject_id'] = frame['subject'].map(ids['subjects'])
+    frame['teacher_id'] = frame['teacher'].map(ids['teachers'])
+
+    errors += _errors(frame, frame['group'] == '', 'group', 'Не указана группа')
+    errors += _errors(frame, (frame['group'] != '') & frame['group_id'].isna(), 'group', 'Неизвестная группа')
+    errors += _errors(frame, frame['subject'] == '', 'subject', 'Не указан предмет')
+    errors += _errors(frame, (frame['subject'] != '') & frame['subject_id'].isna(), 'subject', 'Неизвестный предмет')
+    errors += _errors(frame, (frame['teacher'] != '') & frame['teacher_id'].isna(), 'teacher', 'Неизвестный преподаватель')
+
+    for column in HOURS_COLUMNS:
+        raw = frame[column]
+        hours = pd.to_numeric(raw, errors='coerce')
+        invalid = raw.notna() & (raw.astype(str).str.strip() != '') & (hours.isna() | (hours < 0) | (hours % 1 != 0))
+        errors += _errors(frame, invalid, column, 'Ожидается целое неотрицательное число')
+        # Пустая ячейка остается NA: при обновлении столбец не меняется
+        frame[column] = hours.where(~invalid).astype('Int64')
+
+    known = frame['group_id'].notna() & frame['subject_id'].notna()
+    duplicated = known & frame.duplicated(['group_id', 'subject_id'], keep=False)
+    errors += _errors(frame, duplicated, 'subject', 'Предмет группы указан несколько раз')
+
+    # Квалификация: пара (преподаватель, предмет) должна быть в TeacherSubject.
+    # Уже сохраненное в плане назначение не блокирует повторный импорт —
+    # о нем только предупреждаем.
+    qualified = pd.MultiIndex.from_tuples(
+        db.session.query(TeacherSubject.teacher_id, TeacherSubject.subject_id).all() or [(0, 0)]
+    )
+    assigned = pd.MultiIndex.from_tuples(
+        db.session.query(GroupSubject.group_id, GroupSubject.subject_id, GroupSubject.teacher_id).filter(
+            GroupSubject.teacher_id.isnot(None)
+        ).all() or [(0, 0, 0)]
+    )
+    with_teacher = known & frame['teacher_id'].notna()
+    teacher_ids = frame['teacher_id'].fillna(0).astype(int)
+    subject_ids = frame['subject_id'].fillna(0).astype(int)
+    unqualified = with_teacher & ~pd.MultiIndex.from_arrays([teacher_ids, subject_ids]).isin(qualified)
+    kept = pd.MultiIndex.from_arrays([frame['group_id'].fillna(0).astype(int), subject_ids, teacher_ids]).isin(assigned)
+    errors += _errors(frame, unqualified & ~kept, 'teacher', 'Преподаватель не ведет этот предмет')
+    warnings = _errors(frame, unqualified & kept, 'teacher', 'Преподаватель не ведет этот предмет (назначение сохранено)')
+
+    errors.sort(key=lambda error: error['row'])
+    return errors, warnings
+
+
+def _value(value):
+    return None if pd.isna(value) else int(value)
+
+
+def upsert(frame):
+    """Вставить или обновить GroupSubject по (group_id, subject_id) пакетно, без commit.
+
+    Новые строки получают 0 часов и пустого преподавателя вместо пустых
+    ячеек; у существующих обновляются только заполненные ячейки.
+    """
+    existing = {
+        (group_id, subject_id): id
+        for id, group_id, subject_id in db.session.query(
+            GroupSubject.id, GroupSubject.group_id, GroupSubject.subject_id
+        )
+    }
+
+    inserts, updates = [], []
+    fields = ('teacher_id',) + HOURS_COLUMNS
+    for row in frame[['group_id', 'subject_id', *fields]].itertuples(index=False):
+        key = (int(row.group_id), int(row.subject_id))
+        values = {field: _value(getattr(row, field)) for field in fields}
+        id = existing.get(key)
+        if id is None:
+            record = {field: 0 for field in HOURS_COLUMNS}
+            record.update({field: value for field, value in values.items() if value is not None})
+            record.update(group_id=key[0], subject_id=key[1])
+            inserts.append(record)
+        else:
+            record = {field: value for field, value in values.items() if value is not None}
+            if record:
+                record['id'] = id
+                updates.append(record)
+
+    if inserts:
+        db.session.bulk_insert_mappings(GroupSubject, inserts)
+    if updates:
+        db.session.bulk_update_mappings(GroupSubject, updates)
+    return len(inserts), len(updates)
+
+
+def import_curriculum(file_storage, dry_run=False):
+    """Импорт учебного плана: все строки или ничего.
+
+    Возвращает отчет {rows, inserted, updated, errors, warnings}; при ошибках
+    ничего не записывается. commit выполняет вызывающий код.
+    """
+    frame = read_table(file_storage)
+    errors, warnings = validate(frame)
+    report = {'rows': int(len(frame)), 'inserted': 0, 'updated': 0, 'errors': errors, 'warnings': warnings}
+    if errors or dry_run:
+        return report
+
+    report['inserted'], report['updated'] = upsert(frame)
+    return report
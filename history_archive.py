@@ -0,0 +1,264 @@
+# history_archive.py
+import json
+import os
+from datetime import date
+
+from models import db, Group, Teacher, Subject, Room, GroupSubject, ScheduleEntry, MainScheduleEntry, ScheduleVersion
+from pairs import get_pair_number_by_lesson
+import ical_feeds
+import occupancy
+import reference_cache
+import schedule_payloads
+import schedule_versions
+import settings_service
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # архив — необязательная возможность
+    pa = None
+
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+STATE = 'state.json'
+
+# Сколько строк таблицы фактов читать из БД за раз
+FETCH_SIZE = 5000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def academic_year(semester):
+    """Учебный год (год начала) семестра: по нему недели разных лет не перезаписывают друг друга"""
+    start = ical_feeds.semester_start(semester)
+    return start.year if semester == 1 else start.year - 1
+
+
+def _semester_run(state, semester, freeze):
+    """Учебный год и дата начала текущего прохода семестра, зафиксированные при первой выгрузке.
+
+    Проход — номер из настройки semester<N>_run (увеличивается при переходе
+    на семестр). Год прохода больше не пересчитывается, поэтому смена даты
+    начала не переносит уже выгруженные недели. Если дата начала не
+    обновлена и год совпал с прошлым проходом, берется следующий год —
+    новая неделя 1 не перезапишет прошлогоднюю. Пока у семестра нет
+    недель текущего расписания (freeze=False), проход не фиксируется.
+    """
+    runs = state.setdefault('runs', {})
+    key = f'{semester}:{settings_service.get_int_setting(f"semester{semester}_run", 0)}'
+    if key not in runs:
+        year = academic_year(semester)
+        start = ical_feeds.semester_start(semester)
+        used = [run['year'] for name, run in runs.items() if name.startswith(f'{semester}:')]
+        if used and year <= max(used):
+            shift = max(used) + 1 - year
+            year += shift
+            start = date(start.year + shift, start.month, 28 if (start.month, start.day) == (2, 29) else start.day)
+        if not freeze:
+            return year, start
+        runs[key] = {'year': year, 'start': start.isoformat()}
+    return runs[key]['year'], date.fromisoformat(runs[key]['start'])
+
+
+def _dictionary(values):
+    """Строки со словарным кодированием: в файле хранится каждое имя один раз"""
+    return pa.array(values, type=pa.string()).dictionary_encode()
+
+
+def _write(table, path, file_format):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    if file_format == 'feather':
+        feather.write_feather(table, tmp, compression='zstd')
+    else:
+        pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, path)
+
+
+def _lesson_columns(entry_ids, days, lessons, group_ids, subject_ids, teacher_ids, room_ids, names):
+    """Общие столбцы занятия: id справочников и их имена на момент выгрузки"""
+    return {
+        'id': pa.array(entry_ids, pa.int32()),
+        'day': _dictionary(days),
+        'lesson_number': pa.array(lessons, pa.int8()),
+        'pair': pa.array([get_pair_number_by_lesson(d, l) for d, l in zip(days, lessons)], pa.int8()),
+        'group_id': pa.array(group_ids, pa.int32()),
+        'group': _dictionary([names['groups'].get(i) for i in group_ids]),
+        'subject_id': pa.array(subject_ids, pa.int32()),
+        'subject': _dictionary([names['subjects'].get(i) for i in subject_ids]),
+        'teacher_id': pa.array(teacher_ids, pa.int32()),
+        'teacher': _dictionary([names['teachers'].get(i) for i in teacher_ids]),
+        'room_id': pa.array(room_ids, pa.int32()),
+        'room': _dictionary([names['rooms'].get(i) for i in room_ids])
+    }
+
+
+def _current_table(rows, names, start):
+    entry_ids, weeks, days, lessons, group_ids, subject_ids, teacher_ids, room_ids, changed = zip(*rows)
+    columns = _lesson_columns(entry_ids, days, lessons, group_ids, subject_ids, teacher_ids, room_ids, names)
+    # Дата занятия — для сводок по месяцам
+    columns['date'] = pa.array([
+        ical_feeds.lesson_date(start, week, day) if day in schedule_payloads.DAY_INDEX else None
+        for week, day in zip(weeks, days)
+    ], pa.date32())
+    columns['is_changed'] = pa.array([bool(value) for value in changed], pa.bool_())
+    return pa.table(columns)
+
+
+def _main_table(rows, names):
+    entry_ids, days, lessons, group_ids, subject_ids, teacher_ids, room_ids, parities = zip(*rows) if rows else [()] * 8
+    columns = _lesson_columns(entry_ids, days, lessons, group_ids, subject_ids, teacher_ids, room_ids, names)
+    columns['week_parity'] = _dictionary([parity or 'both' for parity in parities])
+    return pa.table(columns)
+
+
+def _dimension_tables():
+    groups = Group.query.order_by(Group.id).all()
+    rooms = Room.query.order_by(Room.id).all()
+    plan = GroupSubject.query.order_by(GroupSubject.id).all()
+    simple = {
+        'teachers': Teacher.query.order_by(Teacher.id).all(),
+        'subjects': Subject.query.order_by(Subject.id).all()
+    }
+
+    tables = {
+        'groups': pa.table({
+            'id': pa.array([g.id for g in groups], pa.int32()),
+            'name': pa.array([g.name for g in groups], pa.string()),
+            'course': pa.array([g.course for g in groups], pa.int8())
+        }),
+        'rooms': pa.table({
+            'id': pa.array([r.id for r in rooms], pa.int32()),
+            'name': pa.array([r.name for r in rooms], pa.string()),
+            'category': _dictionary([occupancy.room_category(r.name) for r in rooms])
+        }),
+        'group_subjects': pa.table({
+            'group_id': pa.array([p.group_id for p in plan], pa.int32()),
+            'subject_id': pa.array([p.subject_id for p in plan], pa.int32()),
+            'teacher_id': pa.array([p.teacher_id for p in plan], pa.int32()),
+            'hours_per_week': pa.array([p.hours_per_week for p in plan], pa.int16()),
+            'total_hours_semester1': pa.array([p.total_hours_semester1 for p in plan], pa.int16()),
+            'total_hours_semester2': pa.array([p.total_hours_semester2 for p in plan], pa.int16())
+        })
+    }
+    for kind, items in simple.items():
+        tables[kind] = pa.table({
+            'id': pa.array([item.id for item in items], pa.int32()),
+            'name': pa.array([item.name for item in items], pa.string())
+        })
+    return tables
+
+
+def _week_dir(root, year, semester, week):
+    return os.path.join(root, 'schedule_entry', f'year={year}', f'semester={semester}', f'week={week}')
+
+
+def export_archive(root, file_format='parquet', full=False):
+    """Выгрузить расписание в колоночные файлы для аналитики.
+
+    Раскладка (hive-партиции, читается pandas.read_parquet(каталог) или
+    pyarrow.dataset):
+        schedule_entry/year=Y/semester=S/week=W/part.parquet
+        main_schedule_entry/year=Y/semester=S/part.parquet
+        dimensions/<справочник>.parquet
+
+    Выгружаются только недели, которые есть в БД и счетчик версии которых
+    (ScheduleVersion) изменился с прошлого раза. Архив только дополняется:
+    неделя, исчезнувшая из БД (новый семестр, очистка), остается в архиве
+    как была. Возвращает {'weeks': [...], 'main': [...], 'dimensions': bool}.
+    """
+    if pa is None:
+        raise ArchiveError('Для архива нужен пакет pyarrow (pip install pyarrow)')
+    if file_format not in FORMATS:
+        raise ArchiveError(f'Неизвестный формат: {file_format}')
+    extension = FORMATS[file_format]
+
+    os.makedirs(root, exist_ok=True)
+    state_path = os.path.join(root, STATE)
+    state = {}
+    if not full and os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    if state.get('format', file_format) != file_format:
+        raise ArchiveError(f'Архив в каталоге уже в формате {state["format"]}')
+    state.setdefault('format', file_format)
+    state.setdefault('versions', {})
+    versions = state['versions']
+
+    # Версии читаем до данных: правка во время выгрузки попадет в следующую
+    counters = {
+        (scope, semester, week): version
+        for scope, semester, week, version in db.session.query(
+            ScheduleVersion.scope, ScheduleVersion.semester, ScheduleVersion.week_number, ScheduleVersion.version
+        )
+    }
+    data = reference_cache.get_reference_data()
+    names = data.names
+    report = {'weeks': [], 'main': [], 'dimensions': False}
+
+    for semester in schedule_versions.SEMESTERS:
+        weeks_in_db = {
+            week for (week,) in db.session.query(ScheduleEntry.week_number).filter(
+                ScheduleEntry.semester == semester
+            ).distinct()
+        }
+        year, start = _semester_run(state, semester, freeze=bool(weeks_in_db))
+        prefix = f'{year}:{schedule_versions.CURRENT}:{semester}:'
+
+        generation_key = f'{prefix}0'
+        generation = counters.get((schedule_versions.CURRENT, semester, 0), 0)
+        regenerate = versions.get(generation_key) != generation
+
+        todo = sorted(
+            week for week in weeks_in_db
+            if regenerate or versions.get(f'{prefix}{week}') != counters.get((schedule_versions.CURRENT, semester, week), 0)
+        )
+
+        if todo:
+            by_week = {week: [] for week in todo}
+            rows = db.session.query(
+                ScheduleEntry.id, ScheduleEntry.week_number, ScheduleEntry.day, ScheduleEntry.lesson_number,
+                ScheduleEntry.group_id, ScheduleEntry.subject_id, ScheduleEntry.teacher_id, ScheduleEntry.room_id,
+                ScheduleEntry.is_changed
+            ).filter(
+                ScheduleEntry.semester == semester,
+                ScheduleEntry.week_number.in_(todo)
+            ).order_by(ScheduleEntry.week_number, ScheduleEntry.id).yield_per(FETCH_SIZE)
+            for row in rows:
+                by_week[row[1]].append(row)
+
+            for week, week_rows in by_week.items():
+                if not week_rows:
+                    continue  # неделю очистили между запросами — прежняя выгрузка остается
+                directory = _week_dir(root, year, semester, week)
+                _write(_current_table(week_rows, names, start), os.path.join(directory, f'part{extension}'), file_format)
+                versions[f'{prefix}{week}'] = counters.get((schedule_versions.CURRENT, semester, week), 0)
+                report['weeks'].append({'year': year, 'semester': semester, 'week': week, 'rows': len(week_rows)})
+        versions[generation_key] = generation
+
+        main_key = f'{year}:{schedule_versions.MAIN}:{semester}'
+        main_version = counters.get((schedule_versions.MAIN, semester, 0), 0)
+        if versions.get(main_key) != main_version:
+            rows = db.session.query(
+                MainScheduleEntry.id, MainScheduleEntry.day, MainScheduleEntry.lesson_number,
+                MainScheduleEntry.group_id, MainScheduleEntry.subject_id, MainScheduleEntry.teacher_id,
+                MainScheduleEntry.room_id, MainScheduleEntry.week_parity
+            ).filter(MainScheduleEntry.semester == semester).order_by(MainScheduleEntry.id).all()
+            path = os.path.join(root, 'main_schedule_entry', f'year={year}', f'semester={semester}', f'part{extension}')
+            _write(_main_table(rows, names), path, file_format)
+            versions[main_key] = main_version
+            report['main'].append({'year': year, 'semester': semester, 'rows': len(rows)})
+
+    if state.get('ref_etag') != data.etag:
+        for kind, table in _dimension_tables().items():
+            _write(table, os.path.join(root, 'dimensions', f'{kind}{extension}'), file_format)
+        state['ref_etag'] = data.etag
+        report['dimensions'] = True
+
+    tmp = f'{state_path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, state_path)
+    return report
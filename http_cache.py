@@ -0,0 +1,100 @@
+# http_cache.py
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+# Ответы короче этого размера не сжимаем — выигрыш меньше накладных расходов
+GZIP_MIN_SIZE = 1024
+GZIP_CACHE_SIZE = 256
+
+_gzip_lock = threading.Lock()
+_gzip_cache = OrderedDict()
+
+
+def content_etag(body):
+    """ETag по содержимому ответа"""
+    return hashlib.sha1(body).hexdigest()[:20]
+
+
+def is_not_modified(etag, last_modified=None):
+    """If-None-Match важнее If-Modified-Since (RFC 9110)"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _cache_control(private):
+    return 'private, no-cache' if private else 'no-cache'
+
+
+def not_modified_response(etag, private=False, last_modified=None):
+    response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = _cache_control(private)
+    return response
+
+
+def gzip_bytes(body, key):
+    """Сжатое представление ответа, закэшированное по (URL, ETag)"""
+    with _gzip_lock:
+        compressed = _gzip_cache.get(key)
+        if compressed is not None:
+            _gzip_cache.move_to_end(key)
+            return compressed
+
+    compressed = gzip.compress(body, compresslevel=6)
+
+    with _gzip_lock:
+        _gzip_cache[key] = compressed
+        while len(_gzip_cache) > GZIP_CACHE_SIZE:
+            _gzip_cache.popitem(last=False)
+    return compressed
+
+
+def lazy_response(etag, build, mimetype='application/json', compress=False, private=False, last_modified=None):
+    """Условный ответ, тело которого строится только при необходимости.
+
+    Если у клиента уже есть эта версия (If-None-Match), отвечаем 304,
+    не вызывая build(). Cache-Control: no-cache заставляет браузер каждый
+    раз сверять ETag. При compress=True ответ сжимается gzip, если клиент
+    это поддерживает; у сжатого представления свой ETag. last_modified
+    (datetime с точностью до секунды) добавляет Last-Modified для клиентов,
+    которые присылают только If-Modified-Since.
+    """
+    use_gzip = compress and 'gzip' in request.accept_encodings
+    if use_gzip:
+        etag = f'{etag}-gz'
+
+    if is_not_modified(etag, last_modified):
+        response = not_modified_response(etag, private, last_modified)
+    else:
+        body = build()
+        compressed = use_gzip and len(body) >= GZIP_MIN_SIZE
+        if compressed:
+            # ETag версии недели общий для всех ее дней, поэтому ключ — с URL
+            body = gzip_bytes(body, (request.full_path, etag))
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = _cache_control(private)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+
+    if compress:
+        response.vary.add('Accept-Encoding')
+    if private:
+        response.vary.add('Cookie')
+    return response
+
+
+def bytes_response(body, etag, mimetype='application/json', compress=False, private=False, last_modified=None):
+    """Отдать заранее сериализованный ответ с ETag (см. lazy_response)"""
+    return lazy_response(etag, lambda: body, mimetype, compress, private, last_modified)
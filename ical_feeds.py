@@ -0,0 +1,278 @@
+# ical_feeds.py
+import re
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from models import db, ScheduleEntry, MainScheduleEntry
+from pairs import get_pair_number_by_lesson, get_lesson_pair_time
+from http_cache import bytes_response
+import change_journal
+import reference_cache
+import schedule_payloads
+import schedule_versions
+import settings_service
+import timetables
+
+ICS_MIMETYPE = 'text/calendar; charset=utf-8'
+
+UID_DOMAIN = 'schedule'
+
+# Начало семестров по умолчанию (месяц, день), если дата не задана в настройках
+DEFAULT_SEMESTER_STARTS = {1: (9, 1), 2: (1, 12)}
+
+# Часовой пояс, в котором заданы времена пар (если не указан COLLEGE_TIMEZONE)
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+TIME_RANGE = re.compile(r'(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})')
+
+
+class Feed(timetables.Grid):
+    """Готовый календарь одной группы / преподавателя / аудитории"""
+
+    def __init__(self, seq, ref_etag, settings_version, weeks, entry_ids, body):
+        super().__init__(seq, ref_etag, entry_ids, body)
+        self.settings_version = settings_version
+        self.weeks = weeks
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+feed_cache = timetables.GridCache()
+_options = {'weeks_back': 2, 'weeks_ahead': 8, 'timezone': ZoneInfo(DEFAULT_TIMEZONE)}
+
+
+def init_ical_feeds(app):
+    feed_cache.max_entries = app.config.get('ICAL_CACHE_MAX_ENTRIES', 2048)
+    _options['weeks_back'] = app.config.get('ICAL_WEEKS_BACK', 2)
+    _options['weeks_ahead'] = app.config.get('ICAL_WEEKS_AHEAD', 8)
+    _options['timezone'] = ZoneInfo(app.config.get('COLLEGE_TIMEZONE', DEFAULT_TIMEZONE))
+
+
+def default_semester_start(semester):
+    """Дата начала семестра по умолчанию в текущем учебном году"""
+    today = date.today()
+    first_year = today.year if today.month >= 8 else today.year - 1
+    month, day = DEFAULT_SEMESTER_STARTS.get(semester, DEFAULT_SEMESTER_STARTS[1])
+    return date(first_year if month >= 8 else first_year + 1, month, day)
+
+
+def seed_semester_starts():
+    """Записать даты начала семестров по умолчанию, если они не заданы.
+
+    Вызывается при запуске: дальше дата хранится в настройках и не
+    зависит от текущего дня (меняется только через set_semester_start).
+    """
+    seeded = False
+    for semester in DEFAULT_SEMESTER_STARTS:
+        if not settings_service.get_setting(f'semester{semester}_start'):
+            settings_service.set_setting(f'semester{semester}_start', default_semester_start(semester).isoformat())
+            seeded = True
+    return seeded
+
+
+def semester_start(semester):
+    """Дата начала семестра из настройки semester<N>_start (ГГГГ-ММ-ДД),
+    которую seed_semester_starts заполняет при запуске"""
+    value = settings_service.get_setting(f'semester{semester}_start')
+    if value:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    return default_semester_start(semester)
+
+
+def lesson_date(start, week, day):
+    """Неделя 1 начинается с понедельника недели, в которую попадает start"""
+    monday = start - timedelta(days=start.weekday())
+    return monday + timedelta(weeks=week - 1, days=schedule_payloads.DAY_INDEX[day])
+
+
+def _escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Переносы строк длиннее 75 октетов (RFC 5545, 3.1)"""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line
+    parts = []
+    while data:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1  # не режем многобайтовый символ
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+    return '\r\n '.join(parts)
+
+
+def _timestamp(day, hour, minute):
+    """Местное время пары -> время UTC с Z (RFC 5545, 3.3.5): «плавающее» время
+    без пояса клиент показал бы в своем часовом поясе"""
+    local = datetime(day.year, day.month, day.day, hour, minute, tzinfo=_options['timezone'])
+    return local.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _week_plan(semester, current_week):
+    """Недели ленты: [(неделя, взять ли текущее расписание)].
+
+    Недели, для которых текущее расписание уже составлено, берутся из него,
+    остальные — из основного расписания с учетом четности.
+    """
+    weeks = list(range(max(1, current_week - _options['weeks_back']), current_week + _options['weeks_ahead'] + 1))
+    filled = {
+        week for (week,) in db.session.query(ScheduleEntry.week_number).filter(
+            ScheduleEntry.semester == semester,
+            ScheduleEntry.week_number.between(weeks[0], weeks[-1])
+        ).distinct()
+    }
+    return [(week, week in filled) for week in weeks]
+
+
+def _collect(kind, entity_id, semester, plan):
+    """Занятия сущности по неделям: ({слот: [занятия]}, id записей).
+
+    Уроки одной пары с тем же предметом, преподавателем и аудиторией
+    сливаются в одно событие (у разных групп потока — тоже).
+    """
+    column = timetables.KINDS[kind][1]
+    filled = [week for week, is_filled in plan if is_filled]
+    projected = [week for week, is_filled in plan if not is_filled]
+    lessons = []
+    entry_ids = set()
+
+    if filled:
+        rows = db.session.query(
+            ScheduleEntry.id, ScheduleEntry.week_number, ScheduleEntry.day, ScheduleEntry.lesson_number,
+            ScheduleEntry.group_id, ScheduleEntry.subject_id, ScheduleEntry.teacher_id, ScheduleEntry.room_id
+        ).filter(
+            ScheduleEntry.semester == semester,
+            ScheduleEntry.week_number.in_(filled),
+            getattr(ScheduleEntry, column) == entity_id
+        )
+        for entry_id, week, *rest in rows:
+            entry_ids.add((schedule_versions.CURRENT, entry_id))
+            lessons.append((week, False, *rest))
+
+    if projected:
+        rows = db.session.query(
+            MainScheduleEntry.id, MainScheduleEntry.day, MainScheduleEntry.lesson_number,
+            MainScheduleEntry.group_id, MainScheduleEntry.subject_id, MainScheduleEntry.teacher_id,
+            MainScheduleEntry.room_id, MainScheduleEntry.week_parity
+        ).filter(
+            MainScheduleEntry.semester == semester,
+            getattr(MainScheduleEntry, column) == entity_id
+        ).all()
+        for entry_id, day, lesson, group_id, subject_id, teacher_id, room_id, parity in rows:
+            entry_ids.add((schedule_versions.MAIN, entry_id))
+            for week in projected:
+                week_parity = 'even' if week % 2 == 0 else 'odd'
+                if parity in (None, 'both', week_parity):
+                    lessons.append((week, True, day, lesson, group_id, subject_id, teacher_id, room_id))
+
+    events = {}
+    for week, projected_lesson, day, lesson, group_id, subject_id, teacher_id, room_id in lessons:
+        if day not in schedule_payloads.DAY_INDEX:
+            continue
+        key = (week, schedule_payloads.DAY_INDEX[day], get_pair_number_by_lesson(day, lesson), subject_id, teacher_id, room_id)
+        event = events.setdefault(key, {'day': day, 'lessons': set(), 'groups': set(), 'projected': projected_lesson})
+        event['lessons'].add(lesson)
+        event['groups'].add(group_id)
+    return events, frozenset(entry_ids)
+
+
+def build_feed(kind, entity_id, semester, plan):
+    """Текст календаря (байты) и id записей, из которых он собран"""
+    names = reference_cache.get_reference_data().names
+    entity_name = names[timetables.KINDS[kind][0]].get(entity_id, '')
+    events, entry_ids = _collect(kind, entity_id, semester, plan)
+    start = semester_start(semester)
+    # DTSTAMP из данных, а не из текущего времени: пересборка без изменений
+    # дает то же тело и тот же ETag, и клиенты получают 304
+    stamp = f'{start:%Y%m%d}T000000Z'
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Schedule//Timetable//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(f"Расписание: {entity_name}")}',
+        f'X-WR-TIMEZONE:{_options["timezone"].key}',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+        'X-PUBLISHED-TTL:PT1H'
+    ]
+
+    for key in sorted(events):
+        week, _, pair, subject_id, teacher_id, room_id = key
+        event = events[key]
+        match = TIME_RANGE.search(get_lesson_pair_time(event['day'], min(event['lessons'])) or '')
+        if match is None:
+            continue
+        start_hour, start_minute, end_hour, end_minute = (int(part) for part in match.groups())
+        day = lesson_date(start, week, event['day'])
+
+        subject = names['subjects'].get(subject_id, '')
+        groups = ', '.join(sorted(names['groups'].get(group_id, '') for group_id in event['groups']))
+        summary = subject if kind == 'group' else f'{subject} — {groups}'
+        description = [
+            f'Пара {pair}',
+            f'Преподаватель: {names["teachers"].get(teacher_id, "")}',
+            f'Группы: {groups}'
+        ]
+        if event['projected']:
+            description.append('По основному расписанию, возможны изменения')
+
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:{kind}{entity_id}-{day:%Y%m%d}-{pair}-{subject_id}-{teacher_id}-{room_id}@{UID_DOMAIN}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{_timestamp(day, start_hour, start_minute)}',
+            f'DTEND:{_timestamp(day, end_hour, end_minute)}',
+            f'SUMMARY:{_escape(summary)}',
+            f'LOCATION:{_escape("ауд. " + names["rooms"].get(room_id, ""))}',
+            f'DESCRIPTION:{_escape(chr(10).join(description))}',
+            'END:VEVENT'
+        ]
+
+    lines.append('END:VCALENDAR')
+    body = '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+    return body.encode('utf-8'), entry_ids
+
+
+def get_feed(kind, entity_id):
+    """Календарь из кэша; пересобирается, только если в журнале изменений
+    есть правки этой сущности, сменились справочники или настройки
+    (текущая неделя, семестр, даты начала)"""
+    semester = settings_service.get_current_semester()
+    key = (kind, entity_id)
+
+    latest = change_journal.journal_bounds()[1]
+    ref_etag = reference_cache.get_reference_data().etag
+    settings_version = settings_service.get_settings_version()
+
+    feed = feed_cache.get(key)
+    if feed is not None and feed.ref_etag == ref_etag and feed.settings_version == settings_version:
+        if feed.seq == latest:
+            return feed
+        if not change_journal.entity_changed(
+            feed.seq, latest, timetables.KINDS[kind][1], entity_id, feed.entry_ids, semester, weeks=feed.weeks
+        ):
+            feed.seq = latest
+            return feed
+
+    plan = _week_plan(semester, settings_service.get_current_week())
+    body, entry_ids = build_feed(kind, entity_id, semester, plan)
+    previous = feed
+    feed = Feed(latest, ref_etag, settings_version, [week for week, _ in plan], entry_ids, body)
+    if previous is not None and previous.etag == feed.etag:
+        feed.last_modified = previous.last_modified  # содержимое не изменилось
+    feed_cache.put(key, feed)
+    return feed
+
+
+def feed_response(kind, entity_id):
+    feed = get_feed(kind, entity_id)
+    return bytes_response(feed.body, feed.etag, ICS_MIMETYPE, compress=True, last_modified=feed.last_modified)
@@ -0,0 +1,228 @@
+# main_schedule_import.py
+import re
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from models import db, MainScheduleEntry
+from initial_data import AVAILABLE_DAYS
+from pairs import get_lessons_in_pair
+import reference_cache
+import schedule_batch
+import schedule_versions
+
+# При конфликте: прервать весь импорт или пропустить конфликтующие занятия
+POLICIES = ('abort', 'skip')
+
+PARITY_SUFFIXES = {'чет': 'even', 'нечет': 'odd'}
+
+# "3. Математика (чет.)" — номер урока и четность необязательны
+SUBJECT_LINE = re.compile(r'^(?:(\d+)\.\s*)?(.+?)(?:\s*\((чет|нечет)\.\))?$')
+ROOM_SEPARATOR = ', ауд.'
+PAIR_HEADER = re.compile(r'Пара\s*(\d+)')
+
+CONFLICT_MESSAGES = {
+    'group': 'Группа уже занята',
+    'teacher': 'Преподаватель уже занят',
+    'room': 'Аудитория уже занята'
+}
+
+
+class ImportFileError(Exception):
+    """Файл не удалось разобрать целиком (нет листов дней, нет заголовка)"""
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _parse_cell(text, day, pair):
+    """Текст ячейки -> [(урок, предмет, преподаватель, аудитория, четность)].
+
+    Ячейка в формате выгрузки: на каждое занятие две строки —
+    "урок. Предмет (чет.)" и "Преподаватель, ауд. Аудитория". Без номера
+    урока занятие ставится на все уроки пары.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) % 2:
+        raise ValueError('Ожидаются строки «Предмет» и «Преподаватель, ауд. Аудитория»')
+
+    pair_lessons = get_lessons_in_pair(day, pair)
+    lessons = []
+    for subject_line, place_line in zip(lines[::2], lines[1::2]):
+        match = SUBJECT_LINE.match(subject_line)
+        number, subject, parity = match.group(1), match.group(2).strip(), match.group(3)
+
+        if ROOM_SEPARATOR not in place_line:
+            raise ValueError(f'Ожидается «Преподаватель{ROOM_SEPARATOR} Аудитория»: {place_line}')
+        teacher, room = (part.strip() for part in place_line.rsplit(ROOM_SEPARATOR, 1))
+
+        if number is None:
+            numbers = pair_lessons
+        elif int(number) in pair_lessons:
+            numbers = [int(number)]
+        else:
+            raise ValueError(f'Урок {number} не относится к паре {pair}')
+
+        for lesson in numbers:
+            lessons.append((lesson, subject, teacher, room, PARITY_SUFFIXES.get(parity, 'both')))
+    return lessons
+
+
+def parse_workbook(file):
+    """Прочитать сетку основного расписания.
+
+    Лист на каждый день (название листа — день недели), первая строка —
+    заголовки "Пара N", в колонке A — группы. Возвращает (занятия, ошибки).
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    rows = []
+    errors = []
+
+    day_sheets = [sheet for sheet in workbook.worksheets if sheet.title.strip() in AVAILABLE_DAYS]
+    if not day_sheets:
+        raise ImportFileError(f'Нет листов с названиями дней: {", ".join(AVAILABLE_DAYS)}')
+
+    for sheet in day_sheets:
+        day = sheet.title.strip()
+        values = sheet.iter_rows(values_only=True)
+        header = next(values, None) or ()
+
+        pairs = {}
+        for column, title in enumerate(header):
+            match = PAIR_HEADER.search(_text(title))
+            if match and column > 0:
+                pairs[column] = int(match.group(1))
+        if not pairs:
+            errors.append({'sheet': day, 'cell': 'A1', 'message': 'Нет колонок «Пара N»'})
+            continue
+
+        for row_number, row in enumerate(values, start=2):
+            group = _text(row[0]) if row else ''
+            if not group:
+                continue
+            for column, pair in pairs.items():
+                text = _text(row[column]) if column < len(row) else ''
+                if not text:
+                    continue
+                cell = f'{get_column_letter(column + 1)}{row_number}'
+                try:
+                    lessons = _parse_cell(text, day, pair)
+                except ValueError as e:
+                    errors.append({'sheet': day, 'cell': cell, 'message': str(e)})
+                    continue
+                for lesson, subject, teacher, room, parity in lessons:
+                    rows.append({
+                        'sheet': day, 'cell': cell, 'day': day, 'lesson_number': lesson,
+                        'group': group, 'subject': subject, 'teacher': teacher, 'room': room,
+                        'week_parity': parity
+                    })
+
+    workbook.close()
+    return rows, errors
+
+
+def resolve_names(rows):
+    """Имена -> id одним проходом по словарям справочников; ошибки по ячейкам"""
+    ids = reference_cache.get_reference_data().ids
+    errors = []
+    reported = set()
+
+    for row in rows:
+        for field, kind in schedule_batch.REFERENCE_FIELDS.items():
+            value = ids[kind].get(row[field])
+            row[f'{field}_id'] = value
+            if value is None and (row['sheet'], row['cell'], field) not in reported:
+                reported.add((row['sheet'], row['cell'], field))
+                errors.append({'sheet': row['sheet'], 'cell': row['cell'], 'message': f'Не найдено: {row[field]}'})
+
+        if (row['day'] in schedule_batch.ZERO_LESSON_DAYS and row['lesson_number'] == 0
+                and row['subject'] != schedule_batch.ZERO_LESSON_SUBJECT):
+            errors.append({
+                'sheet': row['sheet'], 'cell': row['cell'],
+                'message': f'На 0 урок можно поставить только "{schedule_batch.ZERO_LESSON_SUBJECT}"'
+            })
+    return errors
+
+
+def find_conflicts(rows, semester, policy, replace_groups):
+    """Проверить пересечения групп, преподавателей и аудиторий в памяти.
+
+    Занятия файла проверяются по порядку против основного расписания
+    семестра и уже принятых строк файла (с учетом четности). При policy
+    'skip' конфликтующее занятие не принимается; при 'abort' принимается,
+    чтобы отчет содержал все конфликты файла.
+    Возвращает (принятые строки, конфликты).
+    """
+    view = schedule_batch.OccupancyView(schedule_versions.MAIN, semester)
+    if replace_groups:
+        for entry_id, record in list(view.entries.items()):
+            if record[2] in replace_groups:
+                view.remove(entry_id)
+
+    accepted = []
+    conflicts = []
+    for index, row in enumerate(rows):
+        record = (row['day'], row['lesson_number'], row['group_id'], row['teacher_id'], row['room_id'], row['week_parity'])
+        found = view.conflicts(record)
+        if found:
+            # Отрицательные id — занятия из этого же файла
+            others = sorted({rows[-other - 1]['cell'] for ids in found.values() for other in ids if other < 0})
+            conflicts.append({
+                'sheet': row['sheet'],
+                'cell': row['cell'],
+                'lesson_number': row['lesson_number'],
+                'kinds': sorted(found),
+                'message': '; '.join(CONFLICT_MESSAGES[kind] for kind in sorted(found)) +
+                           (f' (ячейки {", ".join(others)})' if others else ' (в расписании)')
+            })
+            if policy == 'skip':
+                continue
+        view.place(-index - 1, record)
+        accepted.append(row)
+    return accepted, conflicts
+
+
+def import_main_schedule(file, semester, policy='abort', replace=False, dry_run=False):
+    """Импорт основного расписания из xlsx в текущей транзакции (commit — за вызывающим кодом).
+
+    replace — сначала удалить основное расписание семестра для групп из
+    файла. Ошибки разбора и неизвестные имена всегда прерывают импорт,
+    конфликты — в зависимости от policy.
+    """
+    rows, errors = parse_workbook(file)
+    errors += resolve_names(rows)
+    report = {'rows': len(rows), 'inserted': 0, 'skipped': 0, 'replaced': 0, 'errors': errors, 'conflicts': []}
+    if errors:
+        return report
+
+    replace_groups = {row['group_id'] for row in rows} if replace else set()
+    accepted, conflicts = find_conflicts(rows, semester, policy, replace_groups)
+    report['conflicts'] = conflicts
+    report['skipped'] = len(rows) - len(accepted)
+    if (conflicts and policy == 'abort') or dry_run:
+        return report
+
+    if replace_groups:
+        report['replaced'] = MainScheduleEntry.query.filter(
+            MainScheduleEntry.semester == semester,
+            MainScheduleEntry.group_id.in_(replace_groups)
+        ).delete(synchronize_session=False)
+
+    db.session.bulk_insert_mappings(MainScheduleEntry, [
+        {
+            'group_id': row['group_id'],
+            'subject_id': row['subject_id'],
+            'teacher_id': row['teacher_id'],
+            'room_id': row['room_id'],
+            'day': row['day'],
+            'lesson_number': row['lesson_number'],
+            'week_parity': row['week_parity'],
+            'semester': semester
+        }
+        for row in accepted
+    ])
+    report['inserted'] = len(accepted)
+    if accepted or report['replaced']:
+        schedule_versions.bump_main(semester)
+    return report
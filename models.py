@@ -47,6 +47,11 @@ class Room(db.Model):
         return f'<Room {self.name}>'
 
 class TeacherSubject(db.Model):
+    """Какие предметы может вести преподаватель (квалификация)"""
+    __table_args__ = (
+        db.Index('ix_teacher_subject_pair', 'subject_id', 'teacher_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
@@ -82,6 +87,16 @@ class GroupPractice(db.Model):
     room = db.relationship('Room', backref=db.backref('practices', lazy=True))
 
 class ScheduleEntry(db.Model):
+    __table_args__ = (
+        # Проверка занятости слота группы одним индексным запросом
+        db.Index('ix_schedule_entry_group_slot', 'semester', 'week_number', 'group_id', 'day', 'lesson_number'),
+        # Выборка расписания преподавателя или аудитории за неделю
+        db.Index('ix_schedule_entry_teacher', 'semester', 'week_number', 'teacher_id', 'day'),
+        db.Index('ix_schedule_entry_room', 'semester', 'week_number', 'room_id', 'day'),
+        # Все занятия преподавателя за диапазон недель (планирование замен)
+        db.Index('ix_schedule_entry_teacher_weeks', 'teacher_id', 'semester', 'week_number'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
@@ -101,6 +116,12 @@ class ScheduleEntry(db.Model):
     room = db.relationship('Room', backref=db.backref('schedule_entries', lazy=True))
 
 class MainScheduleEntry(db.Model):
+    __table_args__ = (
+        db.Index('ix_main_schedule_entry_group_slot', 'semester', 'group_id', 'day', 'lesson_number'),
+        db.Index('ix_main_schedule_entry_teacher', 'semester', 'teacher_id', 'day'),
+        db.Index('ix_main_schedule_entry_room', 'semester', 'room_id', 'day'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
@@ -129,4 +150,61 @@ class AutoFillLog(db.Model):
 
 class AppSettings(db.Model):
     key = db.Column(db.String(50), primary_key=True)
-    value = db.Column(db.String(100), nullable=False)
\ No newline at end of file
+    value = db.Column(db.String(100), nullable=False)
+
+class ScheduleVersion(db.Model):
+    """Счетчик изменений расписания.
+
+    scope='current', week_number>0 — неделя текущего расписания;
+    scope='current', week_number=0 — поколение всего семестра (массовые удаления);
+    scope='main', week_number=0 — основное расписание семестра.
+    """
+    scope = db.Column(db.String(10), primary_key=True)
+    semester = db.Column(db.Integer, primary_key=True)
+    week_number = db.Column(db.Integer, primary_key=True, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ScheduleChange(db.Model):
+    """Журнал изменений ScheduleEntry / MainScheduleEntry для дельта-синхронизации.
+
+    op: add / update / delete для отдельных записей, refresh — массовое
+    изменение ключа (semester, week_number), после которого клиент
+    перезагружает эту неделю (или основное расписание) целиком.
+    """
+    __tablename__ = 'schedule_change'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(10), nullable=False)
+    scope = db.Column(db.String(10), nullable=False)
+    semester = db.Column(db.Integer, nullable=False)
+    week_number = db.Column(db.Integer, nullable=True)
+    entry_id = db.Column(db.Integer, nullable=True)
+    day = db.Column(db.String(20), nullable=True)
+    lesson_number = db.Column(db.Integer, nullable=True)
+    group_id = db.Column(db.Integer, nullable=True)
+    subject_id = db.Column(db.Integer, nullable=True)
+    teacher_id = db.Column(db.Integer, nullable=True)
+    room_id = db.Column(db.Integer, nullable=True)
+    # Прежние неделя, группа и преподаватель для update (если менялись)
+    old_week_number = db.Column(db.Integer, nullable=True)
+    old_group_id = db.Column(db.Integer, nullable=True)
+    old_teacher_id = db.Column(db.Integer, nullable=True)
+    flags = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ScheduleStat(db.Model):
+    """Сводка текущего расписания за неделю по группе или преподавателю.
+
+    Поддерживается при записи (schedule_stats.py), страницы статистики
+    читают ее вместо подсчета записей ScheduleEntry.
+    """
+    __tablename__ = 'schedule_stats'
+
+    semester = db.Column(db.Integer, primary_key=True)
+    week_number = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # group / teacher
+    entity_id = db.Column(db.Integer, primary_key=True)
+    lessons = db.Column(db.Integer, nullable=False, default=0)
+    changed_lessons = db.Column(db.Integer, nullable=False, default=0)
+    hours = db.Column(db.Integer, nullable=False, default=0)
\ No newline at end of file
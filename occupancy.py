@@ -0,0 +1,229 @@
+# occupancy.py
+import threading
+from collections import OrderedDict
+
+from models import db, ScheduleEntry
+import reference_cache
+import schedule_versions
+
+# Категория аудитории по началу названия; остальные — обычные кабинеты
+ROOM_CATEGORIES = (
+    ('Компьютерный класс', 'computer'),
+    ('Лаборатория', 'lab'),
+    ('Спортзал', 'gym'),
+    ('Актовый зал', 'hall'),
+    ('Библиотека', 'library'),
+    ('Мастерская', 'workshop'),
+    ('Музыкальный класс', 'music')
+)
+DEFAULT_CATEGORY = 'classroom'
+CATEGORIES = (DEFAULT_CATEGORY,) + tuple(category for prefix, category in ROOM_CATEGORIES)
+
+
+def room_category(name):
+    for prefix, category in ROOM_CATEGORIES:
+        if name.startswith(prefix):
+            return category
+    return DEFAULT_CATEGORY
+
+
+class RoomMasks:
+    """Битовые маски аудиторий (бит = id аудитории) для снимка справочников"""
+
+    def __init__(self, etag, rooms):
+        self.etag = etag
+        self.names = rooms
+        self.all = 0
+        self.categories = {category: 0 for category in CATEGORIES}
+        for room_id, name in rooms.items():
+            bit = 1 << room_id
+            self.all |= bit
+            self.categories[room_category(name)] |= bit
+
+
+# Что отслеживается в занятости недели
+FIELDS = ('room', 'teacher')
+
+
+class WeekOccupancy:
+    """Занятость аудиторий и преподавателей недели: битовая карта на каждый (день, урок).
+
+    Для каждого слота хранится счетчик занятий по аудиториям и
+    преподавателям (занятость может быть двойной по ошибке), а битовая
+    карта пересчитывается из счетчика при изменении слота. Дополнительно
+    считается число занятий за неделю (нагрузка).
+    """
+
+    def __init__(self, version):
+        self.version = version                       # (поколение семестра, версия недели) из ScheduleVersion
+        self.counts = {field: {} for field in FIELDS}   # field -> (day, lesson) -> {id: n}
+        self.bitmaps = {field: {} for field in FIELDS}  # field -> (day, lesson) -> int
+        self.totals = {field: {} for field in FIELDS}   # field -> {id: занятий за неделю}
+
+    def _add(self, field, slot, value, delta):
+        counts = self.counts[field].setdefault(slot, {})
+        bitmaps = self.bitmaps[field]
+        n = counts.get(value, 0) + delta
+        if n > 0:
+            counts[value] = n
+            bitmaps[slot] = bitmaps.get(slot, 0) | (1 << value)
+        else:
+            counts.pop(value, None)
+            bitmaps[slot] = bitmaps.get(slot, 0) & ~(1 << value)
+
+        totals = self.totals[field]
+        total = totals.get(value, 0) + delta
+        if total > 0:
+            totals[value] = total
+        else:
+            totals.pop(value, None)
+
+    def add(self, day, lesson, room_id, teacher_id, delta=1):
+        self._add('room', (day, lesson), room_id, delta)
+        self._add('teacher', (day, lesson), teacher_id, delta)
+
+    def busy(self, field, day, lessons):
+        bitmaps = self.bitmaps[field]
+        bitmap = 0
+        for lesson in lessons:
+            bitmap |= bitmaps.get((day, lesson), 0)
+        return bitmap
+
+    def load(self, teacher_id):
+        return self.totals['teacher'].get(teacher_id, 0)
+
+
+_lock = threading.Lock()
+_weeks = OrderedDict()  # (semester, week) -> WeekOccupancy
+_masks = None
+
+MAX_WEEKS = 64
+
+
+def _build_week(semester, week, version):
+    occupancy = WeekOccupancy(version)
+    rows = ScheduleEntry.query.with_entities(
+        ScheduleEntry.day, ScheduleEntry.lesson_number, ScheduleEntry.room_id, ScheduleEntry.teacher_id
+    ).filter(
+        ScheduleEntry.semester == semester,
+        ScheduleEntry.week_number == week
+    )
+    for day, lesson, room_id, teacher_id in rows:
+        occupancy.add(day, lesson, room_id, teacher_id)
+    return occupancy
+
+
+def _uncommitted():
+    """Есть ли в текущей транзакции незакоммиченные правки расписания"""
+    session = db.session
+    if schedule_versions.pending_events(session):
+        return True
+    return any(
+        isinstance(obj, ScheduleEntry)
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    )
+
+
+def get_week(semester, week):
+    """Занятость недели; сверка с версией в БД — один запрос по первичному ключу.
+
+    Внутри транзакции с незакоммиченными правками (пакет, проверка без
+    применения) неделя собирается без кэша: после отката кэш иначе
+    показывал бы несуществующие занятия.
+    """
+    version = schedule_versions.get_week_version(semester, week)
+    key = (semester, week)
+
+    if _uncommitted():
+        return _build_week(semester, week, version)
+
+    with _lock:
+        occupancy = _weeks.get(key)
+        if occupancy is not None and occupancy.version == version:
+            _weeks.move_to_end(key)
+            return occupancy
+
+    occupancy = _build_week(semester, week, version)
+    with _lock:
+        _weeks[key] = occupancy
+        _weeks.move_to_end(key)
+        while len(_weeks) > MAX_WEEKS:
+            _weeks.popitem(last=False)
+    return occupancy
+
+
+def bits(mask):
+    """id из битовой маски по возрастанию"""
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
+
+
+def get_masks():
+    global _masks
+    data = reference_cache.get_reference_data()
+    masks = _masks
+    if masks is None or masks.etag != data.etag:
+        masks = _masks = RoomMasks(data.etag, data.names['rooms'])
+    return masks
+
+
+def free_rooms(semester, week, day, lessons, category=None):
+    """Аудитории, свободные на всех уроках lessons: [{id, name, category}]"""
+    masks = get_masks()
+    candidates = masks.all if category is None else masks.categories[category]
+    free = candidates & ~get_week(semester, week).busy('room', day, lessons)
+
+    rooms = []
+    for room_id in bits(free):
+        name = masks.names[room_id]
+        rooms.append({'id': room_id, 'name': name, 'category': room_category(name)})
+    return rooms
+
+
+@schedule_versions.add_commit_listener
+def _apply_changes(changes, events):
+    """Обновить занятость по событиям своего commit без перечитывания недели.
+
+    Версия недели в БД увеличивается на 1 за транзакцию, поэтому ожидаемая
+    версия сдвигается так же. Если между сборкой и commit неделю успел
+    изменить другой воркер, версии не совпадут и неделя пересоберется.
+    """
+    with _lock:
+        for event in events:
+            if event['type'] != schedule_versions.CURRENT:
+                continue
+
+            if event['op'] == 'refresh':
+                for key in list(_weeks):
+                    if key[0] == event['semester'] and event['week'] in (None, key[1]):
+                        del _weeks[key]
+                continue
+
+            occupancy = _weeks.get((event['semester'], event['week']))
+            if occupancy is None:
+                continue
+
+            if event['op'] == 'add':
+                occupancy.add(event['day'], event['lesson'], event['room_id'], event['teacher_id'])
+            elif event['op'] == 'delete':
+                occupancy.add(event['day'], event['lesson'], event['room_id'], event['teacher_id'], -1)
+            else:
+                old = event.get('old', {})
+                occupancy.add(
+                    old.get('day', event['day']),
+                    old.get('lesson', event['lesson']),
+                    old.get('room_id', event['room_id']),
+                    old.get('teacher_id', event['teacher_id']),
+                    -1
+                )
+                occupancy.add(event['day'], event['lesson'], event['room_id'], event['teacher_id'])
+
+        for scope, semester, week in changes:
+            if scope != schedule_versions.CURRENT or not week:
+                continue
+            occupancy = _weeks.get((semester, week))
+            if occupancy is not None:
+                generation, version = occupancy.version
+                occupancy.version = (generation, version + 1)
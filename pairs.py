@@ -0,0 +1,66 @@
+# pairs.py
+# Пары и уроки. Сетка пар дня и время уроков — в initial_data (одна копия
+# таблиц), здесь только то, что относится к парам.
+from initial_data import get_available_pairs, get_lesson_time
+
+get_available_pairs_for_day = get_available_pairs
+
+def get_pair_number_by_lesson(day, lesson_number):
+    if lesson_number == 0:
+        return 0
+    elif day == "Суббота":
+        if lesson_number in [1, 2]:
+            return 1
+        elif lesson_number in [3, 4]:
+            return 2
+        elif lesson_number in [5, 6]:
+            return 3
+        elif lesson_number in [7, 8]:
+            return 4
+    else:
+        if lesson_number in [1, 2]:
+            return 1
+        elif lesson_number in [3, 4]:
+            return 2
+        elif lesson_number in [5, 6]:
+            return 3
+        elif lesson_number in [7, 8]:
+            return 4
+        elif lesson_number in [9, 10]:
+            return 5
+        elif lesson_number in [11, 12]:
+            return 6
+    return 0
+
+def get_lessons_in_pair(day, pair):
+    if pair == 0:
+        return [0]
+    elif pair == 1:
+        return [1, 2]
+    elif pair == 2:
+        return [3, 4]
+    elif pair == 3:
+        return [5, 6]
+    elif pair == 4:
+        return [7, 8]
+    elif pair == 5:
+        return [9, 10]
+    elif pair == 6:
+        return [11, 12]
+    return []
+
+def get_pair_name(pair):
+    return f"Пара {pair}"
+
+def get_pair_time(day, pair):
+    """Время пары: от начала первого до конца последнего ее урока"""
+    times = [get_lesson_time(day, lesson) for lesson in get_lessons_in_pair(day, pair)]
+    times = [time for time in times if time]
+    if not times:
+        return ""
+    return f"{times[0].split('-')[0]}-{times[-1].split('-')[1]}"
+
+def get_lesson_pair_time(day, lesson_number):
+    """Время всей пары, в которую входит урок"""
+    pair = get_pair_number_by_lesson(day, lesson_number)
+    return get_pair_time(day, pair)
@@ -0,0 +1,178 @@
+# reference_cache.py
+import json
+import threading
+from collections import OrderedDict
+
+from models import Group, Subject, Teacher, Room
+from http_cache import content_etag, bytes_response
+import settings_service
+
+# Счетчик изменений справочников (группы, предметы, преподаватели, аудитории)
+REFERENCE_VERSION_KEY = 'reference_version'
+
+KINDS = ('groups', 'teachers', 'subjects', 'rooms')
+
+# Поле с id -> вид справочника
+ID_FIELDS = {
+    'group_id': 'groups',
+    'subject_id': 'subjects',
+    'teacher_id': 'teachers',
+    'room_id': 'rooms'
+}
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class ReferenceData:
+    """Неизменяемый снимок справочников.
+
+    Строки хранятся кортежами (id, name) — для групп (id, name, course),
+    рядом лежат словари name -> id / id -> name и готовые JSON-байты
+    для /api/data/*.
+    """
+
+    def __init__(self, version, groups, teachers, subjects, rooms):
+        self.version = version
+        self.rows = {
+            'groups': groups,
+            'teachers': teachers,
+            'subjects': subjects,
+            'rooms': rooms
+        }
+        self.ids = {kind: {row[1]: row[0] for row in rows} for kind, rows in self.rows.items()}
+        self.names = {kind: {row[0]: row[1] for row in rows} for kind, rows in self.rows.items()}
+        self.group_courses = {row[0]: row[2] for row in groups}
+
+        self.payloads = {
+            'groups': dumps([{'id': g[0], 'name': g[1], 'course': g[2]} for g in groups]),
+            'teachers': dumps([{'id': t[0], 'name': t[1]} for t in teachers]),
+            'subjects': dumps([{'id': s[0], 'name': s[1]} for s in subjects]),
+            'rooms': dumps([{'id': r[0], 'name': r[1]} for r in rooms])
+        }
+        self.etags = {kind: content_etag(body) for kind, body in self.payloads.items()}
+        self.etag = content_etag(''.join(self.etags[kind] for kind in KINDS).encode('ascii'))
+
+
+_lock = threading.Lock()
+_state = {'data': None}
+
+# Собранные ответы /api/bootstrap: (справочники, настройки, пользователь) -> (etag, bytes)
+BOOTSTRAP_CACHE_SIZE = 64
+_bootstrap_cache = OrderedDict()
+
+
+def _build(version):
+    groups = tuple(
+        (g.id, g.name, g.course)
+        for g in Group.query.with_entities(Group.id, Group.name, Group.course).order_by(Group.course, Group.name)
+    )
+    teachers = tuple(
+        (t.id, t.name) for t in Teacher.query.with_entities(Teacher.id, Teacher.name).order_by(Teacher.name)
+    )
+    subjects = tuple(
+        (s.id, s.name) for s in Subject.query.with_entities(Subject.id, Subject.name).order_by(Subject.name)
+    )
+    rooms = tuple(
+        (r.id, r.name) for r in Room.query.with_entities(Room.id, Room.name).order_by(Room.name)
+    )
+    return ReferenceData(version, groups, teachers, subjects, rooms)
+
+
+def get_reference_data():
+    version = settings_service.get_int_setting(REFERENCE_VERSION_KEY, 0)
+    data = _state['data']
+    if data is not None and data.version == version:
+        return data
+
+    with _lock:
+        data = _state['data']
+        if data is None or data.version != version:
+            data = _build(version)
+            _state['data'] = data
+        return data
+
+
+def bump_version():
+    """Отметить изменение справочников в текущей транзакции"""
+    return settings_service.increment_setting(REFERENCE_VERSION_KEY)
+
+
+def resolve_ids(group=None, subject=None, teacher=None, room=None):
+    """Имена -> id за O(1). Для ненайденных имен возвращается None."""
+    ids = get_reference_data().ids
+    return (
+        ids['groups'].get(group),
+        ids['subjects'].get(subject),
+        ids['teachers'].get(teacher),
+        ids['rooms'].get(room)
+    )
+
+
+def resolve_id(kind, name):
+    return get_reference_data().ids[kind].get(name)
+
+
+def missing_ids(**ids):
+    """Переданные поля (group_id=..., room_id=...), id которых нет в справочниках.
+
+    Проверка идет по кэшу, без запросов к БД.
+    """
+    names = get_reference_data().names
+    return [
+        field for field, value in ids.items()
+        if value not in names[ID_FIELDS[field]]
+    ]
+
+
+def reference_response(kind):
+    data = get_reference_data()
+    return bytes_response(data.payloads[kind], data.etags[kind])
+
+
+def bootstrap_payload(user_info):
+    """Все стартовые данные страницы одним JSON: пользователь, настройки и справочники.
+
+    Справочники вклеиваются готовыми байтами, поэтому сборка ответа — это
+    конкатенация нескольких буферов.
+    """
+    data = get_reference_data()
+    settings_version = settings_service.get_settings_version()
+    user_key = (user_info.get('authenticated'), user_info.get('username'), user_info.get('role'))
+    key = (data.etag, settings_version, user_key)
+
+    with _lock:
+        cached = _bootstrap_cache.get(key)
+        if cached is not None:
+            _bootstrap_cache.move_to_end(key)
+            return cached
+
+    settings = {
+        'week': settings_service.get_current_week(),
+        'semester': settings_service.get_current_semester()
+    }
+    user_bytes = dumps(user_info)
+    version = f'{data.etag}-{settings_version}-{content_etag(user_bytes)[:8]}'
+
+    body = b''.join([
+        b'{"version":', dumps(version),
+        b',"user":', user_bytes,
+        b',"settings":', dumps(settings),
+        b',"groups":', data.payloads['groups'],
+        b',"teachers":', data.payloads['teachers'],
+        b',"subjects":', data.payloads['subjects'],
+        b',"rooms":', data.payloads['rooms'],
+        b'}'
+    ])
+
+    with _lock:
+        _bootstrap_cache[key] = (version, body)
+        while len(_bootstrap_cache) > BOOTSTRAP_CACHE_SIZE:
+            _bootstrap_cache.popitem(last=False)
+    return version, body
+
+
+def bootstrap_response(user_info):
+    version, body = bootstrap_payload(user_info)
+    return bytes_response(body, version, compress=True, private=True)
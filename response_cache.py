@@ -0,0 +1,201 @@
+# response_cache.py
+import threading
+from collections import OrderedDict
+
+from http_cache import lazy_response
+from initial_data import AVAILABLE_DAYS
+import schedule_payloads
+import schedule_versions
+
+
+class ResponseCache:
+    """LRU-кэш готовых ответов (JSON или HTML в байтах).
+
+    Каждая запись помечена ключом версии расписания (scope, semester, week)
+    и своим ETag. Запись отдается только при совпадении ETag, поэтому
+    изменения из других воркеров не приводят к устаревшим ответам, а
+    изменения этого воркера вычищают записи сразу после commit.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (tag, etag, body)
+        self._by_tag = {}  # tag -> set(key)
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_entries, max_bytes):
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, tag, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (tag, etag, body)
+            self._by_tag.setdefault(tag, set()).add(key)
+            self._size += len(body)
+            self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= len(entry[2])
+        keys = self._by_tag.get(entry[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_tag[entry[0]]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+
+    def invalidate(self, changes, events=None):
+        """Удалить записи, затронутые изменениями расписания"""
+        with self._lock:
+            for tag in list(self._by_tag):
+                if schedule_versions.affects(changes, *tag):
+                    for key in list(self._by_tag.get(tag, ())):
+                        self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+schedule_cache = ResponseCache()
+schedule_versions.add_commit_listener(schedule_cache.invalidate)
+
+
+def init_response_cache(app):
+    schedule_cache.configure(
+        app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+        app.config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    )
+
+
+def cached_response(key, tag, etag, build, compress=True):
+    """Условный ответ: 304 по ETag, иначе тело из кэша, иначе build()"""
+    def cached_build():
+        body = schedule_cache.get(key, etag)
+        if body is None:
+            body = build()
+            schedule_cache.put(key, tag, etag, body)
+        return body
+
+    return lazy_response(etag, cached_build, compress=compress)
+
+
+def current_day_response(semester, week, day):
+    return cached_response(
+        ('current', semester, week, day),
+        (schedule_versions.CURRENT, semester, week),
+        schedule_versions.week_etag(semester, week),
+        lambda: schedule_payloads.build_day('current', semester, day, week=week)
+    )
+
+
+def main_day_response(semester, day, week_parity):
+    return cached_response(
+        ('main', semester, week_parity, day),
+        (schedule_versions.MAIN, semester, 0),
+        schedule_versions.main_etag(semester),
+        lambda: schedule_payloads.build_day('main', semester, day, week_parity=week_parity)
+    )
+
+
+def _schedule_tag(schedule_type, semester, week):
+    if schedule_type == 'main':
+        return (schedule_versions.MAIN, semester, 0), schedule_versions.main_etag(semester)
+    return (schedule_versions.CURRENT, semester, week), schedule_versions.week_etag(semester, week)
+
+
+def filtered_response(schedule_type, semester, week, week_parity, days, filters, after=None, limit=None):
+    """Построчное расписание с фильтрами по группе / преподавателю / аудитории.
+
+    Без постраничного вывода ответ кэшируется как обычно. Страницы не
+    кэшируются: курсор следующей страницы передается в заголовке
+    X-Next-Cursor, а он известен только после сборки тела.
+    """
+    tag, etag = _schedule_tag(schedule_type, semester, week)
+    week = week if schedule_type == 'current' else None
+
+    if limit is None:
+        key = ('rows', schedule_type, semester, week, week_parity, tuple(days), tuple(sorted(filters.items())))
+        return cached_response(key, tag, etag, lambda: schedule_payloads.build_rows(
+            schedule_type, semester, week, week_parity, days, filters
+        )[0])
+
+    next_cursor = None
+
+    def build():
+        nonlocal next_cursor
+        body, next_cursor = schedule_payloads.build_rows(
+            schedule_type, semester, week, week_parity, days, filters, after, limit
+        )
+        return body
+
+    response = lazy_response(etag, build, compress=True)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def week_response(schedule_type, semester, week, week_parity, days, fields):
+    tag, etag = _schedule_tag(schedule_type, semester, week)
+
+    return cached_response(
+        ('week', schedule_type, semester, week, week_parity, tuple(days), tuple(fields)),
+        tag,
+        etag,
+        lambda: schedule_payloads.build_week(schedule_type, semester, week, week_parity, days, fields)
+    )
+
+
+def warm_week(semester, week):
+    """Заполнить кэш текущим расписанием недели (вызывается после перехода недели)"""
+    tag = (schedule_versions.CURRENT, semester, week)
+    etag = schedule_versions.week_etag(semester, week)
+
+    for day in AVAILABLE_DAYS:
+        schedule_cache.put(
+            ('current', semester, week, day), tag, etag,
+            schedule_payloads.build_day('current', semester, day, week=week)
+        )
+
+    days = list(AVAILABLE_DAYS)
+    fields = schedule_payloads.COLUMNS
+    schedule_cache.put(
+        ('week', 'current', semester, week, 'both', tuple(days), tuple(fields)), tag, etag,
+        schedule_payloads.build_week('current', semester, week, 'both', days, fields)
+    )
@@ -0,0 +1,189 @@
+# room_utilization.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, ScheduleEntry, ScheduleVersion
+from initial_data import AVAILABLE_DAYS
+from pairs import get_available_pairs_for_day, get_lessons_in_pair
+import occupancy
+import reference_cache
+import schedule_versions
+
+# Все слоты недели (день, урок) — столбцы матрицы занятости
+SLOTS = [
+    (day, lesson)
+    for day in AVAILABLE_DAYS
+    for pair in get_available_pairs_for_day(day)
+    for lesson in get_lessons_in_pair(day, pair)
+]
+SLOT_INDEX = {slot: i for i, slot in enumerate(SLOTS)}
+
+# Сколько недель держать в кэше
+MAX_WEEKS = 128
+# Сколько самых загруженных слотов отдавать в отчете
+PEAK_SLOTS = 10
+
+_options = {'underused_percent': 10, 'overbooked_percent': 85}
+_lock = threading.Lock()
+_weeks = OrderedDict()  # (semester, week) -> WeekMatrix
+
+
+def init_room_utilization(app):
+    _options['underused_percent'] = app.config.get('ROOM_UNDERUSED_PERCENT', 10)
+    _options['overbooked_percent'] = app.config.get('ROOM_OVERBOOKED_PERCENT', 85)
+
+
+class WeekMatrix:
+    """Занятия недели: матрица аудитории × слоты (число занятий, больше 1 — двойная занятость)"""
+
+    def __init__(self, version, ref_etag, counts):
+        self.version = version    # версия недели из ScheduleVersion
+        self.ref_etag = ref_etag  # порядок строк — id аудиторий этого снимка справочников
+        self.counts = counts
+
+
+def _room_ids():
+    data = reference_cache.get_reference_data()
+    return data.etag, np.array(sorted(data.names['rooms']), dtype=np.int64)
+
+
+def _versions(semester):
+    """(поколение семестра, {неделя: версия}) одним запросом"""
+    versions = dict(db.session.query(ScheduleVersion.week_number, ScheduleVersion.version).filter(
+        ScheduleVersion.scope == schedule_versions.CURRENT,
+        ScheduleVersion.semester == semester
+    ))
+    return versions.pop(0, 0), versions
+
+
+def _build_weeks(semester, weeks, room_ids):
+    """Матрицы нескольких недель одним GROUP BY (неделя, аудитория, день, урок)"""
+    matrices = {week: np.zeros((len(room_ids), len(SLOTS)), dtype=np.int16) for week in weeks}
+    rows = db.session.query(
+        ScheduleEntry.week_number, ScheduleEntry.room_id, ScheduleEntry.day, ScheduleEntry.lesson_number,
+        func.count(ScheduleEntry.id)
+    ).filter(
+        ScheduleEntry.semester == semester,
+        ScheduleEntry.week_number.in_(weeks)
+    ).group_by(ScheduleEntry.week_number, ScheduleEntry.room_id, ScheduleEntry.day, ScheduleEntry.lesson_number)
+
+    rows = rows.all()
+    if not rows or not len(room_ids):
+        return matrices
+    week_numbers, rooms, days, lessons, counts = zip(*rows)
+    week_numbers = np.array(week_numbers)
+    rooms = np.array(rooms, dtype=np.int64)
+    slots = np.array([SLOT_INDEX.get(slot, -1) for slot in zip(days, lessons)])
+    positions = np.searchsorted(room_ids, rooms)
+    # Уроки вне сетки и записи удаленных аудиторий пропускаем
+    valid = (slots >= 0) & (room_ids[np.minimum(positions, len(room_ids) - 1)] == rooms)
+    counts = np.array(counts)
+    for week in weeks:
+        mask = valid & (week_numbers == week)
+        matrices[week][positions[mask], slots[mask]] = counts[mask]
+    return matrices
+
+
+def week_matrices(semester, weeks):
+    """Матрицы недель из кэша; недели, версия которых изменилась, собираются заново"""
+    ref_etag, room_ids = _room_ids()
+    generation, versions = _versions(semester)
+    expected = {week: (generation, versions.get(week, 0)) for week in weeks}
+
+    with _lock:
+        cached = {week: _weeks.get((semester, week)) for week in weeks}
+    stale = [
+        week for week, matrix in cached.items()
+        if matrix is None or matrix.version != expected[week] or matrix.ref_etag != ref_etag
+    ]
+    if stale:
+        for week, counts in _build_weeks(semester, stale, room_ids).items():
+            cached[week] = WeekMatrix(expected[week], ref_etag, counts)
+        with _lock:
+            for week in stale:
+                _weeks[(semester, week)] = cached[week]
+            while len(_weeks) > MAX_WEEKS:
+                _weeks.popitem(last=False)
+
+    with _lock:
+        for week in weeks:
+            if (semester, week) in _weeks:
+                _weeks.move_to_end((semester, week))
+    return room_ids, [cached[week].counts for week in weeks]
+
+
+def _percent(values, total):
+    return np.round(values * 100.0 / total, 1) if total else np.zeros(values.shape)
+
+
+def utilization(semester, week_from, week_to):
+    """Загрузка аудиторий за диапазон недель: тепловая карта и отчет.
+
+    heatmap[i][j] — в скольких неделях диапазона аудитория i занята в
+    слоте j; проценты считаются от числа недель (и слотов / аудиторий).
+    """
+    weeks = list(range(week_from, week_to + 1))
+    room_ids, matrices = week_matrices(semester, weeks)
+    stacked = np.stack(matrices) if matrices else np.zeros((0, len(room_ids), len(SLOTS)), dtype=np.int16)
+    busy = (stacked > 0).sum(axis=0)
+    double = (stacked > 1).sum(axis=0)
+
+    names = reference_cache.get_reference_data().names['rooms']
+    room_names = [names.get(room_id) for room_id in room_ids.tolist()]
+    categories = [occupancy.room_category(name) for name in room_names]
+
+    room_percent = _percent(busy.sum(axis=1), len(weeks) * len(SLOTS))
+    slot_percent = _percent(busy.sum(axis=0), len(weeks) * len(room_ids))
+    peak_order = np.argsort(-slot_percent, kind='stable')[:PEAK_SLOTS]
+
+    category_percent = {}
+    category_array = np.array(categories, dtype=object)
+    for category in occupancy.CATEGORIES:
+        mask = category_array == category
+        if mask.any():
+            category_percent[category] = float(_percent(busy[mask].sum(), len(weeks) * len(SLOTS) * int(mask.sum())))
+
+    used = busy.sum(axis=1) > 0
+    double_rooms, double_slots = np.nonzero(double)
+
+    def room_list(indexes):
+        return [
+            {'id': int(room_ids[i]), 'name': room_names[i], 'category': categories[i], 'percent': float(room_percent[i])}
+            for i in indexes
+        ]
+
+    return {
+        'semester': semester,
+        'week_from': week_from,
+        'week_to': week_to,
+        'weeks': len(weeks),
+        'slots': [[day, lesson] for day, lesson in SLOTS],
+        'room_ids': room_ids.tolist(),
+        'room_names': room_names,
+        'room_categories': categories,
+        'heatmap': busy.tolist(),
+        'room_percent': room_percent.tolist(),
+        'slot_percent': slot_percent.tolist(),
+        'category_percent': category_percent,
+        'peak_slots': [
+            {'day': SLOTS[j][0], 'lesson': SLOTS[j][1], 'percent': float(slot_percent[j])}
+            for j in peak_order if slot_percent[j] > 0
+        ],
+        'never_used': room_list(np.flatnonzero(~used)),
+        'underused': room_list([
+            i for i in np.argsort(room_percent, kind='stable')
+            if used[i] and room_percent[i] < _options['underused_percent']
+        ]),
+        'overbooked': room_list([
+            i for i in np.argsort(-room_percent, kind='stable')
+            if room_percent[i] >= _options['overbooked_percent']
+        ]),
+        'double_booked': [
+            {'room': room_names[i], 'day': SLOTS[j][0], 'lesson': SLOTS[j][1], 'weeks': int(double[i, j])}
+            for i, j in zip(double_rooms.tolist(), double_slots.tolist())
+        ],
+        'thresholds': dict(_options)
+    }
@@ -8,6 +8,7 @@ import os
 from datetime import datetime
 import io
 from openpyxl import Workbook
+import settings_service
 
 def init_routes(app):
     
@@ -299,12 +300,7 @@ def init_routes(app):
             current_week = get_current_week()
             next_week = current_week + 1
             
-            setting = AppSettings.query.filter_by(key='current_week').first()
-            if setting:
-                setting.value = str(next_week)
-            else:
-                setting = AppSettings(key='current_week', value=str(next_week))
-                db.session.add(setting)
+            settings_service.set_setting('current_week', next_week)
             
             current_semester = get_current_semester()
             update_current_schedule_from_main(next_week, current_semester)
@@ -319,24 +315,10 @@ def init_routes(app):
 
 # Вспомогательные функции
 def get_current_week():
-    setting = AppSettings.query.filter_by(key='current_week').first()
-    if setting:
-        return int(setting.value)
-    else:
-        setting = AppSettings(key='current_week', value='1')
-        db.session.add(setting)
-        db.session.commit()
-        return 1
+    return settings_service.get_current_week()
 
 def get_current_semester():
-    setting = AppSettings.query.filter_by(key='current_semester').first()
-    if setting:
-        return int(setting.value)
-    else:
-        setting = AppSettings(key='current_semester', value='1')
-        db.session.add(setting)
-        db.session.commit()
-        return 1
+    return settings_service.get_current_semester()
 
 def update_current_schedule_from_main(week_number, semester):
     ScheduleEntry.query.filter_by(
@@ -0,0 +1,325 @@
+# schedule_batch.py
+from models import db, ScheduleEntry, MainScheduleEntry
+from initial_data import AVAILABLE_DAYS
+import reference_cache
+import schedule_payloads
+import schedule_versions
+
+OPERATIONS = ('add', 'update', 'delete')
+
+# Поле операции -> вид справочника
+REFERENCE_FIELDS = {
+    'group': 'groups',
+    'subject': 'subjects',
+    'teacher': 'teachers',
+    'room': 'rooms'
+}
+
+ZERO_LESSON_DAYS = ('Понедельник', 'Четверг')
+ZERO_LESSON_SUBJECT = 'Разговоры о важном'
+
+
+class BatchError(Exception):
+    """Ошибка проверки одной операции пакета"""
+
+
+def _parities_overlap(a, b):
+    return a == 'both' or b == 'both' or a == b
+
+
+class OccupancyView:
+    """Занятость слотов одной недели (или основного расписания семестра) в памяти.
+
+    По мере проверки операций пакета представление меняется так же, как
+    изменится БД, поэтому операции видят результат предыдущих: можно
+    удалить занятие и поставить на его место другое в одном пакете.
+    """
+
+    def __init__(self, schedule_type, semester, week=None):
+        self.schedule_type = schedule_type
+        self.entries = {}  # id -> (day, lesson, group_id, teacher_id, room_id, parity)
+        self.slots = {}    # (kind, day, lesson, value_id) -> set(id)
+
+        for row in schedule_payloads.query_rows(schedule_type, semester, week):
+            entry_id, day, lesson, group_id, subject_id, teacher_id, room_id, flags = row
+            self.place(entry_id, (day, lesson, group_id, teacher_id, room_id, self._parity(flags)))
+
+    def _parity(self, flags):
+        if self.schedule_type == schedule_versions.MAIN:
+            return schedule_payloads.parity_from_flags(flags)
+        return 'both'
+
+    @staticmethod
+    def _keys(record):
+        day, lesson, group_id, teacher_id, room_id, parity = record
+        return (
+            ('group', day, lesson, group_id),
+            ('teacher', day, lesson, teacher_id),
+            ('room', day, lesson, room_id)
+        )
+
+    def place(self, entry_id, record):
+        self.entries[entry_id] = record
+        for key in self._keys(record):
+            self.slots.setdefault(key, set()).add(entry_id)
+
+    def remove(self, entry_id):
+        record = self.entries.pop(entry_id, None)
+        if record is None:
+            return
+        for key in self._keys(record):
+            ids = self.slots.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.slots[key]
+
+    def conflicts(self, record, exclude=None):
+        """{'group': [...], 'teacher': [...], 'room': [...]} — id пересекающихся занятий"""
+        parity = record[5]
+        result = {}
+        for key in self._keys(record):
+            ids = [
+                other for other in self.slots.get(key, ())
+                if other != exclude and _parities_overlap(parity, self.entries[other][5])
+            ]
+            if ids:
+                result[key[0]] = sorted(ids)
+        return result
+
+
+class Batch:
+    """Проверка и применение пакета операций в текущей транзакции.
+
+    Операции выполняются по порядку. Ошибка любой операции не прерывает
+    проверку остальных (клиент получает все ошибки сразу), но после нее
+    вызывающий код должен откатить транзакцию.
+    """
+
+    def __init__(self, schedule_type='current', semester=1, week=1, strict=False):
+        self.schedule_type = schedule_type
+        self.semester = semester
+        self.week = week
+        self.strict = strict
+        self.views = {}
+        self.entries = {}  # (type, id) -> ORM-объект
+        self.deleted = set()
+
+    def _model(self, schedule_type):
+        return MainScheduleEntry if schedule_type == schedule_versions.MAIN else ScheduleEntry
+
+    def _view(self, schedule_type, semester, week):
+        key = (schedule_type, semester, week if schedule_type == schedule_versions.CURRENT else None)
+        view = self.views.get(key)
+        if view is None:
+            view = self.views[key] = OccupancyView(*key)
+        return view
+
+    def _view_for(self, entry, schedule_type):
+        return self._view(schedule_type, entry.semester, getattr(entry, 'week_number', None))
+
+    def _type(self, op):
+        schedule_type = op.get('type', self.schedule_type)
+        if schedule_type not in (schedule_versions.CURRENT, schedule_versions.MAIN):
+            raise BatchError(f'Неизвестный тип расписания: {schedule_type}')
+        return schedule_type
+
+    def prefetch(self, operations):
+        """Загрузить записи для update/delete одним запросом на таблицу"""
+        ids = {schedule_versions.CURRENT: set(), schedule_versions.MAIN: set()}
+        for op in operations:
+            if isinstance(op, dict) and op.get('op') in ('update', 'delete'):
+                schedule_type = op.get('type', self.schedule_type)
+                if schedule_type in ids and isinstance(op.get('id'), int):
+                    ids[schedule_type].add(op['id'])
+
+        for schedule_type, wanted in ids.items():
+            if not wanted:
+                continue
+            model = self._model(schedule_type)
+            for entry in model.query.filter(model.id.in_(wanted)).all():
+                self.entries[(schedule_type, entry.id)] = entry
+
+    def _resolve(self, op, field, required):
+        """Id справочника по полю <field>_id или по имени <field>"""
+        kind = REFERENCE_FIELDS[field]
+        if op.get(f'{field}_id') is not None:
+            value = op[f'{field}_id']
+            if value not in reference_cache.get_reference_data().names[kind]:
+                raise BatchError(f'Не найден {field}_id={value}')
+            return value
+
+        if op.get(field) is not None:
+            value = reference_cache.resolve_id(kind, op[field])
+            if value is None:
+                raise BatchError(f'Не найдено: {op[field]}')
+            return value
+
+        if required:
+            raise BatchError(f'Не указано поле {field}')
+        return None
+
+    def _slot(self, op, day, lesson_number):
+        day = op.get('day', day)
+        if day not in AVAILABLE_DAYS:
+            raise BatchError(f'Неизвестный день: {day}')
+        try:
+            lesson_number = int(op.get('lesson_number', lesson_number))
+        except (TypeError, ValueError):
+            raise BatchError('Некорректный номер урока')
+        if lesson_number < 0:
+            raise BatchError('Некорректный номер урока')
+        return day, lesson_number
+
+    def _check_zero_lesson(self, day, lesson_number, subject_id):
+        if day in ZERO_LESSON_DAYS and lesson_number == 0:
+            subject = reference_cache.get_reference_data().names['subjects'].get(subject_id)
+            if subject != ZERO_LESSON_SUBJECT:
+                raise BatchError(f'На 0 урок можно поставить только "{ZERO_LESSON_SUBJECT}"')
+
+    def _check_conflicts(self, view, record, exclude=None):
+        """Конфликт группы — ошибка, преподавателя и аудитории — предупреждение
+        (в строгом режиме тоже ошибка)"""
+        conflicts = view.conflicts(record, exclude)
+        if 'group' in conflicts:
+            raise BatchError('Конфликт расписания')
+
+        warnings = []
+        if 'teacher' in conflicts:
+            warnings.append('Преподаватель уже занят в это время')
+        if 'room' in conflicts:
+            warnings.append('Аудитория уже занята в это время')
+        if warnings and self.strict:
+            raise BatchError('; '.join(warnings))
+        return warnings
+
+    def _existing(self, op, schedule_type):
+        entry_id = op.get('id')
+        if not isinstance(entry_id, int):
+            raise BatchError('Не указан id записи')
+        if (schedule_type, entry_id) in self.deleted:
+            raise BatchError('Запись уже удалена в этом пакете')
+        entry = self.entries.get((schedule_type, entry_id))
+        if entry is None:
+            raise BatchError('Запись не найдена')
+        return entry
+
+    def _add(self, op, schedule_type):
+        group_id = self._resolve(op, 'group', True)
+        subject_id = self._resolve(op, 'subject', True)
+        teacher_id = self._resolve(op, 'teacher', True)
+        room_id = self._resolve(op, 'room', True)
+        day, lesson_number = self._slot(op, None, None)
+        semester = int(op.get('semester', self.semester))
+        self._check_zero_lesson(day, lesson_number, subject_id)
+
+        if schedule_type == schedule_versions.MAIN:
+            week = None
+            parity = op.get('week_parity', 'both')
+            if parity not in ('both', 'even', 'odd'):
+                raise BatchError(f'Неизвестная четность: {parity}')
+        else:
+            week = int(op.get('week', self.week))
+            parity = 'both'
+
+        view = self._view(schedule_type, semester, week)
+        record = (day, lesson_number, group_id, teacher_id, room_id, parity)
+        warnings = self._check_conflicts(view, record)
+
+        if schedule_type == schedule_versions.MAIN:
+            entry = MainScheduleEntry(
+                group_id=group_id,
+                subject_id=subject_id,
+                teacher_id=teacher_id,
+                room_id=room_id,
+                day=day,
+                lesson_number=lesson_number,
+                week_parity=parity,
+                semester=semester
+            )
+        else:
+            entry = ScheduleEntry(
+                group_id=group_id,
+                subject_id=subject_id,
+                teacher_id=teacher_id,
+                room_id=room_id,
+                day=day,
+                lesson_number=lesson_number,
+                week_number=week,
+                semester=semester,
+                is_changed=True
+            )
+
+        db.session.add(entry)
+        schedule_versions.bump_entry(entry, 'add')
+        self.entries[(schedule_type, entry.id)] = entry
+        view.place(entry.id, record)
+        return entry, warnings
+
+    def _update(self, op, schedule_type):
+        entry = self._existing(op, schedule_type)
+        view = self._view_for(entry, schedule_type)
+
+        subject_id = self._resolve(op, 'subject', False) or entry.subject_id
+        teacher_id = self._resolve(op, 'teacher', False) or entry.teacher_id
+        room_id = self._resolve(op, 'room', False) or entry.room_id
+        day, lesson_number = self._slot(op, entry.day, entry.lesson_number)
+        self._check_zero_lesson(day, lesson_number, subject_id)
+
+        parity = 'both'
+        if schedule_type == schedule_versions.MAIN:
+            parity = op.get('week_parity', entry.week_parity or 'both')
+            if parity not in ('both', 'even', 'odd'):
+                raise BatchError(f'Неизвестная четность: {parity}')
+
+        record = (day, lesson_number, entry.group_id, teacher_id, room_id, parity)
+        warnings = self._check_conflicts(view, record, exclude=entry.id)
+
+        entry.subject_id = subject_id
+        entry.teacher_id = teacher_id
+        entry.room_id = room_id
+        entry.day = day
+        entry.lesson_number = lesson_number
+        if schedule_type == schedule_versions.MAIN:
+            entry.week_parity = parity
+        else:
+            entry.is_changed = True
+
+        schedule_versions.bump_entry(entry)
+        view.remove(entry.id)
+        view.place(entry.id, record)
+        return entry, warnings
+
+    def _delete(self, op, schedule_type):
+        entry = self._existing(op, schedule_type)
+        view = self._view_for(entry, schedule_type)
+
+        schedule_versions.bump_entry(entry, 'delete')
+        db.session.delete(entry)
+        self.deleted.add((schedule_type, entry.id))
+        view.remove(entry.id)
+        return entry, []
+
+    def apply(self, index, op):
+        """Проверить и применить одну операцию; результат для ответа клиенту"""
+        result = {'index': index, 'op': op.get('op') if isinstance(op, dict) else None}
+        try:
+            if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+                raise BatchError('Неизвестная операция')
+
+            schedule_type = self._type(op)
+            handler = {'add': self._add, 'update': self._update, 'delete': self._delete}[op['op']]
+            entry, warnings = handler(op, schedule_type)
+
+            result.update({'success': True, 'id': entry.id, 'type': schedule_type})
+            if warnings:
+                result['warnings'] = warnings
+        except BatchError as e:
+            result.update({'success': False, 'message': str(e)})
+        except (TypeError, ValueError) as e:
+            result.update({'success': False, 'message': f'Некорректные данные: {e}'})
+        return result
+
+    def run(self, operations):
+        self.prefetch(operations)
+        return [self.apply(index, op) for index, op in enumerate(operations)]
@@ -0,0 +1,201 @@
+# schedule_export.py
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+from sqlalchemy import case, func
+
+from models import db, ScheduleEntry, MainScheduleEntry
+from initial_data import AVAILABLE_DAYS
+from pairs import get_available_pairs_for_day, get_pair_number_by_lesson, get_pair_time
+import reference_cache
+import schedule_payloads
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Сколько строк забирать из курсора БД за раз
+FETCH_SIZE = 1000
+
+PARITY_LABELS = {'even': ' (чет.)', 'odd': ' (нечет.)'}
+
+# Последняя колонка листа: занятия вне обычной сетки пар дня
+OTHER_COLUMN = 'Вне сетки'
+
+HEADER_FONT = Font(bold=True)
+WRAP = Alignment(wrap_text=True, vertical='top')
+
+
+def last_week(semester):
+    """Последняя неделя семестра, для которой есть текущее расписание"""
+    return db.session.query(func.max(ScheduleEntry.week_number)).filter(
+        ScheduleEntry.semester == semester
+    ).scalar() or 1
+
+
+def _rows(schedule_type, semester, week_from, week_to):
+    """Строки расписания потоком в порядке неделя, день, группа, урок.
+
+    Объекты ORM не создаются, строки читаются из курсора порциями.
+    """
+    model = MainScheduleEntry if schedule_type == 'main' else ScheduleEntry
+    day_order = case(schedule_payloads.DAY_INDEX, value=model.day, else_=len(AVAILABLE_DAYS))
+
+    if schedule_type == 'main':
+        query = db.session.query(
+            db.literal(None), model.day, model.group_id, model.lesson_number,
+            model.subject_id, model.teacher_id, model.room_id, model.week_parity
+        ).filter(model.semester == semester).order_by(
+            day_order, model.group_id, model.lesson_number, model.id
+        )
+    else:
+        query = db.session.query(
+            model.week_number, model.day, model.group_id, model.lesson_number,
+            model.subject_id, model.teacher_id, model.room_id, model.week_parity
+        ).filter(
+            model.semester == semester,
+            model.week_number.between(week_from, week_to)
+        ).order_by(model.week_number, day_order, model.group_id, model.lesson_number, model.id)
+
+    return query.yield_per(FETCH_SIZE)
+
+
+def _sheet_title(week, day):
+    return day if week is None else f'Неделя {week} - {day}'
+
+
+def _cell(sheet, value, font=None):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.alignment = WRAP
+    if font is not None:
+        cell.font = font
+    return cell
+
+
+def _lesson_text(row, names):
+    week, day, group_id, lesson, subject_id, teacher_id, room_id, parity = row
+    text = f'{lesson}. {names["subjects"].get(subject_id, "")}'
+    if week is None:
+        # Основное расписание: отмечаем занятия только по четным / нечетным неделям
+        text += PARITY_LABELS.get(parity, '')
+    return f'{text}\n{names["teachers"].get(teacher_id, "")}, ауд. {names["rooms"].get(room_id, "")}'
+
+
+class _SheetWriter:
+    """Лист одного дня: строки — группы, колонки — пары и «вне сетки».
+
+    Заголовок пишется сразу при создании листа, поэтому набор колонок
+    фиксирован: занятия, не попадающие ни в одну пару дня, собираются в
+    последней колонке.
+    """
+
+    def __init__(self, workbook, week, day, groups, names):
+        self.sheet = workbook.create_sheet(_sheet_title(week, day))
+        self.day = day
+        self.groups = groups
+        self.names = names
+        self.pairs = get_available_pairs_for_day(day)
+        self.next_group = 0
+        self.row_group = None
+        self.cells = {}
+
+        self.sheet.column_dimensions['A'].width = 12
+        for i in range(len(self.pairs) + 1):
+            self.sheet.column_dimensions[get_column_letter(i + 2)].width = 34
+
+        header = [_cell(self.sheet, 'Группа', HEADER_FONT)]
+        header += [
+            _cell(self.sheet, f'Пара {pair}\n{get_pair_time(day, pair)}', HEADER_FONT)
+            for pair in self.pairs
+        ]
+        header.append(_cell(self.sheet, OTHER_COLUMN, HEADER_FONT))
+        self.sheet.append(header)
+
+    def _flush_row(self):
+        if self.row_group is None:
+            return
+        row = [_cell(self.sheet, self.names['groups'].get(self.row_group, ''), HEADER_FONT)]
+        row += [_cell(self.sheet, '\n'.join(self.cells.get(pair, ()))) for pair in self.pairs]
+        row.append(_cell(self.sheet, '\n'.join(self.cells.get(None, ()))))
+        self.sheet.append(row)
+        self.row_group = None
+        self.cells = {}
+
+    def _advance_to(self, group_id):
+        """Вывести пустые строки групп до group_id (группы идут по возрастанию id)"""
+        while self.next_group < len(self.groups) and self.groups[self.next_group] <= group_id:
+            current = self.groups[self.next_group]
+            self.next_group += 1
+            if current != group_id:
+                self.row_group = current
+                self._flush_row()
+        self.row_group = group_id
+
+    def add(self, row):
+        group_id, lesson = row[2], row[3]
+        if group_id != self.row_group:
+            self._flush_row()
+            self._advance_to(group_id)
+
+        pair = get_pair_number_by_lesson(self.day, lesson)
+        if pair not in self.pairs:
+            pair = None  # занятие вне обычной сетки дня не теряем
+        self.cells.setdefault(pair, []).append(_lesson_text(row, self.names))
+
+    def close(self):
+        self._flush_row()
+        self._advance_to(float('inf'))
+        self.row_group = None
+
+
+def write_workbook(output, schedule_type, semester, week_from=None, week_to=None):
+    """Записать xlsx в файловый объект output.
+
+    Книга создается в режиме write_only: строки сразу уходят во временные
+    файлы openpyxl, поэтому память не растет с числом недель. На каждый
+    день (и неделю для текущего расписания) — отдельный лист.
+    """
+    data = reference_cache.get_reference_data()
+    names = data.names
+    groups = sorted(names['groups'])
+
+    workbook = Workbook(write_only=True)
+    weeks = [None] if schedule_type == 'main' else list(range(week_from, week_to + 1))
+    sheets = ((week, day) for week in weeks for day in AVAILABLE_DAYS)
+
+    current_key = None
+    writer = None
+
+    def open_until(key):
+        nonlocal current_key, writer
+        # Листы без занятий тоже создаются, чтобы у каждой недели были все дни
+        while current_key != key:
+            if writer is not None:
+                writer.close()
+            current_key = next(sheets)
+            writer = _SheetWriter(workbook, current_key[0], current_key[1], groups, names)
+
+    for row in _rows(schedule_type, semester, week_from, week_to):
+        if row[1] not in schedule_payloads.DAY_INDEX:
+            continue
+        open_until((row[0], row[1]))
+        writer.add(row)
+
+    for key in sheets:
+        if writer is not None:
+            writer.close()
+        current_key = key
+        writer = _SheetWriter(workbook, key[0], key[1], groups, names)
+    if writer is not None:
+        writer.close()
+
+    workbook.save(output)
+
+
+def export_file(schedule_type, semester, week_from=None, week_to=None):
+    """Временный файл с готовой книгой (удаляется при закрытии)"""
+    output = tempfile.TemporaryFile()
+    write_workbook(output, schedule_type, semester, week_from, week_to)
+    output.seek(0)
+    return output
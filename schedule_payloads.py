@@ -0,0 +1,284 @@
+# schedule_payloads.py
+from sqlalchemy import case, tuple_
+
+from models import ScheduleEntry, MainScheduleEntry
+from initial_data import AVAILABLE_DAYS
+from pairs import get_pair_number_by_lesson, get_lesson_pair_time
+import reference_cache
+
+# Биты поля flags
+FLAG_CHANGED = 1  # занятие изменено относительно основного расписания
+FLAG_EVEN = 2     # только по четным неделям
+FLAG_ODD = 4      # только по нечетным неделям
+
+COLUMNS = ('id', 'day', 'lesson', 'group', 'subject', 'teacher', 'room', 'flags')
+
+# Колонки, которые кодируются индексами в массивы-словари
+DIMENSIONS = {
+    'group': 'groups',
+    'subject': 'subjects',
+    'teacher': 'teachers',
+    'room': 'rooms'
+}
+
+DAY_INDEX = {day: i for i, day in enumerate(AVAILABLE_DAYS)}
+
+PARITY_FLAGS = {'even': FLAG_EVEN, 'odd': FLAG_ODD}
+
+# days=all — явный запрос всей недели
+ALL_DAYS = 'all'
+
+
+def parity_from_flags(flags):
+    if flags & FLAG_EVEN:
+        return 'even'
+    if flags & FLAG_ODD:
+        return 'odd'
+    return 'both'
+
+
+def parse_fields(value):
+    """fields=group,lesson,... -> кортеж колонок в каноническом порядке"""
+    if not value:
+        return COLUMNS
+    requested = {f.strip() for f in value.split(',') if f.strip()}
+    unknown = requested - set(COLUMNS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return tuple(c for c in COLUMNS if c in requested)
+
+
+def parse_days(value):
+    """days=Понедельник,Вторник (или days=all) -> список дней в порядке недели"""
+    if not value or value == ALL_DAYS:
+        return list(AVAILABLE_DAYS)
+    requested = {d.strip() for d in value.split(',') if d.strip()}
+    unknown = requested - set(AVAILABLE_DAYS)
+    if unknown:
+        raise ValueError(f'Неизвестные дни: {", ".join(sorted(unknown))}')
+    return [d for d in AVAILABLE_DAYS if d in requested]
+
+
+def day_range(day_from=None, day_to=None):
+    """day_from=Вторник&day_to=Четверг -> дни недели с границами включительно"""
+    days = list(AVAILABLE_DAYS)
+    for value in (day_from, day_to):
+        if value is not None and value not in DAY_INDEX:
+            raise ValueError(f'Неизвестный день: {value}')
+    start = DAY_INDEX[day_from] if day_from else 0
+    end = DAY_INDEX[day_to] if day_to else len(days) - 1
+    return days[start:end + 1]
+
+
+def row_key(row):
+    """Порядок строк расписания: день, урок, группа, id (как ORDER BY в query_rows)"""
+    return (DAY_INDEX.get(row[1], len(DAY_INDEX)), row[2], row[3], row[0])
+
+
+def encode_cursor(row):
+    return '.'.join(str(part) for part in row_key(row))
+
+
+def parse_cursor(value):
+    """Курсор '<день>.<урок>.<группа>.<id>' -> ключ последней отданной строки"""
+    try:
+        key = tuple(int(part) for part in value.split('.'))
+    except (AttributeError, ValueError):
+        raise ValueError('Некорректный курсор')
+    if len(key) != 4 or not 0 <= key[0] < len(AVAILABLE_DAYS):
+        raise ValueError('Некорректный курсор')
+    return key
+
+
+def page_rows(rows, limit=None):
+    """Страница из не более limit строк и курсор следующей. rows — выборка
+    query_rows(..., limit=limit) с одной лишней строкой-признаком продолжения"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
+
+
+def week_parity_for(week):
+    return 'even' if week % 2 == 0 else 'odd'
+
+
+def query_rows(schedule_type, semester, week=None, week_parity='both', days=None,
+               group_id=None, teacher_id=None, room_id=None, after=None, limit=None):
+    """Строки расписания кортежами без загрузки ORM-объектов и связей.
+
+    Возвращает (id, day, lesson_number, group_id, subject_id, teacher_id, room_id, flags),
+    отсортированные по дню, уроку, группе и id. Фильтры по группе,
+    преподавателю и аудитории идут по составным индексам. Страница
+    (строки после ключа after, не более limit + 1) выбирается в SQL.
+    """
+    if schedule_type == 'main':
+        model = MainScheduleEntry
+        query = MainScheduleEntry.query.with_entities(
+            MainScheduleEntry.id, MainScheduleEntry.day, MainScheduleEntry.lesson_number,
+            MainScheduleEntry.group_id, MainScheduleEntry.subject_id,
+            MainScheduleEntry.teacher_id, MainScheduleEntry.room_id,
+            MainScheduleEntry.week_parity
+        ).filter(MainScheduleEntry.semester == semester)
+
+        if week_parity != 'both':
+            query = query.filter(
+                (MainScheduleEntry.week_parity == week_parity) |
+                (MainScheduleEntry.week_parity == 'both')
+            )
+    else:
+        model = ScheduleEntry
+        query = ScheduleEntry.query.with_entities(
+            ScheduleEntry.id, ScheduleEntry.day, ScheduleEntry.lesson_number,
+            ScheduleEntry.group_id, ScheduleEntry.subject_id,
+            ScheduleEntry.teacher_id, ScheduleEntry.room_id,
+            ScheduleEntry.week_parity, ScheduleEntry.is_changed
+        ).filter(
+            ScheduleEntry.semester == semester,
+            ScheduleEntry.week_number == week
+        )
+
+    if days is not None and len(days) < len(AVAILABLE_DAYS):
+        query = query.filter(model.day.in_(days))
+    if group_id is not None:
+        query = query.filter(model.group_id == group_id)
+    if teacher_id is not None:
+        query = query.filter(model.teacher_id == teacher_id)
+    if room_id is not None:
+        query = query.filter(model.room_id == room_id)
+
+    day_order = case(DAY_INDEX, value=model.day, else_=len(DAY_INDEX))
+    order = (day_order, model.lesson_number, model.group_id, model.id)
+    if after is not None:
+        query = query.filter(tuple_(*order) > tuple_(*after))
+    query = query.order_by(*order)
+    if limit is not None:
+        # Лишняя строка показывает, что есть следующая страница
+        query = query.limit(limit + 1)
+
+    rows = []
+    for row in query:
+        flags = PARITY_FLAGS.get(row.week_parity, 0)
+        if schedule_type != 'main' and row.is_changed:
+            flags |= FLAG_CHANGED
+        rows.append((
+            row.id, row.day, row.lesson_number,
+            row.group_id, row.subject_id, row.teacher_id, row.room_id,
+            flags
+        ))
+    return rows
+
+
+def encode_columnar(rows, days, fields=COLUMNS):
+    """Колоночное представление со словарным кодированием.
+
+    Имена групп, предметов, преподавателей и аудиторий передаются один раз
+    в dims, а в колонках лежат индексы в эти массивы. День — индекс в days.
+    """
+    names = reference_cache.get_reference_data().names
+    day_index = {day: i for i, day in enumerate(days)}
+
+    columns = {}
+    dims = {}
+
+    if 'id' in fields:
+        columns['id'] = [r[0] for r in rows]
+    if 'day' in fields:
+        columns['day'] = [day_index[r[1]] for r in rows]
+    if 'lesson' in fields:
+        columns['lesson'] = [r[2] for r in rows]
+
+    for position, column in enumerate(('group', 'subject', 'teacher', 'room'), start=3):
+        if column not in fields:
+            continue
+
+        kind = DIMENSIONS[column]
+        index = {}
+        encoded = []
+        for r in rows:
+            value = r[position]
+            i = index.get(value)
+            if i is None:
+                i = index[value] = len(index)
+            encoded.append(i)
+
+        columns[column] = encoded
+        dims[column] = {
+            'id': list(index),
+            'name': [names[kind].get(value) for value in index]
+        }
+
+    if 'flags' in fields:
+        columns['flags'] = [r[7] for r in rows]
+
+    return {
+        'count': len(rows),
+        'days': days,
+        'dims': dims,
+        'columns': columns
+    }
+
+
+def encode_rows(schedule_type, rows):
+    """Построчный формат /api/schedule/current и /api/schedule/main.
+
+    Имена берутся из кэша справочников, а не через ленивые связи ORM.
+    """
+    names = reference_cache.get_reference_data().names
+    groups, subjects = names['groups'], names['subjects']
+    teachers, rooms = names['teachers'], names['rooms']
+
+    result = []
+    for entry_id, day, lesson, group_id, subject_id, teacher_id, room_id, flags in rows:
+        item = {
+            'id': entry_id,
+            'group': groups.get(group_id),
+            'subject': subjects.get(subject_id),
+            'teacher': teachers.get(teacher_id),
+            'room': rooms.get(room_id),
+            'day': day,
+            'lesson_number': lesson,
+            'pair': get_pair_number_by_lesson(day, lesson),
+            'time': get_lesson_pair_time(day, lesson)
+        }
+        if schedule_type == 'main':
+            item['week_parity'] = parity_from_flags(flags)
+        else:
+            item['is_changed'] = bool(flags & FLAG_CHANGED)
+        result.append(item)
+    return result
+
+
+def build_day(schedule_type, semester, day, week=None, week_parity='both'):
+    """JSON-байты расписания на один день"""
+    rows = query_rows(schedule_type, semester, week, week_parity, [day])
+    return reference_cache.dumps(encode_rows(schedule_type, rows))
+
+
+def build_rows(schedule_type, semester, week=None, week_parity='both', days=AVAILABLE_DAYS,
+               filters=None, after=None, limit=None):
+    """JSON-байты построчного расписания с фильтрами и страницей после курсора.
+
+    Возвращает (body, next_cursor); next_cursor = None на последней странице.
+    """
+    days = list(days)
+    if after is not None:
+        # Дни до курсора уже отданы, их не запрашиваем
+        days = [day for day in days if DAY_INDEX[day] >= after[0]]
+    rows = query_rows(schedule_type, semester, week, week_parity, days, after=after, limit=limit, **(filters or {}))
+    rows, next_cursor = page_rows(rows, limit)
+    return reference_cache.dumps(encode_rows(schedule_type, rows)), next_cursor
+
+
+def build_week(schedule_type, semester, week=None, week_parity='both', days=AVAILABLE_DAYS, fields=COLUMNS):
+    """JSON-байты колоночного расписания на несколько дней"""
+    days = list(days)
+    rows = query_rows(schedule_type, semester, week, week_parity, days)
+    payload = encode_columnar(rows, days, fields)
+    payload.update({
+        'type': schedule_type,
+        'semester': semester,
+        'week': week if schedule_type == 'current' else None,
+        'week_parity': week_parity
+    })
+    return reference_cache.dumps(payload)
@@ -0,0 +1,182 @@
+# schedule_stats.py
+from collections import defaultdict
+
+from sqlalchemy import case, event, func, literal
+from sqlalchemy.orm import Session
+
+from models import db, ScheduleEntry, ScheduleStat
+import schedule_versions
+
+GROUP = 'group'
+TEACHER = 'teacher'
+
+# Поле записи, по которому ведется сводка
+KIND_COLUMNS = {GROUP: 'group_id', TEACHER: 'teacher_id'}
+
+# Одно занятие засчитывается как 2 часа (как и раньше на страницах статистики)
+HOURS_PER_LESSON = 2
+
+# Сколько событий текущей транзакции уже учтено в сводке
+APPLIED_KEY = 'schedule_events_counted'
+
+
+def _contributions(values):
+    """Строки сводки, в которые входит занятие: [(ключ, изменено ли)]"""
+    changed = 1 if values.get('is_changed') else 0
+    return [
+        ((values['semester'], values['week'], kind, values[field]), changed)
+        for kind, field in KIND_COLUMNS.items()
+        if values.get(field) is not None
+    ]
+
+
+def _collect(events):
+    """Приращения {ключ: [занятия, измененные]} и недели для пересчета {(семестр, неделя или None)}.
+
+    Запись, измененная в транзакции несколько раз, учитывается один раз:
+    состояние до первого события против состояния после последнего
+    (история атрибутов до flush хранит значение еще до первой правки).
+    """
+    first = {}
+    last = {}
+    refresh = set()
+    for pending in events:
+        if pending['type'] != schedule_versions.CURRENT:
+            continue
+        if pending['op'] == 'refresh':
+            refresh.add((pending['semester'], pending['week']))
+            continue
+        first.setdefault(pending['id'], pending)
+        last[pending['id']] = pending
+
+    deltas = defaultdict(lambda: [0, 0])
+    for entry_id, pending in first.items():
+        if pending['op'] != 'add':
+            for key, changed in _contributions(dict(pending, **pending.get('old', {}))):
+                deltas[key][0] -= 1
+                deltas[key][1] -= changed
+        if last[entry_id]['op'] != 'delete':
+            for key, changed in _contributions(last[entry_id]):
+                deltas[key][0] += 1
+                deltas[key][1] += changed
+
+    # Недели, которые пересчитываются целиком, приращения уже не нужны
+    return {
+        key: delta for key, delta in deltas.items()
+        if any(delta) and (key[0], key[1]) not in refresh and (key[0], None) not in refresh
+    }, refresh
+
+
+def _week_filter(table, semester, week):
+    conditions = [table.c.semester == semester]
+    if week:
+        conditions.append(table.c.week_number == week)
+    return conditions
+
+
+def recompute(semester, week=None, session=None):
+    """Пересчитать сводку недели (или всего семестра) по записям одним GROUP BY на вид"""
+    session = session or db.session
+    stats = ScheduleStat.__table__
+    entries = ScheduleEntry.__table__
+    session.execute(stats.delete().where(*_week_filter(stats, semester, week)))
+
+    for kind, field in KIND_COLUMNS.items():
+        column = entries.c[field]
+        lessons = func.count(entries.c.id)
+        select = db.select(
+            entries.c.semester,
+            entries.c.week_number,
+            literal(kind),
+            column,
+            lessons,
+            func.sum(case((entries.c.is_changed == True, 1), else_=0)),
+            lessons * HOURS_PER_LESSON
+        ).where(
+            *_week_filter(entries, semester, week), column.isnot(None)
+        ).group_by(entries.c.semester, entries.c.week_number, column)
+        session.execute(stats.insert().from_select(
+            ['semester', 'week_number', 'kind', 'entity_id', 'lessons', 'changed_lessons', 'hours'], select
+        ))
+
+
+def _apply(session, deltas):
+    stats = ScheduleStat.__table__
+    weeks = set()
+    for (semester, week, kind, entity_id), (lessons, changed) in deltas.items():
+        key = (
+            stats.c.semester == semester,
+            stats.c.week_number == week,
+            stats.c.kind == kind,
+            stats.c.entity_id == entity_id
+        )
+        updated = session.execute(stats.update().where(*key).values(
+            lessons=stats.c.lessons + lessons,
+            changed_lessons=stats.c.changed_lessons + changed,
+            hours=(stats.c.lessons + lessons) * HOURS_PER_LESSON
+        )).rowcount
+        if not updated:
+            session.execute(stats.insert().values(
+                semester=semester, week_number=week, kind=kind, entity_id=entity_id,
+                lessons=lessons, changed_lessons=changed, hours=lessons * HOURS_PER_LESSON
+            ))
+        weeks.add((semester, week))
+
+    # Пустые строки не храним: сводка недели — только реально занятые группы и преподаватели
+    for semester, week in weeks:
+        session.execute(stats.delete().where(
+            stats.c.semester == semester, stats.c.week_number == week, stats.c.lessons <= 0
+        ))
+
+
+@event.listens_for(Session, 'before_commit')
+def _count_pending_events(session):
+    """Обновить сводку по событиям транзакции перед commit (в той же транзакции)"""
+    events = session.info.get(schedule_versions.EVENTS_KEY)
+    if not events:
+        return
+    applied = session.info.get(APPLIED_KEY, 0)
+    deltas, refresh = _collect(events[applied:])
+    session.info[APPLIED_KEY] = len(events)
+    if not deltas and not refresh:
+        return
+
+    session.flush()
+    for semester, week in refresh:
+        if week is None or (semester, None) not in refresh:
+            recompute(semester, week, session)
+    _apply(session, deltas)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    session.info.pop(APPLIED_KEY, None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(APPLIED_KEY, None)
+
+
+def rebuild():
+    """Пересчитать всю сводку заново (восстановление после правок в обход приложения)"""
+    semesters = [semester for (semester,) in db.session.query(ScheduleEntry.semester).distinct()]
+    ScheduleStat.query.delete()
+    for semester in semesters:
+        recompute(semester)
+    return ScheduleStat.query.count()
+
+
+def week_stats(semester, week):
+    """Сводка недели: {вид: {id: (занятия, измененные, часы)}}"""
+    result = {kind: {} for kind in KIND_COLUMNS}
+    rows = db.session.query(
+        ScheduleStat.kind, ScheduleStat.entity_id, ScheduleStat.lessons,
+        ScheduleStat.changed_lessons, ScheduleStat.hours
+    ).filter(
+        ScheduleStat.semester == semester,
+        ScheduleStat.week_number == week
+    )
+    for kind, entity_id, lessons, changed, hours in rows:
+        result.setdefault(kind, {})[entity_id] = (lessons, changed, hours)
+    return result
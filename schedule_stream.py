@@ -0,0 +1,126 @@
+# schedule_stream.py
+import json
+import queue
+import threading
+
+import schedule_versions
+
+
+def _values(event, key):
+    """Новое и прежнее (для update) значения поля события"""
+    return {event.get(key), event.get('old', {}).get(key, event.get(key))}
+
+
+class Subscriber:
+    """Подписка одного клиента SSE с ограниченной очередью событий"""
+
+    def __init__(self, schedule_type, semester, week=None, group_id=None, teacher_id=None, max_queue=100):
+        self.schedule_type = schedule_type
+        self.semester = semester
+        self.week = week
+        self.group_id = group_id
+        self.teacher_id = teacher_id
+        self.queue = queue.Queue(maxsize=max_queue)
+
+    def matches(self, event):
+        if event['type'] != self.schedule_type or event['semester'] != self.semester:
+            return False
+
+        # Занятие, перенесенное с недели / группы / преподавателя подписки,
+        # тоже касается подписчика: у него оно должно исчезнуть
+        if self.schedule_type == schedule_versions.CURRENT and not _values(event, 'week') & {None, self.week}:
+            return False
+
+        if event['op'] == 'refresh':
+            return True
+
+        if self.group_id is not None and self.group_id not in _values(event, 'group_id'):
+            return False
+        if self.teacher_id is not None and self.teacher_id not in _values(event, 'teacher_id'):
+            return False
+        return True
+
+    def offer(self, event):
+        """Положить событие в очередь, не блокируя производителя.
+
+        Если клиент не успевает читать, очередь сбрасывается и заменяется
+        одним событием refresh — клиент просто перезагрузит данные.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait({
+                'op': 'refresh',
+                'type': self.schedule_type,
+                'semester': self.semester,
+                'week': self.week,
+                'reason': 'overflow'
+            })
+
+
+class Broker:
+    """Раздача событий изменений расписания подписчикам внутри процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            for subscriber in subscribers:
+                if subscriber.matches(event):
+                    subscriber.offer(event)
+
+    def count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broker = Broker()
+
+
+@schedule_versions.add_commit_listener
+def _publish_changes(changes, events):
+    broker.publish(events)
+
+
+def format_event(event):
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event["op"]}\ndata: {data}\n\n'
+
+
+def event_stream(subscriber, heartbeat=15):
+    """Генератор SSE. Раз в heartbeat секунд шлет комментарий, чтобы
+    прокси не закрывали соединение и отключившиеся клиенты обнаруживались.
+
+    Подписка оформляется при первом чтении потока, чтобы клиент, ушедший до
+    начала ответа, не остался в брокере.
+    """
+    broker.subscribe(subscriber)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event = subscriber.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,212 @@
+# schedule_versions.py
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, ScheduleEntry, ScheduleVersion
+import reference_cache
+
+CURRENT = 'current'
+MAIN = 'main'
+
+SEMESTERS = (1, 2)
+
+# Ключи (scope, semester, week_number), измененные в текущей транзакции
+SESSION_KEY = 'schedule_changes'
+# Компактные события изменений текущей транзакции (для подписчиков)
+EVENTS_KEY = 'schedule_events'
+
+logger = logging.getLogger(__name__)
+
+# Функции listener(changes, events), которые вызываются после commit
+_commit_listeners = []
+
+
+def add_commit_listener(listener):
+    _commit_listeners.append(listener)
+    return listener
+
+
+# Поля записи, прежние значения которых передаются в событии update
+TRACKED_FIELDS = {
+    'day': 'day',
+    'lesson_number': 'lesson',
+    'group_id': 'group_id',
+    'teacher_id': 'teacher_id',
+    'room_id': 'room_id',
+    'week_number': 'week',
+    'is_changed': 'is_changed'
+}
+
+
+def previous_values(entry):
+    """Значения отслеживаемых полей до изменения (по истории атрибутов до flush)"""
+    state = inspect(entry)
+    old = {}
+    for field, key in TRACKED_FIELDS.items():
+        if field not in state.attrs:
+            continue  # у записей основного расписания нет недели и отметки изменения
+        deleted = state.attrs[field].history.deleted
+        if deleted:
+            old[key] = deleted[0]
+    return old
+
+
+def entry_event(entry, op):
+    """Событие об изменении одной записи: op = add / update / delete.
+
+    Для update в old передаются прежние день, урок, группа, преподаватель,
+    аудитория, неделя и отметка изменения, если они менялись.
+    """
+    event = {
+        'op': op,
+        'type': CURRENT if isinstance(entry, ScheduleEntry) else MAIN,
+        'id': entry.id,
+        'semester': entry.semester,
+        'week': getattr(entry, 'week_number', None),
+        'day': entry.day,
+        'lesson': entry.lesson_number,
+        'group_id': entry.group_id,
+        'subject_id': entry.subject_id,
+        'teacher_id': entry.teacher_id,
+        'room_id': entry.room_id
+    }
+    if event['type'] == CURRENT:
+        event['is_changed'] = bool(entry.is_changed)
+    else:
+        event['week_parity'] = entry.week_parity
+    if op == 'update':
+        old = previous_values(entry)
+        if old:
+            event['old'] = old
+    return event
+
+
+def _bump(scope, semester, week=0, event=None):
+    """Увеличить счетчик в текущей транзакции (не более одного раза за транзакцию).
+
+    Без event изменение считается массовым, и подписчики получают
+    событие refresh для всего ключа.
+    """
+    key = (scope, int(semester), int(week or 0))
+    changes = db.session.info.setdefault(SESSION_KEY, set())
+    events = db.session.info.setdefault(EVENTS_KEY, [])
+
+    if event is None:
+        event = {'op': 'refresh', 'type': scope, 'semester': key[1], 'week': key[2] or None}
+        if event in events:
+            return
+    events.append(event)
+
+    if key in changes:
+        return
+    changes.add(key)
+
+    updated = ScheduleVersion.query.filter_by(
+        scope=key[0],
+        semester=key[1],
+        week_number=key[2]
+    ).update({ScheduleVersion.version: ScheduleVersion.version + 1}, synchronize_session=False)
+
+    if not updated:
+        db.session.add(ScheduleVersion(scope=key[0], semester=key[1], week_number=key[2], version=1))
+
+
+def bump_week(semester, week):
+    """Изменилась неделя текущего расписания"""
+    _bump(CURRENT, semester, week)
+
+
+def bump_semester(semester):
+    """Изменились сразу все недели семестра (массовое удаление)"""
+    _bump(CURRENT, semester, 0)
+
+
+def bump_main(semester):
+    """Изменилось основное расписание семестра"""
+    _bump(MAIN, semester, 0)
+
+
+def bump_entry(entry, op='update'):
+    """Отметить изменение записи ScheduleEntry или MainScheduleEntry"""
+    if op == 'add' and entry.id is None:
+        db.session.flush()
+
+    event = entry_event(entry, op)
+    if isinstance(entry, ScheduleEntry):
+        _bump(CURRENT, entry.semester, entry.week_number, event)
+    else:
+        _bump(MAIN, entry.semester, 0, event)
+
+
+def bump_all():
+    """Изменилось все расписание (например, удалена группа)"""
+    for semester in SEMESTERS:
+        bump_semester(semester)
+        bump_main(semester)
+
+
+def pending_changes(session=None):
+    session = session or db.session
+    return set(session.info.get(SESSION_KEY, ()))
+
+
+def pending_events(session=None):
+    session = session or db.session
+    return list(session.info.get(EVENTS_KEY, ()))
+
+
+def get_week_version(semester, week):
+    """(поколение семестра, версия недели) одним запросом по первичному ключу"""
+    rows = ScheduleVersion.query.with_entities(
+        ScheduleVersion.week_number, ScheduleVersion.version
+    ).filter(
+        ScheduleVersion.scope == CURRENT,
+        ScheduleVersion.semester == semester,
+        ScheduleVersion.week_number.in_([0, week])
+    ).all()
+    versions = {row.week_number: row.version for row in rows}
+    return versions.get(0, 0), versions.get(week, 0) if week else 0
+
+
+def get_main_version(semester):
+    row = ScheduleVersion.query.get((MAIN, semester, 0))
+    return row.version if row else 0
+
+
+def week_etag(semester, week):
+    generation, version = get_week_version(semester, week)
+    ref = reference_cache.get_reference_data().etag[:8]
+    return f'c{semester}.{week}.{generation}.{version}.{ref}'
+
+
+def main_etag(semester):
+    ref = reference_cache.get_reference_data().etag[:8]
+    return f'm{semester}.{get_main_version(semester)}.{ref}'
+
+
+def affects(changes, scope, semester, week=0):
+    """Затрагивают ли изменения ключ (с учетом поколения семестра)"""
+    return (scope, semester, week) in changes or (
+        scope == CURRENT and (CURRENT, semester, 0) in changes
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    changes = session.info.pop(SESSION_KEY, None)
+    events = session.info.pop(EVENTS_KEY, None) or []
+    if not changes:
+        return
+    for listener in _commit_listeners:
+        try:
+            listener(changes, events)
+        except Exception:
+            logger.exception('Ошибка обработчика изменений расписания')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(SESSION_KEY, None)
+    session.info.pop(EVENTS_KEY, None)
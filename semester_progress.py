@@ -0,0 +1,181 @@
+# semester_progress.py
+import math
+import threading
+from collections import Counter
+
+from sqlalchemy import func
+
+from models import db, ScheduleEntry, ScheduleVersion, GroupSubject
+from schedule_stats import HOURS_PER_LESSON
+import reference_cache
+import schedule_versions
+import settings_service
+
+STATUSES = ('on_track', 'behind', 'ahead', 'over', 'done', 'no_target')
+
+_options = {'tolerance_weeks': 1}
+
+
+def init_semester_progress(app):
+    _options['tolerance_weeks'] = app.config.get('PROGRESS_TOLERANCE_WEEKS', 1)
+
+
+class SemesterCounts:
+    """Проведенные занятия семестра по неделям: {неделя: Counter((группа, предмет) -> занятия)}.
+
+    Каждая неделя помнит версию ScheduleVersion, с которой посчитана, и
+    пересчитывается только после правки именно этой недели; при переходе
+    на следующую неделю досчитывается одна новая неделя.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.weeks = {}
+        self.versions = {}
+
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _counters(semester):
+    """Версии недель текущего расписания семестра одним запросом: {неделя: версия}"""
+    return dict(db.session.query(ScheduleVersion.week_number, ScheduleVersion.version).filter(
+        ScheduleVersion.scope == schedule_versions.CURRENT,
+        ScheduleVersion.semester == semester
+    ))
+
+
+def _count_weeks(semester, weeks):
+    """Занятия по (неделя, группа, предмет) для нескольких недель одним GROUP BY"""
+    result = {week: Counter() for week in weeks}
+    rows = db.session.query(
+        ScheduleEntry.week_number, ScheduleEntry.group_id, ScheduleEntry.subject_id, func.count(ScheduleEntry.id)
+    ).filter(
+        ScheduleEntry.semester == semester,
+        ScheduleEntry.week_number.in_(weeks)
+    ).group_by(ScheduleEntry.week_number, ScheduleEntry.group_id, ScheduleEntry.subject_id)
+    for week, group_id, subject_id, lessons in rows:
+        result[week][(group_id, subject_id)] = lessons
+    return result
+
+
+def week_counts(semester, last_week):
+    """Счетчики недель 1..last_week из кэша, устаревшие недели досчитываются"""
+    counters = _counters(semester)
+    generation = counters.get(0, 0)
+    with _lock:
+        counts = _cache.get(semester)
+        if counts is None or counts.generation != generation:
+            counts = _cache[semester] = SemesterCounts(generation)
+        stale = [
+            week for week in range(1, last_week + 1)
+            if week not in counts.weeks or counts.versions[week] != counters.get(week, 0)
+        ]
+        if stale:
+            for week, counter in _count_weeks(semester, stale).items():
+                counts.weeks[week] = counter
+                counts.versions[week] = counters.get(week, 0)
+        return {week: counts.weeks[week] for week in range(1, last_week + 1)}
+
+
+def elapsed_weeks(semester):
+    """(прошедшие недели, текущая неделя или None) для семестра.
+
+    Для текущего семестра прошедшие — недели до текущей; прошлый семестр
+    считается завершенным (все недели с расписанием), будущий — не начатым.
+    """
+    current_semester = settings_service.get_current_semester()
+    if semester == current_semester:
+        week = settings_service.get_current_week()
+        return week - 1, week
+    if semester < current_semester:
+        last = db.session.query(func.max(ScheduleEntry.week_number)).filter(
+            ScheduleEntry.semester == semester
+        ).scalar()
+        return last or 0, None
+    return 0, None
+
+
+def _assess(target, per_week, delivered, elapsed):
+    """Статус, ожидаемые к этому моменту часы и прогноз недели завершения"""
+    expected = min(target, per_week * elapsed)
+    projected = math.ceil(target * elapsed / delivered) if delivered and elapsed else None
+    if not target:
+        return 'no_target', expected, projected
+    if delivered > target:
+        return 'over', expected, projected
+    if delivered == target:
+        return 'done', expected, projected
+
+    tolerance = per_week * _options['tolerance_weeks']
+    if delivered < expected - tolerance:
+        return 'behind', expected, projected
+    if delivered > expected + tolerance:
+        return 'ahead', expected, projected
+    return 'on_track', expected, projected
+
+
+def semester_progress(semester):
+    """Выполнение учебного плана семестра по каждой паре группа — предмет.
+
+    Проведенными считаются занятия текущего расписания за прошедшие недели,
+    цель — total_hours_semester1/2 плана. Прогноз недели завершения — по
+    среднему темпу прошедших недель.
+    """
+    elapsed, current_week = elapsed_weeks(semester)
+    weeks = week_counts(semester, current_week or elapsed)
+    delivered = Counter()
+    for week in range(1, elapsed + 1):
+        delivered.update(weeks[week])
+    scheduled = weeks.get(current_week, Counter()) if current_week else Counter()
+
+    data = reference_cache.get_reference_data()
+    courses = {row[0]: row[2] for row in data.rows['groups']}
+    target_field = GroupSubject.total_hours_semester1 if semester == 1 else GroupSubject.total_hours_semester2
+
+    items = []
+    summary = dict.fromkeys(STATUSES, 0)
+    plan = db.session.query(
+        GroupSubject.group_id, GroupSubject.subject_id, GroupSubject.teacher_id, GroupSubject.hours_per_week, target_field
+    ).order_by(GroupSubject.group_id, GroupSubject.id)
+    for group_id, subject_id, teacher_id, per_week, target in plan:
+        per_week = per_week or 0
+        target = target or 0
+        lessons = delivered.get((group_id, subject_id), 0)
+        hours = lessons * HOURS_PER_LESSON
+        status, expected, projected = _assess(target, per_week, hours, elapsed)
+        summary[status] += 1
+
+        items.append({
+            'group_id': group_id,
+            'group_name': data.names['groups'].get(group_id),
+            'course': courses.get(group_id),
+            'subject_name': data.names['subjects'].get(subject_id),
+            'teacher_name': data.names['teachers'].get(teacher_id) if teacher_id else 'Не назначен',
+            'hours_per_week': per_week,
+            'target_hours': target,
+            'delivered_lessons': lessons,
+            'delivered_hours': hours,
+            'scheduled_hours': scheduled.get((group_id, subject_id), 0) * HOURS_PER_LESSON,
+            'expected_hours': expected,
+            'remaining_hours': max(0, target - hours),
+            'progress': int(hours / target * 100) if target else 0,
+            'planned_weeks': math.ceil(target / per_week) if target and per_week else None,
+            'projected_week': projected,
+            'status': status
+        })
+
+    return {
+        'semester': semester,
+        'current_week': current_week,
+        'weeks_elapsed': elapsed,
+        'summary': summary,
+        'items': items
+    }
+
+
+def warm(semester):
+    """Досчитать неделю, закрытую переходом на следующую (вызывается после перехода)"""
+    elapsed, current_week = elapsed_weeks(semester)
+    week_counts(semester, current_week or elapsed)
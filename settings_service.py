@@ -0,0 +1,173 @@
+# settings_service.py
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import Integer, String, cast, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, AppSettings
+
+# Счетчик изменений настроек: по нему другие воркеры узнают, что кэш устарел
+SETTINGS_VERSION_KEY = 'settings_version'
+
+DEFAULTS = {
+    'current_week': '1',
+    'current_semester': '1'
+}
+
+_lock = threading.Lock()
+_state = {
+    'values': None,
+    'version': None,
+    'checked_at': 0.0
+}
+
+
+def _check_interval():
+    if has_app_context():
+        return current_app.config.get('SETTINGS_CHECK_INTERVAL', 2)
+    return 2
+
+
+def _read_version():
+    row = AppSettings.query.get(SETTINGS_VERSION_KEY)
+    return row.value if row else '0'
+
+
+def _reload():
+    values = {s.key: s.value for s in AppSettings.query.all()}
+    _state['values'] = values
+    _state['version'] = values.get(SETTINGS_VERSION_KEY, '0')
+    _state['checked_at'] = time.monotonic()
+    return values
+
+
+def _values():
+    """Снимок настроек из памяти процесса.
+
+    Раз в SETTINGS_CHECK_INTERVAL секунд сверяем счетчик изменений с БД,
+    чтобы подхватить записи, сделанные другими воркерами.
+    """
+    values = _state['values']
+    if values is not None and time.monotonic() - _state['checked_at'] < _check_interval():
+        return values
+
+    with _lock:
+        values = _state['values']
+        if values is None:
+            return _reload()
+
+        if time.monotonic() - _state['checked_at'] >= _check_interval():
+            if _read_version() != _state['version']:
+                return _reload()
+            _state['checked_at'] = time.monotonic()
+
+        return _state['values']
+
+
+def get_setting(key, default=None):
+    return _values().get(key, DEFAULTS.get(key, default))
+
+
+def get_int_setting(key, default=0):
+    try:
+        return int(get_setting(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_settings_version():
+    return int(_values().get(SETTINGS_VERSION_KEY, '0'))
+
+
+def get_current_week():
+    return get_int_setting('current_week', 1)
+
+
+def get_current_semester():
+    return get_int_setting('current_semester', 1)
+
+
+def _upsert(key, value):
+    setting = AppSettings.query.get(key)
+    if setting:
+        setting.value = str(value)
+    else:
+        setting = AppSettings(key=key, value=str(value))
+        db.session.add(setting)
+    return setting
+
+
+def _ensure_row(key):
+    """Завести строку счетчика со значением 0, если ее нет (INSERT ... без ошибки
+    при конфликте в диалекте текущей БД)"""
+    table = AppSettings.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(sqlite.insert(table).values(key=key, value='0').on_conflict_do_nothing())
+    elif dialect == 'postgresql':
+        db.session.execute(postgresql.insert(table).values(key=key, value='0').on_conflict_do_nothing())
+    elif dialect in ('mysql', 'mariadb'):
+        db.session.execute(table.insert().prefix_with('IGNORE').values(key=key, value='0'))
+    elif not AppSettings.query.filter_by(key=key).count():
+        # Прочие БД: вставка в точке сохранения, конфликт значит, что строку уже завел другой воркер
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(key=key, value='0'))
+        except IntegrityError:
+            pass
+
+
+def _increment(key):
+    """Увеличить счетчик в БД одним UPDATE и вернуть новое значение.
+
+    value + 1 считает сама БД (строка блокируется до конца транзакции),
+    поэтому два воркера не получат одинаковый номер, как при чтении с
+    последующей записью.
+    """
+    table = AppSettings.__table__
+    _ensure_row(key)
+    db.session.execute(table.update().where(table.c.key == key).values(
+        value=cast(cast(table.c.value, Integer) + 1, String)
+    ))
+    return int(db.session.query(AppSettings.value).filter(AppSettings.key == key).scalar())
+
+
+def set_setting(key, value):
+    """Записать настройку в текущую транзакцию.
+
+    Счетчик изменений увеличивается в той же транзакции, а кэш процесса
+    сбрасывается только после успешного commit.
+    """
+    _upsert(key, value)
+    _increment(SETTINGS_VERSION_KEY)
+    db.session.info['settings_dirty'] = True
+
+
+def increment_setting(key):
+    """Увеличить числовую настройку-счетчик в текущей транзакции (атомарно в БД)"""
+    value = _increment(key)
+    _increment(SETTINGS_VERSION_KEY)
+    db.session.info['settings_dirty'] = True
+    return value
+
+
+def invalidate():
+    with _lock:
+        _state['values'] = None
+        _state['version'] = None
+        _state['checked_at'] = 0.0
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('settings_dirty', False):
+        invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('settings_dirty', None)
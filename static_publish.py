@@ -0,0 +1,317 @@
+# static_publish.py
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from flask import render_template
+
+from models import db, ScheduleChange, ScheduleEntry, MainScheduleEntry
+from initial_data import AVAILABLE_DAYS
+from http_cache import content_etag
+import change_journal
+import reference_cache
+import schedule_payloads
+import schedule_versions
+import settings_service
+import timetables
+
+# Имена файлов дней латиницей, чтобы их без перекодирования отдавал любой веб-сервер
+DAY_SLUGS = dict(zip(AVAILABLE_DAYS, ('mon', 'tue', 'wed', 'thu', 'fri', 'sat')))
+
+MANIFEST = 'manifest.json'
+# Служебное состояние последней публикации (не отдается клиентам)
+STATE = 'state.json'
+CURRENT_LINK = 'current'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_timer_lock = threading.Lock()
+_timer = None
+_app = None
+_options = {'root': None, 'debounce': 5, 'keep': 3}
+# Кэш указателя на текущую версию: (mtime state.json, каталог версии)
+_current = {'mtime': None, 'path': None}
+
+
+def init_static_publish(app):
+    global _app
+    _app = app
+    _options['root'] = app.config.get('STATIC_PUBLISH_DIR')
+    _options['debounce'] = app.config.get('STATIC_PUBLISH_DEBOUNCE', 5)
+    _options['keep'] = app.config.get('STATIC_PUBLISH_KEEP', 3)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_state():
+    root = _options['root']
+    return _read_json(os.path.join(root, STATE)) if root else None
+
+
+def current_dir():
+    """Каталог опубликованной версии или None. Указатель перечитывается
+    только при изменении state.json (его мог обновить другой воркер)."""
+    root = _options['root']
+    if not root:
+        return None
+    try:
+        mtime = os.stat(os.path.join(root, STATE)).st_mtime
+    except OSError:
+        return None
+    if mtime != _current['mtime']:
+        state = _read_json(os.path.join(root, STATE))
+        _current['path'] = os.path.join(root, f'v{state["version"]}') if state else None
+        _current['mtime'] = mtime
+    return _current['path']
+
+
+def _locations(semester, week):
+    """Где сейчас лежит каждая запись: {scope: {id: [день, группа]}}"""
+    current = db.session.query(ScheduleEntry.id, ScheduleEntry.day, ScheduleEntry.group_id).filter(
+        ScheduleEntry.semester == semester,
+        ScheduleEntry.week_number == week
+    )
+    main = db.session.query(MainScheduleEntry.id, MainScheduleEntry.day, MainScheduleEntry.group_id).filter(
+        MainScheduleEntry.semester == semester
+    )
+    return {
+        schedule_versions.CURRENT: {str(id): [day, group_id] for id, day, group_id in current},
+        schedule_versions.MAIN: {str(id): [day, group_id] for id, day, group_id in main}
+    }
+
+
+def _touched(state, latest, semester, week):
+    """Дни текущего / основного расписания и группы, затронутые изменениями
+    после прошлой публикации. Прежнее место записи берется из состояния
+    публикации: при переносе занятия обновляется и старый день."""
+    days = {schedule_versions.CURRENT: set(), schedule_versions.MAIN: set()}
+    groups = set()
+    everything = set(AVAILABLE_DAYS)
+
+    changes = db.session.query(
+        ScheduleChange.op, ScheduleChange.scope, ScheduleChange.week_number, ScheduleChange.entry_id,
+        ScheduleChange.day, ScheduleChange.group_id
+    ).filter(
+        ScheduleChange.seq > state['seq'],
+        ScheduleChange.seq <= latest,
+        ScheduleChange.semester == semester
+    )
+    for op, scope, change_week, entry_id, day, group_id in changes:
+        if scope == schedule_versions.CURRENT and change_week not in (week, None):
+            continue
+        if op == 'refresh':
+            days[scope] |= everything
+            if scope == schedule_versions.CURRENT:
+                groups.add(None)
+            continue
+
+        days[scope].add(day)
+        previous = state['entries'][scope].get(str(entry_id))
+        if previous:
+            days[scope].add(previous[0])
+        if scope == schedule_versions.CURRENT:
+            groups.add(group_id)
+            if previous:
+                groups.add(previous[1])
+    return days, groups
+
+
+def _render_files(semester, week, days, group_ids, published_at):
+    """Отрисовать файлы версии: {относительный путь: байты}"""
+    files = {}
+    for day in days[schedule_versions.CURRENT]:
+        files[f'current/{DAY_SLUGS[day]}.json'] = schedule_payloads.build_day(
+            schedule_versions.CURRENT, semester, day, week=week
+        )
+    for day in days[schedule_versions.MAIN]:
+        files[f'main/{DAY_SLUGS[day]}.json'] = schedule_payloads.build_day(schedule_versions.MAIN, semester, day)
+
+    for group_id in group_ids:
+        body, _ = timetables.build_grid('group', group_id, schedule_versions.CURRENT, semester, week)
+        files[f'groups/{group_id}.json'] = body
+        files[f'groups/{group_id}.html'] = render_template(
+            'published_group.html', grid=json.loads(body), published_at=published_at
+        ).encode('utf-8')
+    return files
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _switch_link(root, version):
+    """Символическая ссылка current -> vN для внешнего веб-сервера (где ОС позволяет)"""
+    link = os.path.join(root, CURRENT_LINK)
+    tmp = f'{link}.tmp{os.getpid()}'
+    try:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(f'v{version}', tmp, target_is_directory=True)
+        os.replace(tmp, link)
+    except OSError:
+        pass
+
+
+def _claim_version(root, version):
+    """Занять каталог vN атомарным os.mkdir: если его уже создал другой
+    воркер (или осталась прерванная публикация), берется следующий номер"""
+    while True:
+        target = os.path.join(root, f'v{version}')
+        try:
+            os.mkdir(target)
+            return version, target
+        except FileExistsError:
+            version += 1
+
+
+def _write_state(root, state):
+    """Записать состояние, если другой воркер не успел опубликовать более новую версию"""
+    published = read_state()
+    if published and published['version'] > state['version']:
+        return False
+    _write_atomic(os.path.join(root, STATE), reference_cache.dumps(state))
+    return True
+
+
+def _prune(root, version):
+    for name in os.listdir(root):
+        if name.startswith('v') and name[1:].isdigit() and int(name[1:]) <= version - _options['keep']:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def publish(full=False):
+    """Опубликовать снимок текущей недели в новый каталог vN.
+
+    Перерисовываются только дни и группы, затронутые изменениями из журнала
+    после прошлой публикации, остальные файлы переносятся из прошлой версии
+    жесткими ссылками. Полная публикация — при смене недели или семестра,
+    справочников или если журнал уже сжат. Возвращает состояние публикации.
+    """
+    root = _options['root']
+    with _lock:
+        os.makedirs(root, exist_ok=True)
+        semester = settings_service.get_current_semester()
+        week = settings_service.get_current_week()
+        low, latest = change_journal.journal_bounds()
+        data = reference_cache.get_reference_data()
+        group_ids = sorted(data.names['groups'])
+
+        state = read_state()
+        previous_dir = state and os.path.join(root, f'v{state["version"]}')
+        full = (
+            full or state is None
+            or (state['semester'], state['week'], state['ref_etag']) != (semester, week, data.etag)
+            or (low and state['seq'] < low - 1)
+            or not os.path.isdir(previous_dir)
+        )
+
+        if full:
+            days = {scope: set(AVAILABLE_DAYS) for scope in (schedule_versions.CURRENT, schedule_versions.MAIN)}
+            render_groups = group_ids
+        else:
+            if state['seq'] == latest:
+                return state
+            days, groups = _touched(state, latest, semester, week)
+            render_groups = group_ids if None in groups else [g for g in group_ids if g in groups]
+
+        # _lock защищает только этот процесс, номер версии занимается через файловую систему
+        version, target = _claim_version(root, state['version'] + 1 if state else 1)
+        for folder in ('current', 'main', 'groups'):
+            os.makedirs(os.path.join(target, folder))
+
+        published_at = datetime.now().strftime('%d.%m.%Y %H:%M')
+        files = _render_files(semester, week, days, render_groups, published_at)
+        if full:
+            files['groups/index.html'] = render_template(
+                'published_index.html',
+                groups=[(group_id, data.names['groups'][group_id]) for group_id in group_ids],
+                semester=semester, week=week, published_at=published_at
+            ).encode('utf-8')
+
+        etags = dict(state['files']) if not full else {}
+        for path, body in files.items():
+            with open(os.path.join(target, path), 'wb') as f:
+                f.write(body)
+            etags[path] = content_etag(body)
+        if not full:
+            for path in etags:
+                if path not in files:
+                    _link_or_copy(os.path.join(previous_dir, path), os.path.join(target, path))
+
+        # seq — последняя запись журнала, вошедшая в снимок: клиент сверяет его
+        # с /api/schedule/changes и при отставании читает живой API
+        manifest = {
+            'version': version, 'semester': semester, 'week': week, 'seq': latest,
+            'published_at': published_at, 'files': etags
+        }
+        _write_atomic(os.path.join(target, MANIFEST), reference_cache.dumps(manifest))
+
+        state = dict(manifest, ref_etag=data.etag, entries=_locations(semester, week))
+        if _write_state(root, state):
+            _switch_link(root, version)
+            _prune(root, version)
+        logger.info('Опубликована версия %s: файлов перерисовано %s', version, len(files))
+        return state
+
+
+def _run_scheduled():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    with _app.app_context():
+        try:
+            publish()
+        except Exception:
+            logger.exception('Не удалось опубликовать статический снимок расписания')
+        finally:
+            db.session.remove()
+
+
+def request_publish(delay=None):
+    """Запланировать публикацию через delay (по умолчанию STATIC_PUBLISH_DEBOUNCE) секунд.
+
+    Правки, сделанные до срабатывания таймера, публикуются одним проходом.
+    Более срочный запрос (переход недели) переносит уже запланированную
+    публикацию на более ранний срок.
+    """
+    global _timer
+    if _app is None or not _options['root']:
+        return
+    delay = _options['debounce'] if delay is None else delay
+    due = time.monotonic() + delay
+    with _timer_lock:
+        if _timer is not None:
+            if _timer.due <= due:
+                return
+            _timer.cancel()
+        _timer = threading.Timer(delay, _run_scheduled)
+        _timer.due = due
+        _timer.daemon = True
+        _timer.start()
+
+
+@schedule_versions.add_commit_listener
+def _schedule_changed(changes, events):
+    if changes:
+        request_publish()
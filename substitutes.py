@@ -0,0 +1,53 @@
+# substitutes.py
+from models import db, TeacherSubject
+import occupancy
+import reference_cache
+
+# (etag справочников, {subject_id: битовая маска преподавателей})
+_qualifications = None
+
+
+def get_qualifications():
+    """Индекс квалификаций: предмет -> маска преподавателей, которые могут его вести.
+
+    Пересобирается при смене версии справочников.
+    """
+    global _qualifications
+    data = reference_cache.get_reference_data()
+    index = _qualifications
+    if index is None or index[0] != data.etag:
+        masks = {}
+        for teacher_id, subject_id in db.session.query(TeacherSubject.teacher_id, TeacherSubject.subject_id):
+            masks[subject_id] = masks.get(subject_id, 0) | (1 << teacher_id)
+        index = _qualifications = (data.etag, masks)
+    return index[1]
+
+
+def qualified_mask(subject_id):
+    return get_qualifications().get(subject_id, 0)
+
+
+def free_qualified(subject_id, week_occupancy, day, lessons, exclude=()):
+    """Маска квалифицированных преподавателей, свободных на всех уроках lessons"""
+    mask = qualified_mask(subject_id) & ~week_occupancy.busy('teacher', day, lessons)
+    for teacher_id in exclude:
+        mask &= ~(1 << teacher_id)
+    return mask
+
+
+def find_substitutes(subject_id, semester, week, day, lessons, exclude=()):
+    """Свободные преподаватели, которые могут вести предмет, — сначала наименее загруженные"""
+    week_occupancy = occupancy.get_week(semester, week)
+    names = reference_cache.get_reference_data().names['teachers']
+
+    candidates = [
+        {
+            'id': teacher_id,
+            'name': names[teacher_id],
+            'weekly_load': week_occupancy.load(teacher_id)
+        }
+        for teacher_id in occupancy.bits(free_qualified(subject_id, week_occupancy, day, lessons, exclude))
+        if teacher_id in names
+    ]
+    candidates.sort(key=lambda c: (c['weekly_load'], c['name']))
+    return candidates
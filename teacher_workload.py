@@ -0,0 +1,151 @@
+# teacher_workload.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, ScheduleEntry
+from initial_data import AVAILABLE_DAYS
+from http_cache import content_etag, bytes_response
+from schedule_payloads import DAY_INDEX
+from schedule_stats import HOURS_PER_LESSON
+import change_journal
+import ical_feeds
+import reference_cache
+import settings_service
+
+# Сколько разных наборов параметров держать в кэше ответов
+CACHE_MAX_ENTRIES = 32
+
+_options = {'max_weekly_hours': 36, 'rate_weekly_hours': 18, 'rolling_weeks': 4}
+_lock = threading.Lock()
+_cache = OrderedDict()  # (семестр, лимиты) -> (отметка актуальности, тело, ETag)
+
+
+def init_teacher_workload(app):
+    _options['max_weekly_hours'] = app.config.get('TEACHER_MAX_WEEKLY_HOURS', 36)
+    _options['rate_weekly_hours'] = app.config.get('TEACHER_RATE_WEEKLY_HOURS', 18)
+    _options['rolling_weeks'] = app.config.get('TEACHER_LOAD_ROLLING_WEEKS', 4)
+
+
+def default_limits():
+    return dict(_options)
+
+
+def load_matrix(semester):
+    """Матрица занятий преподаватели × недели × дни одним GROUP BY.
+
+    Возвращает (id преподавателей по возрастанию, матрица int32), индекс
+    [t, i, d] — неделя i + 1, день AVAILABLE_DAYS[d]; пустые ячейки нулевые.
+    """
+    teacher_ids = np.array(sorted(reference_cache.get_reference_data().names['teachers']), dtype=np.int64)
+    rows = db.session.query(
+        ScheduleEntry.teacher_id, ScheduleEntry.week_number, ScheduleEntry.day, func.count(ScheduleEntry.id)
+    ).filter(
+        ScheduleEntry.semester == semester,
+        ScheduleEntry.week_number >= 1,
+        ScheduleEntry.day.in_(AVAILABLE_DAYS)
+    ).group_by(ScheduleEntry.teacher_id, ScheduleEntry.week_number, ScheduleEntry.day).all()
+    rows = np.array(
+        [(teacher_id, week, DAY_INDEX[day], lessons) for teacher_id, week, day, lessons in rows if teacher_id is not None],
+        dtype=np.int64
+    ).reshape(-1, 4)
+
+    weeks = int(rows[:, 1].max()) if len(rows) else 0
+    matrix = np.zeros((len(teacher_ids), weeks, len(AVAILABLE_DAYS)), dtype=np.int32)
+    if len(rows) and len(teacher_ids):
+        positions = np.searchsorted(teacher_ids, rows[:, 0])
+        # Записи удаленных преподавателей не попадают ни в одну строку
+        known = teacher_ids[np.minimum(positions, len(teacher_ids) - 1)] == rows[:, 0]
+        matrix[positions[known], rows[known, 1] - 1, rows[known, 2]] = rows[known, 3]
+    return teacher_ids, matrix
+
+
+def rolling_mean(hours, window):
+    """Скользящее среднее по неделям через накопленные суммы; первые недели — по неполному окну"""
+    if not hours.shape[1]:
+        return np.zeros(hours.shape, dtype=np.float64)
+    padded = np.pad(np.cumsum(hours, axis=1, dtype=np.int64), ((0, 0), (1, 0)))
+    end = np.arange(1, hours.shape[1] + 1)
+    start = np.maximum(end - window, 0)
+    return (padded[:, end] - padded[:, start]) / (end - start)
+
+
+def month_columns(semester, weeks):
+    """Месяцы семестра и матрица (неделя, день) × месяцы для свертки.
+
+    Месяц берется по дате самого дня, поэтому неделя на стыке месяцев
+    делится между ними.
+    """
+    start = ical_feeds.semester_start(semester)
+    keys = [
+        f'{ical_feeds.lesson_date(start, week, day):%Y-%m}'
+        for week in range(1, weeks + 1) for day in AVAILABLE_DAYS
+    ]
+    months, inverse = np.unique(np.array(keys, dtype=str), return_inverse=True)
+    return months.tolist(), np.eye(len(months), dtype=np.int32)[inverse].reshape(len(keys), len(months))
+
+
+def analyze(semester, limits):
+    """Аналитика нагрузки семестра в столбцовом виде (удобно для графиков)"""
+    teacher_ids, lessons = load_matrix(semester)
+    daily_hours = lessons * HOURS_PER_LESSON
+    hours = daily_hours.sum(axis=2)
+    weeks = hours.shape[1]
+    names = reference_cache.get_reference_data().names['teachers']
+
+    totals = hours.sum(axis=1)
+    active_weeks = (hours > 0).sum(axis=1)
+    peaks = hours.max(axis=1) if weeks else np.zeros(len(teacher_ids), dtype=np.int32)
+    peak_weeks = hours.argmax(axis=1) + 1 if weeks else np.zeros(len(teacher_ids), dtype=np.int64)
+    rolling = rolling_mean(hours, limits['rolling_weeks'])
+    months, to_month = month_columns(semester, weeks)
+
+    over = hours > limits['max_weekly_hours']
+    # Устойчивая перегрузка — среднее по полному окну выше ставки
+    full_windows = rolling[:, min(limits['rolling_weeks'], weeks) - 1:] if weeks else rolling
+    sustained = (full_windows > limits['rate_weekly_hours']).any(axis=1)
+
+    return {
+        'semester': semester,
+        'current_week': settings_service.get_current_week() if semester == settings_service.get_current_semester() else None,
+        'limits': limits,
+        'weeks': list(range(1, weeks + 1)),
+        'months': months,
+        'teacher_ids': teacher_ids.tolist(),
+        'teacher_names': [names.get(teacher_id) for teacher_id in teacher_ids.tolist()],
+        'hours': hours.tolist(),
+        'rolling': np.round(rolling, 1).tolist(),
+        'monthly_hours': (daily_hours.reshape(len(teacher_ids), -1) @ to_month).tolist(),
+        'total_hours': totals.tolist(),
+        'average_hours': np.round(totals / np.maximum(active_weeks, 1), 1).tolist(),
+        'peak_hours': peaks.tolist(),
+        'peak_week': np.where(totals > 0, peak_weeks, 0).tolist(),
+        'overloaded_weeks': [(np.flatnonzero(row) + 1).tolist() for row in over],
+        'sustained_overload': sustained.tolist()
+    }
+
+
+def workload_response(semester, limits):
+    """Готовый ответ из кэша; пересобирается после новых записей в журнале
+    изменений, правки справочников или настроек"""
+    key = (semester, tuple(sorted(limits.items())))
+    stamp = (
+        change_journal.journal_bounds()[1],
+        reference_cache.get_reference_data().etag,
+        settings_service.get_settings_version()
+    )
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is None or cached[0] != stamp:
+        body = reference_cache.dumps(analyze(semester, limits))
+        cached = (stamp, body, content_etag(body))
+        with _lock:
+            _cache[key] = cached
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+    return bytes_response(cached[1], cached[2], compress=True, private=True)
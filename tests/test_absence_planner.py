@@ -0,0 +1,93 @@
+# tests/test_absence_planner.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """Приложение на пустой временной базе (Config читает DATABASE_URL при импорте)"""
+    database = tmp_path_factory.mktemp('db') / 'schedule.db'
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def absence(app):
+    """Отсутствующий преподаватель с парой (уроки 1 и 2 в понедельник) и два
+    одинаково свободных преподавателя, которые могут ее заменить"""
+    from models import db, Teacher, Subject, Group, Room, TeacherSubject, ScheduleEntry
+    import reference_cache
+    import schedule_versions
+
+    with app.app_context():
+        subject = Subject(name='Тестовый предмет')
+        absent, first, second = (Teacher(name=name) for name in ('Отсутствующий', 'Замена А', 'Замена Б'))
+        db.session.add_all([subject, absent, first, second])
+        db.session.flush()
+        for teacher in (absent, first, second):
+            db.session.add(TeacherSubject(teacher_id=teacher.id, subject_id=subject.id))
+
+        group, room = Group.query.first(), Room.query.first()
+        for lesson in (1, 2):
+            entry = ScheduleEntry(
+                group_id=group.id, subject_id=subject.id, teacher_id=absent.id, room_id=room.id,
+                day='Понедельник', lesson_number=lesson, week_number=1, semester=1
+            )
+            db.session.add(entry)
+            schedule_versions.bump_entry(entry, 'add')
+        reference_cache.bump_version()
+        db.session.commit()
+
+        yield {'absent': absent.id, 'substitutes': {first.id, second.id}, 'subject': subject.id}
+
+        ScheduleEntry.query.filter_by(teacher_id=absent.id).delete()
+        schedule_versions.bump_week(1, 1)
+        TeacherSubject.query.filter_by(subject_id=subject.id).delete()
+        Teacher.query.filter(Teacher.id.in_([absent.id, first.id, second.id])).delete()
+        Subject.query.filter_by(id=subject.id).delete()
+        reference_cache.bump_version()
+        db.session.commit()
+
+
+def test_pair_gets_one_substitute(app, absence):
+    import absence_planner
+
+    with app.app_context():
+        result = absence_planner.plan(absence['absent'], 1, 1, 1)
+
+    assert result['unassigned'] == []
+    assert [item['lesson_number'] for item in result['assignments']] == [1, 2]
+    chosen = {item['teacher_id'] for item in result['assignments']}
+    assert len(chosen) == 1
+    assert chosen <= absence['substitutes']
+
+
+def test_substitute_must_be_free_for_whole_pair(app, absence):
+    from models import db, Group, Room, ScheduleEntry
+    import absence_planner
+    import schedule_versions
+
+    with app.app_context():
+        busy = min(absence['substitutes'])
+        entry = ScheduleEntry(
+            group_id=Group.query.order_by(Group.id.desc()).first().id, subject_id=absence['subject'],
+            teacher_id=busy, room_id=Room.query.order_by(Room.id.desc()).first().id,
+            day='Понедельник', lesson_number=2, week_number=1, semester=1
+        )
+        db.session.add(entry)
+        schedule_versions.bump_entry(entry, 'add')
+        db.session.commit()
+
+        result = absence_planner.plan(absence['absent'], 1, 1, 1)
+
+        ScheduleEntry.query.filter_by(id=entry.id).delete()
+        schedule_versions.bump_week(1, 1)
+        db.session.commit()
+
+    assert {item['teacher_id'] for item in result['assignments']} == absence['substitutes'] - {busy}
+    assert len(result['assignments']) == 2
@@ -0,0 +1,151 @@
+# timetables.py
+import threading
+from collections import OrderedDict
+
+from initial_data import AVAILABLE_DAYS
+from pairs import get_available_pairs_for_day, get_pair_number_by_lesson, get_pair_name, get_pair_time
+from http_cache import content_etag, bytes_response
+import change_journal
+import reference_cache
+import schedule_payloads
+import schedule_versions
+
+# Вид расписания -> (справочник, поле записи)
+KINDS = {
+    'group': ('groups', 'group_id'),
+    'teacher': ('teachers', 'teacher_id'),
+    'room': ('rooms', 'room_id')
+}
+
+
+class Grid:
+    """Готовая сетка одной группы / преподавателя / аудитории"""
+
+    def __init__(self, seq, ref_etag, entry_ids, body):
+        self.seq = seq              # последний seq журнала на момент сборки
+        self.ref_etag = ref_etag
+        self.entry_ids = entry_ids  # (тип расписания, id) занятий в сетке
+        self.body = body
+        self.etag = content_etag(body)
+
+
+class GridCache:
+    """LRU-кэш сеток по сущностям.
+
+    Сетка сбрасывается только если после ее сборки в журнале изменений
+    появились записи этой сущности (или занятий, которые в ней были), либо
+    массовое изменение ее недели. Журнал общий для всех воркеров, поэтому
+    правки из других процессов тоже учитываются.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._grids = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+            return grid
+
+    def put(self, key, grid):
+        with self._lock:
+            self._grids[key] = grid
+            self._grids.move_to_end(key)
+            while len(self._grids) > self.max_entries:
+                self._grids.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._grids.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._grids.clear()
+
+
+grid_cache = GridCache()
+
+
+def init_timetables(app):
+    grid_cache.max_entries = app.config.get('TIMETABLE_CACHE_MAX_ENTRIES', 2048)
+
+
+def _is_affected(grid, kind, entity_id, schedule_type, semester, week, latest):
+    """Менялась ли сущность после сборки сетки (по журналу изменений)"""
+    return change_journal.entity_changed(
+        grid.seq, latest, KINDS[kind][1], entity_id, grid.entry_ids, semester,
+        schedule_type, [week] if schedule_type == schedule_versions.CURRENT else None
+    )
+
+
+def build_grid(kind, entity_id, schedule_type, semester, week=None, week_parity='both'):
+    """Сетка день × пара на всю неделю: (байты JSON, id занятий)"""
+    field = KINDS[kind][1]
+    rows = schedule_payloads.query_rows(
+        schedule_type, semester, week, week_parity, None, **{field: entity_id}
+    )
+    lessons = schedule_payloads.encode_rows(schedule_type, rows)
+
+    by_slot = {}
+    for lesson in lessons:
+        by_slot.setdefault((lesson['day'], lesson['pair']), []).append(lesson)
+
+    days = []
+    for day in AVAILABLE_DAYS:
+        pair_numbers = set(get_available_pairs_for_day(day))
+        pair_numbers.update(pair for slot_day, pair in by_slot if slot_day == day)
+        days.append({
+            'day': day,
+            'pairs': [
+                {
+                    'pair': pair,
+                    'name': get_pair_name(pair),
+                    'time': get_pair_time(day, pair),
+                    'lessons': by_slot.get((day, pair), [])
+                }
+                for pair in sorted(pair_numbers)
+            ]
+        })
+
+    names = reference_cache.get_reference_data().names[KINDS[kind][0]]
+    payload = {
+        'entity': {'kind': kind, 'id': entity_id, 'name': names.get(entity_id)},
+        'type': schedule_type,
+        'semester': semester,
+        'week': week if schedule_type == schedule_versions.CURRENT else None,
+        'week_parity': week_parity,
+        'count': len(lessons),
+        'days': days
+    }
+    return reference_cache.dumps(payload), frozenset((schedule_type, row[0]) for row in rows)
+
+
+def get_grid(kind, entity_id, schedule_type, semester, week=None, week_parity='both'):
+    if schedule_type != schedule_versions.CURRENT:
+        week = None
+    key = (kind, entity_id, schedule_type, semester, week, week_parity)
+
+    latest = change_journal.journal_bounds()[1]
+    ref_etag = reference_cache.get_reference_data().etag
+
+    grid = grid_cache.get(key)
+    if grid is not None and grid.ref_etag == ref_etag:
+        if grid.seq == latest:
+            return grid
+        if not _is_affected(grid, kind, entity_id, schedule_type, semester, week, latest):
+            grid.seq = latest
+            return grid
+
+    # seq читаем до сборки: изменение, попавшее между ними, вызовет лишнюю пересборку, но не потеряется
+    body, entry_ids = build_grid(kind, entity_id, schedule_type, semester, week, week_parity)
+    grid = Grid(latest, ref_etag, entry_ids, body)
+    grid_cache.put(key, grid)
+    return grid
+
+
+def timetable_response(kind, entity_id, schedule_type, semester, week=None, week_parity='both'):
+    grid = get_grid(kind, entity_id, schedule_type, semester, week, week_parity)
+    return bytes_response(grid.body, grid.etag, compress=True)